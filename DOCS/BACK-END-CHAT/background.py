@@ -0,0 +1,43 @@
+"""
+Background Module - Lazily Started Worker Threads
+
+Several in-process caches keep a daemon thread (pollers, sweepers, the
+session flusher, refreshers). Threads started at import time run in the
+Gunicorn master and do not survive the fork into the workers, so each
+component starts its thread on first use instead. LazyWorker holds that
+start-once logic in one place.
+"""
+
+import threading
+
+
+class LazyWorker:
+    """
+    Daemon thread started by the first ensure_started() call in each process.
+
+    Args:
+        target: Thread body (usually an endless refresh loop)
+        name (str): Thread name
+        on_start: Optional callable run once, just before the thread starts
+            (e.g. attach a snapshot listener, register an atexit hook)
+    """
+
+    def __init__(self, target, name, on_start=None):
+        self._target = target
+        self.name = name
+        self._on_start = on_start
+        self._lock = threading.Lock()
+        self.started = False
+
+    def ensure_started(self):
+        """Start the thread if it is not running yet. True only for the call that started it."""
+        if self.started:
+            return False
+        with self._lock:
+            if self.started:
+                return False
+            self.started = True
+        if self._on_start:
+            self._on_start()
+        threading.Thread(target=self._target, name=self.name, daemon=True).start()
+        return True
@@ -0,0 +1,286 @@
+"""
+Ban Cache Module - Replicated Fingerprint Ban List with a Bloom Filter Front
+
+Keeps every active ban from the unauthenticated_bans collection in memory so
+the protection layer can tell whether a fingerprint is banned without a
+Firestore read:
+
+- a TTL map {fingerprint: ban expiry (epoch seconds)} fed by a query snapshot
+  listener on bans that had not expired when the listener attached
+- a Bloom filter over the map's keys; a negative answer ("not banned", the
+  common case) costs a few bit tests, and only positives touch the map
+
+If the listener is not streaming, positives are confirmed with a direct
+document read and a background poller re-reads active bans (same fallback
+pattern as circuit_breaker_cache.py). Bloom filters cannot delete, so the
+filter is rebuilt from the map whenever bans expire or are removed.
+
+Ban document shape: the bans are written by security_monitor, which is
+deployed separately and is not in this tree, so the shape below is an
+assumption, not a checked contract. The expiry field and where the fingerprint
+lives are constructor arguments (BAN_EXPIRY_FIELD / BAN_FINGERPRINT_FIELD in
+main.py):
+    document ID = fingerprint (fingerprint_field=None), or a fingerprint field
+    {"ban_expires": <timestamp or epoch seconds>, ...}
+
+Scope: security_monitor's own checks (check_dos_pattern_unauth,
+log_unauthenticated_breach) still query bans for every fingerprint, and they
+cannot be told to skip that from here. This cache only answers banned
+fingerprints locally, ahead of those calls, so it saves reads when banned
+clients keep retrying, not for the not-banned majority. That is why main.py
+leaves it off by default.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPIRY_FIELD = "ban_expires"
+
+# Seconds between expiry sweeps / fallback polls, and between listener re-attach attempts
+SWEEP_INTERVAL_SECONDS = 30
+LISTENER_RETRY_SECONDS = 60
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings (k indexes by double hashing one SHA-256 digest).
+
+    Args:
+        capacity (int): Expected number of items
+        error_rate (float): Target false-positive probability at capacity
+    """
+
+    def __init__(self, capacity=10000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _indexes(self, item):
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for index in self._indexes(item):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+    def expected_false_positive_rate(self):
+        """Theoretical false-positive rate at the current fill."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class BanListCache:
+    """
+    In-memory copy of active fingerprint bans.
+
+    Args:
+        collection: Firestore CollectionReference of unauthenticated_bans
+        capacity (int): Expected number of simultaneous bans (sizes the Bloom filter)
+        error_rate (float): Bloom filter false-positive target
+        expiry_field (str): Field holding the ban expiry
+        fingerprint_field (str): Field holding the fingerprint (None = the document ID)
+    """
+
+    def __init__(self, collection, capacity=10000, error_rate=0.01, expiry_field=DEFAULT_EXPIRY_FIELD,
+                 fingerprint_field=None):
+        self._collection = collection
+        self._expiry_field = expiry_field
+        self._fingerprint_field = fingerprint_field
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._bans = {}
+        self._filter = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+
+        self._watch = None
+        self._worker = LazyWorker(self._sweep_loop, "ban-cache-sweeper", on_start=self._attach_listener)
+        self._last_listener_attempt = 0.0
+
+        self._lookups = 0
+        self._filter_hits = 0
+        self._confirmed = 0
+        self._false_positives = 0
+        self._confirm_reads = 0
+        self._rebuilds = 0
+
+    # -------------------------------------------------------------------------
+    # Lifecycle (listener and sweeper start on first use, see background.py)
+    # -------------------------------------------------------------------------
+    def _active_bans_query(self):
+        return self._collection.where(self._expiry_field, ">", datetime.now(timezone.utc))
+
+    def _fingerprint_of(self, doc):
+        if self._fingerprint_field:
+            return (doc.to_dict() or {}).get(self._fingerprint_field)
+        return doc.id
+
+    def _attach_listener(self):
+        self._last_listener_attempt = time.monotonic()
+        try:
+            self._watch = self._active_bans_query().on_snapshot(self._on_snapshot)
+            logger.info("✓ Ban list snapshot listener attached")
+        except Exception as e:
+            self._watch = None
+            logger.error(f"Failed to attach ban list listener (confirming reads active): {e}")
+
+    def _listener_active(self):
+        return self._watch is not None and getattr(self._watch, "is_active", False)
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        removed = False
+        with self._lock:
+            for change in changes:
+                fingerprint = self._fingerprint_of(change.document)
+                if not fingerprint:
+                    continue
+                if change.type.name == "REMOVED":
+                    removed |= self._bans.pop(fingerprint, None) is not None
+                else:
+                    self._set_ban(fingerprint, change.document.to_dict())
+        if removed:
+            self._rebuild()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL_SECONDS)
+            try:
+                if not self._listener_active():
+                    self.refresh()
+                    if time.monotonic() - self._last_listener_attempt >= LISTENER_RETRY_SECONDS:
+                        self._attach_listener()
+                self._expire()
+            except Exception as e:
+                logger.error(f"Ban list sweep failed: {e}")
+
+    # -------------------------------------------------------------------------
+    # State
+    # -------------------------------------------------------------------------
+    def _set_ban(self, fingerprint, data):
+        # Called with the lock held
+        expires = _to_epoch((data or {}).get(self._expiry_field))
+        if expires is None or expires <= time.time():
+            return
+        if fingerprint not in self._bans:
+            self._filter.add(fingerprint)
+        self._bans[fingerprint] = expires
+
+    def _rebuild(self):
+        with self._lock:
+            bloom = BloomFilter(max(self._capacity, len(self._bans)), self._error_rate)
+            for fingerprint in self._bans:
+                bloom.add(fingerprint)
+            self._filter = bloom
+            self._rebuilds += 1
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [fingerprint for fingerprint, expires in self._bans.items() if expires <= now]
+            for fingerprint in expired:
+                del self._bans[fingerprint]
+        if expired:
+            self._rebuild()
+
+    def refresh(self):
+        """Re-read all active bans directly (polling fallback)."""
+        bans = {}
+        for doc in self._active_bans_query().stream():
+            fingerprint = self._fingerprint_of(doc)
+            expires = _to_epoch(doc.to_dict().get(self._expiry_field))
+            if fingerprint and expires:
+                bans[fingerprint] = expires
+        with self._lock:
+            self._bans = bans
+        self._rebuild()
+
+    def add_local(self, fingerprint, expires_at):
+        """Record a ban this instance just issued, ahead of the listener."""
+        with self._lock:
+            self._set_ban(fingerprint, {self._expiry_field: expires_at})
+
+    def _read_ban(self, fingerprint):
+        if self._fingerprint_field:
+            docs = list(self._collection.where(self._fingerprint_field, "==", fingerprint).limit(1).stream())
+            return docs[0] if docs else None
+        return self._collection.document(fingerprint).get()
+
+    def is_banned(self, fingerprint):
+        """True if the fingerprint has an active ban. Fails open (False) on errors."""
+        if not fingerprint:
+            return False
+        self._worker.ensure_started()
+        self._lookups += 1
+        if fingerprint not in self._filter:
+            return False
+        self._filter_hits += 1
+
+        expires = self._bans.get(fingerprint)
+        if expires is None and not self._listener_active():
+            # Map may be stale without the listener - confirm with one document read
+            try:
+                self._confirm_reads += 1
+                snapshot = self._read_ban(fingerprint)
+                if snapshot is not None and snapshot.exists:
+                    with self._lock:
+                        self._set_ban(fingerprint, snapshot.to_dict())
+                    expires = self._bans.get(fingerprint)
+            except Exception as e:
+                logger.error(f"Failed to confirm ban for {fingerprint[:8]}...: {e}")
+
+        if expires is not None and expires > time.time():
+            self._confirmed += 1
+            return True
+        self._false_positives += 1
+        return False
+
+    def stats(self):
+        """Hit rate, false positives and memory (for /system_status)."""
+        with self._lock:
+            active = len(self._bans)
+            bloom = self._filter
+        negatives = self._lookups - self._filter_hits
+        return {
+            "listener_active": self._listener_active(),
+            "active_bans": active,
+            "lookups": self._lookups,
+            "local_hit_rate": round((self._lookups - self._confirm_reads) / self._lookups, 4) if self._lookups else None,
+            "filter_hits": self._filter_hits,
+            "confirmed_bans": self._confirmed,
+            "false_positives": self._false_positives,
+            "false_positive_rate": round(self._false_positives / (negatives + self._false_positives), 6) if self._lookups else None,
+            "expected_false_positive_rate": round(bloom.expected_false_positive_rate(), 6),
+            "confirm_reads": self._confirm_reads,
+            "filter_rebuilds": self._rebuilds,
+            "filter_memory_bytes": bloom.memory_bytes,
+            "map_memory_bytes_estimate": active * 150,
+        }
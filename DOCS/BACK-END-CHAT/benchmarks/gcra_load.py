@@ -0,0 +1,102 @@
+"""
+Benchmark: GCRA Limiter Under Load on One Key
+
+Drives GcraLimiter.allow() for a single key from many threads at a fixed
+offered rate, once per rate given on the command line. For each rate it
+reports:
+
+- decisions/s achieved and allow() p50/p99 latency
+- allowed vs the exact limit for the elapsed time (limit + rate * elapsed / period)
+- write conflicts (re-read and retry) and decisions that failed open after
+  max_retries conflicts
+
+The TAT document takes one conditional write per allowed request, so the
+conflict and fail-open columns show where a single key stops being exact
+(Firestore sustains roughly one write per second per document).
+
+Run it against a scratch project (the emulator does not enforce per-document
+write limits, so it only checks correctness there), never production:
+
+    GOOGLE_CLOUD_PROJECT=my-scratch-project python benchmarks/gcra_load.py --limit 200 --rates 1 3.3 10 --seconds 30
+
+Documents go to "bench_rate_limit_gcra", which is deleted at the end.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import firestore  # noqa: E402
+
+from gcra_limiter import GcraLimiter  # noqa: E402
+
+COLLECTION = "bench_rate_limit_gcra"
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def drive(limiter, key, rate, seconds, threads):
+    """Call allow(key) at `rate` decisions/s for `seconds`; returns (latencies ms, allowed count)."""
+    latencies, allowed = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    interval = threads / rate
+
+    def caller():
+        next_at = time.monotonic()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            result = limiter.allow(key)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+                allowed[0] += result
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    workers = [threading.Thread(target=caller) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, allowed[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=200, help="Requests allowed per period")
+    parser.add_argument("--period", type=float, default=60.0)
+    parser.add_argument("--rates", type=float, nargs="+", default=[1.0, 3.3, 10.0], help="Offered decisions/s per run")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of each run")
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    db = firestore.Client()
+    print(f"{'rate/s':>7} {'done/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'allowed':>8} {'exact':>6} {'conflicts':>9} {'failopen':>8}")
+    try:
+        for run, rate in enumerate(args.rates):
+            limiter = GcraLimiter(db, COLLECTION, args.limit, period=args.period)
+            started = time.monotonic()
+            latencies, allowed = drive(limiter, f"hot_{run}", rate, args.seconds, args.threads)
+            elapsed = time.monotonic() - started
+            exact = min(len(latencies), int(args.limit + args.limit * elapsed / args.period))
+            stats = limiter.stats()
+            print(
+                f"{rate:>7.1f} {len(latencies) / elapsed:>7.1f} {statistics.median(latencies) if latencies else 0:>8.1f} "
+                f"{percentile(latencies, 0.99):>8.1f} {allowed:>8} {exact:>6} {stats['write_conflicts']:>9} "
+                f"{stats['failed_open_after_conflicts']:>8}"
+            )
+    finally:
+        for ref in db.collection(COLLECTION).list_documents():
+            ref.delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: Info Mode Section per Turn
+
+Times building the info mode section of the chat prompt for a session
+exploring 5 workshops of main.py's built-in registry:
+
+- previous: the former per-turn text, looked up in the registry and with
+            prices formatted from cents on every turn
+- snippets: build_prompt's join of the per-catalog snippets from
+            knowledge_base.render_info_snippets()
+
+once with every workshop mentioned for the first time (pricing included) and
+once with all of them already mentioned. Both must produce the same text.
+Reports microseconds per section, best of --repeat.
+
+No network or Firestore needed:
+
+    python benchmarks/info_mode_snippets.py --number 50000
+"""
+
+import argparse
+import ast
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import render_info_snippets  # noqa: E402
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def main_constants():
+    """Built-in WORKSHOP_REGISTRY (the non-Portal branch) and INFO_MODE_HEADER from main.py, via ast."""
+    with open(MAIN_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in tree.body:
+        name = getattr(node.targets[0], "id", None) if isinstance(node, ast.Assign) else None
+        if name == "WORKSHOP_REGISTRY":
+            found[name] = ast.literal_eval(node.value.orelse)
+        elif name == "INFO_MODE_HEADER":
+            found[name] = ast.literal_eval(node.value)
+    return found["WORKSHOP_REGISTRY"], found["INFO_MODE_HEADER"]
+
+
+def previous_section(registry, info_mode_workshops, triggered_hardcodes):
+    # The info mode text as build_prompt assembled it before the snippets
+    section = "\n---\n**📚 WORKSHOP INFORMATION (User is Exploring):**\n"
+    section += "The user has inquired about the following workshops. Integrate these details naturally when relevant:\n\n"
+    for workshop_id in info_mode_workshops:
+        if workshop_id in registry:
+            workshop_data = registry[workshop_id]
+            if workshop_id not in triggered_hardcodes:
+                section += f"**{workshop_data.get('description', workshop_id)}:**\n"
+                if workshop_data.get('per_person'):
+                    corporate_price = workshop_data.get('corporate', 0) / 100
+                    community_price = workshop_data.get('community', 0) / 100
+                    section += f"- Pricing: <price>${corporate_price:.2f}/person (Corporate)</price>, <price>${community_price:.2f}/person (Community)</price>\n"
+                else:
+                    default_price = workshop_data.get('default', 0) / 100
+                    section += f"- Pricing: <price>${default_price:.2f} flat rate</price>\n"
+                section += "\n"
+                triggered_hardcodes.add(workshop_id)
+            else:
+                section += f"**{workshop_data.get('description', workshop_id)}:** (Details provided earlier in conversation)\n"
+    return section
+
+
+def snippet_section(snippets, header, info_mode_workshops, triggered_hardcodes):
+    # build_prompt's current assembly
+    info_parts = [header]
+    newly_triggered = set()
+    for workshop_id in info_mode_workshops:
+        snippet = snippets.get(workshop_id)
+        if snippet is None:
+            continue
+        if workshop_id not in triggered_hardcodes and workshop_id not in newly_triggered:
+            info_parts.append(snippet[0])
+            newly_triggered.add(workshop_id)
+        else:
+            info_parts.append(snippet[1])
+    triggered_hardcodes.update(newly_triggered)
+    return "".join(info_parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=50000, help="Sections per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    registry, header = main_constants()
+    snippets = render_info_snippets(registry)
+    workshops = list(registry)[:5]
+    mentioned = frozenset(workshops)
+
+    cases = [
+        ("5 first mentions", set),
+        ("5 already mentioned", lambda: set(mentioned)),
+    ]
+    print(f"{len(registry)} workshops in the registry, info mode on {len(workshops)}, "
+          f"best of {args.repeat} x {args.number}")
+    print(f"{'case':<21} {'previous us':>11} {'snippets us':>11}")
+    for name, triggered in cases:
+        assert previous_section(registry, workshops, triggered()) == snippet_section(snippets, header, workshops, triggered()), name
+        timings = []
+        for fn in (lambda: previous_section(registry, workshops, triggered()),
+                   lambda: snippet_section(snippets, header, workshops, triggered())):
+            timings.append(min(timeit.repeat(fn, number=args.number, repeat=args.repeat)) / args.number * 1e6)
+        print(f"{name:<21} {timings[0]:>11.2f} {timings[1]:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
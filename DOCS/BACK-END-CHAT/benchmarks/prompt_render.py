@@ -0,0 +1,128 @@
+"""
+Benchmark: Chat Prompt Assembly per Turn
+
+Times building the chat prompt from main.py's real sections (persona,
+boundaries, guiding principle, concierge text, the knowledge base rendered
+from the built-in workshop registry, and the safety/format tail):
+
+- previous: the former per-turn assembly, "\\n".join over every static
+            section, the dynamic sections and the tail f-string
+- render:   ChatPromptTemplate.render() (static prefix joined once)
+- tail:     ChatPromptTemplate.render_tail(), the per-turn part sent next to
+            the cached system prompt
+
+for a turn without session context and for a 5-workshop info mode turn with
+booking context and history. Reports microseconds per prompt (best of
+--repeat) and the peak traced allocation of one render. previous and render
+must produce identical prompts.
+
+No network or Firestore needed:
+
+    python benchmarks/prompt_render.py --number 20000
+"""
+
+import argparse
+import ast
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import render_info_snippets, render_knowledge_base  # noqa: E402
+from prompt_template import ChatPromptTemplate  # noqa: E402
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+CONSTANTS = (
+    "CHARACTER_PRINCIPLES", "KNOWLEDGE_BASE_SECTION_TEMPLATE", "CHAT_PROMPT_TAIL", "INFO_MODE_HEADER",
+    "MOON_TIDE_KNOWLEDGE_BASE_INTRO", "WORKSHOP_PROSE", "MOON_TIDE_KNOWLEDGE_BASE_FOOTER", "WORKSHOP_REGISTRY",
+)
+
+
+def main_constants():
+    """Literal constants from main.py (main itself needs Flask and GCP to import)."""
+    with open(MAIN_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in tree.body:
+        name = getattr(node.targets[0], "id", None) if isinstance(node, ast.Assign) else None
+        if name == "WORKSHOP_REGISTRY":
+            found[name] = ast.literal_eval(node.value.orelse)  # The built-in (non-Portal) registry
+        elif name in CONSTANTS:
+            found[name] = ast.literal_eval(node.value)
+    return found
+
+
+def tail_fstring(tail_template):
+    """The tail as the compiled f-string build_prompt used to evaluate on every turn."""
+    return eval("lambda conversation_history_context, user_message: f" + repr(tail_template))
+
+
+def previous_render(static_parts, tail, dynamic_sections, conversation_history_context, user_message):
+    # The per-turn assembly build_prompt used before ChatPromptTemplate
+    parts = [*static_parts, *dynamic_sections, tail(conversation_history_context, user_message)]
+    return "\n".join(part for part in parts if part.strip())
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Prompts per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    c = main_constants()
+    registry = c["WORKSHOP_REGISTRY"]
+    knowledge_base = render_knowledge_base(
+        registry, c["MOON_TIDE_KNOWLEDGE_BASE_INTRO"], c["WORKSHOP_PROSE"], c["MOON_TIDE_KNOWLEDGE_BASE_FOOTER"]
+    )
+    principles = c["CHARACTER_PRINCIPLES"]
+    static_parts = [
+        principles["core_persona"],
+        principles["system_boundaries"],
+        principles["on_user_input"],
+        principles["intelligent_concierge"],
+        c["KNOWLEDGE_BASE_SECTION_TEMPLATE"].format(knowledge_base=knowledge_base),
+    ]
+    template = ChatPromptTemplate(static_parts, c["CHAT_PROMPT_TAIL"])
+    tail = tail_fstring(c["CHAT_PROMPT_TAIL"])
+
+    snippets = render_info_snippets(registry)
+    info_section = c["INFO_MODE_HEADER"] + "".join(snippets[workshop_id][0] for workshop_id in list(registry)[:5])
+    booking_section = (
+        "\n---\n**🧠 BOOKING CONTEXT (What I Already Know):**\n"
+        "✓ Workshop Selected: <special>Cedar Woven Bracelet</special>\n"
+        "✓ Organization Type: <special>Corporate</special>\n"
+    )
+    history = "user: What workshops do you offer for a team of 20?\nassistant: We offer cedar weaving..."
+    scenarios = [
+        ("no session", ["", ""], "", "Hello!"),
+        ("5-workshop info mode", [info_section, booking_section], history, "What does the {cedar} bracelet cost?"),
+    ]
+
+    print(f"static prefix {len(template.static_prefix)} chars, {len(registry)} workshops, "
+          f"best of {args.repeat} x {args.number} prompts")
+    print(f"{'scenario':<22} {'path':<9} {'us/prompt':>10} {'peak KiB':>9} {'chars':>7}")
+    for name, dynamic_sections, history_context, message in scenarios:
+        paths = [
+            ("previous", lambda: previous_render(static_parts, tail, dynamic_sections, history_context, message)),
+            ("render", lambda: template.render(dynamic_sections, history_context, message)),
+            ("tail", lambda: template.render_tail(dynamic_sections, history_context, message)),
+        ]
+        assert paths[0][1]() == paths[1][1](), name
+        for path, fn in paths:
+            seconds = min(timeit.repeat(fn, number=args.number, repeat=args.repeat)) / args.number
+            print(f"{name:<22} {path:<9} {seconds * 1e6:>10.2f} {peak_kib(fn):>9.1f} {len(fn()):>7}")
+
+
+if __name__ == "__main__":
+    main()
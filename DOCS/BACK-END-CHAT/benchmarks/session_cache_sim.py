@@ -0,0 +1,148 @@
+"""
+Benchmark: Write-Behind Session Cache on Simulated Chat Traffic
+
+Replays chat conversations through several WriteBehindSessionCache instances
+(one per simulated Cloud Run instance) sharing one MemorySessionStore, on a
+simulated clock, and reports per configuration:
+
+- hit ratio of get_session
+- updates queued vs store writes (and writes saved by coalescing)
+- write conflicts (another instance wrote the session first)
+- lost turns: conversation turns missing from the stored history at the end,
+  i.e. a turn built on a stale cached copy whose history replaced a newer one
+
+Traffic: --sessions conversations starting uniformly over --minutes; each has
+3-15 turns with log-normal gaps (median --gap seconds: reading the reply and
+typing). 10% of turns are story commands, which read the session twice.
+Routing is either sticky (Cloud Run session affinity) or random.
+
+No network or Firestore needed:
+
+    python benchmarks/session_cache_sim.py --sessions 300 --instances 3
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_cache  # noqa: E402
+from session_cache import WriteBehindSessionCache  # noqa: E402
+from session_store import MemorySessionStore  # noqa: E402
+
+
+class SimClock:
+    """Stands in for the time module inside session_cache (monotonic only)."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def conversations(args, rng):
+    """Yields (time, session_id, turn number, is_story) for every turn, in time order."""
+    events = []
+    for n in range(args.sessions):
+        at = rng.uniform(0, args.minutes * 60)
+        for turn in range(rng.randint(3, 15)):
+            events.append((at, f"session-{n}", turn, rng.random() < 0.1))
+            at += rng.lognormvariate(0, 0.8) * args.gap
+    return sorted(events)
+
+
+def simulate(args, ttl, flush_interval, flush_on_response, sticky, clock):
+    rng = random.Random(args.seed)
+    store = MemorySessionStore()
+    caches = [WriteBehindSessionCache(store, ttl_seconds=ttl, flush_interval=flush_interval) for _ in range(args.instances)]
+    for cache in caches:
+        cache._worker.started = True  # Flushes are driven by the simulated clock below
+    next_flush = [(flush_interval, i) for i in range(args.instances)]
+    heapq.heapify(next_flush)
+
+    def run_flushes(until):
+        while next_flush and next_flush[0][0] <= until:
+            at, i = heapq.heappop(next_flush)
+            clock.now = at
+            caches[i].flush()
+            heapq.heappush(next_flush, (at + flush_interval, i))
+
+    turns = {}
+    for at, session_id, turn, is_story in conversations(args, rng):
+        run_flushes(at)
+        clock.now = at
+        instance = int(session_id.split("-")[1]) % args.instances if sticky else rng.randrange(args.instances)
+        cache = caches[instance]
+
+        session = cache.get_session(session_id) or {"state": {"conversation_history": []}, "request_count": 0}
+        if is_story:
+            cache.get_session(session_id)
+        session["state"]["conversation_history"].append(f"turn {turn}")
+        session["request_count"] += 1
+        cache.update_session(session_id, session, session["request_count"])
+        turns[session_id] = turns.get(session_id, 0) + 1
+        if flush_on_response:
+            cache.flush()
+
+    clock.now += 3600
+    for cache in caches:
+        cache.flush()
+        cache.flush()  # Second pass writes sessions rebased after a conflict
+
+    lost = 0
+    for session_id, count in turns.items():
+        document, _ = store.read(session_id)
+        stored = session_cache.from_document(document)["state"]["conversation_history"] if document else []
+        lost += count - len(stored)
+
+    stats = [cache.stats() for cache in caches]
+    hits, misses = sum(s["hits"] for s in stats), sum(s["misses"] for s in stats)
+    updates, writes = sum(s["updates"] for s in stats), sum(s["writes"] for s in stats)
+    return {
+        "hit_ratio": hits / (hits + misses),
+        "updates": updates,
+        "writes": writes,
+        "saved": updates - writes,
+        "conflicts": sum(s["conflicts"] for s in stats),
+        "lost": lost,
+        "turns": sum(turns.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--gap", type=float, default=20.0, help="Median seconds between a session's turns")
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    clock = SimClock()
+    session_cache.time = clock  # Only monotonic() is used on these paths
+
+    configs = [
+        ("ttl 2s, flush per response, random", 2, 1, True, False),
+        ("ttl 300s, flush per response, sticky", 300, 1, True, True),
+        ("ttl 300s, flush every 15s, sticky", 300, 15, False, True),
+        ("ttl 300s, flush every 30s, sticky", 300, 30, False, True),
+        ("ttl 300s, flush every 15s, random", 300, 15, False, False),
+    ]
+    print(f"{args.sessions} sessions over {args.minutes:.0f} min, median gap {args.gap:.0f}s, {args.instances} instances")
+    print(f"{'configuration':<38} {'hit %':>6} {'updates':>8} {'writes':>7} {'saved':>6} {'conflicts':>9} {'lost':>5}")
+    for name, ttl, flush_interval, flush_on_response, sticky in configs:
+        result = simulate(args, ttl, flush_interval, flush_on_response, sticky, clock)
+        print(
+            f"{name:<38} {result['hit_ratio'] * 100:>6.1f} {result['updates']:>8} {result['writes']:>7} "
+            f"{result['saved']:>6} {result['conflicts']:>9} {result['lost']:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: Fixed vs Adaptive Shard Counts Under Contention
+
+Drives one hot counter (like GLOBAL) with a fixed write rate from many threads
+while a reader polls its total, once with a fixed shard count and once with
+adaptive shard counts. For each run it reports:
+
+- achieved writes/s, write p50/p99 latency and contention errors
+  (Aborted / DeadlineExceeded / ResourceExhausted)
+- shard count at the end of the phase and documents fetched per read
+
+Then it runs a quiet phase at a low rate so the adaptive counter can shrink.
+
+Run it against a scratch project (the emulator does not enforce per-document
+write limits, so it only checks correctness there), never production:
+
+    GOOGLE_CLOUD_PROJECT=my-scratch-project python benchmarks/shard_contention.py --rate 40 --seconds 60
+
+Documents go to "bench_contention_shards" and its "_meta" collection, which are
+deleted at the end.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import firestore  # noqa: E402
+
+from shard_counter import CONTENTION_ERRORS, ShardedCounter, current_minute_window  # noqa: E402
+
+COLLECTION = "bench_contention_shards"
+KEY = "GLOBAL"
+TAGS = {"endpoint": KEY}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def drive(counter, rate, seconds, threads):
+    """Write at `rate` writes/s for `seconds` while polling the total every 0.5 s."""
+    latencies, errors, written = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    interval = threads / rate
+
+    def writer():
+        next_at = time.monotonic()
+        while time.monotonic() < deadline:
+            _, window = current_minute_window()
+            started = time.perf_counter()
+            try:
+                counter.increment(KEY, TAGS, window)
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    written[0] += 1
+            except CONTENTION_ERRORS:
+                with lock:
+                    errors[0] += 1
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    while time.monotonic() < deadline:
+        _, window = current_minute_window()
+        counter.read(KEY, TAGS, window)
+        time.sleep(0.5)
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0], written[0]
+
+
+def run(db, name, adaptive, args):
+    counter = ShardedCounter(
+        db, COLLECTION, args.start_shards, adaptive=adaptive, max_shards=args.max_shards,
+        writes_per_shard=args.writes_per_shard, resize_interval=5.0, meta_ttl=1.0
+    )
+    for phase, rate in (("hot", args.rate), ("quiet", max(1.0, args.rate / 20))):
+        started = time.monotonic()
+        latencies, errors, written = drive(counter, rate, args.seconds, args.threads)
+        elapsed = time.monotonic() - started
+        _, window = current_minute_window()
+        print(
+            f"{name:<9} {phase:<6} {written / elapsed:>8.1f} {statistics.median(latencies) if latencies else 0:>8.1f} "
+            f"{percentile(latencies, 0.99):>8.1f} {errors:>7} {counter.shard_count(KEY):>7} "
+            f"{len(counter.shard_refs(KEY, window)):>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=40.0, help="Writes/s in the hot phase")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of each phase")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--start-shards", type=int, default=10)
+    parser.add_argument("--max-shards", type=int, default=50)
+    parser.add_argument("--writes-per-shard", type=float, default=1.0)
+    args = parser.parse_args()
+
+    db = firestore.Client()
+    print(f"{'counter':<9} {'phase':<6} {'writes/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'shards':>7} {'docs/read':>9}")
+    try:
+        run(db, "fixed", False, args)
+        run(db, "adaptive", True, args)
+    finally:
+        for collection in (COLLECTION, f"{COLLECTION}_meta"):
+            for ref in db.collection(collection).list_documents():
+                ref.delete()
+
+
+if __name__ == "__main__":
+    main()
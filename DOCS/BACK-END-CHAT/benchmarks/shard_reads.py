@@ -0,0 +1,100 @@
+"""
+Benchmark: Sharded Counter Read Paths
+
+Compares the three ways of reading one rate limit counter:
+
+- query:     the original where(endpoint ==).where(minute_window ==).stream()
+- get_all:   ShardedCounter read_mode="get_all" (the N known shard refs in one RPC)
+- aggregate: ShardedCounter read_mode="aggregate" (server-side sum("count"))
+
+For each path it reports p50/p99 latency and the documents each read touches
+(query: documents streamed; get_all: refs requested, existing or not;
+aggregate: one aggregation result, billed per 1000 index entries).
+
+Run it against the Firestore emulator or a scratch project, never production:
+
+    FIRESTORE_EMULATOR_HOST=localhost:8080 GOOGLE_CLOUD_PROJECT=demo-bench \\
+        python benchmarks/shard_reads.py --shards 10 --reads 200
+
+The shard documents are written to a "bench_rate_limit_shards" collection,
+which is deleted at the end.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import firestore  # noqa: E402
+
+from shard_counter import ShardedCounter, current_minute_window  # noqa: E402
+
+COLLECTION = "bench_rate_limit_shards"
+KEY = "chat"
+TAGS = {"endpoint": KEY}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed(fn, reads):
+    samples = []
+    result = None
+    for _ in range(reads):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=150, help="Increments seeded into the window")
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    db = firestore.Client()
+    _, window = current_minute_window()
+    counter = ShardedCounter(db, COLLECTION, args.shards, read_mode="get_all")
+    aggregate_counter = ShardedCounter(db, COLLECTION, args.shards, read_mode="aggregate")
+
+    try:
+        for _ in range(args.requests):
+            counter.increment(KEY, TAGS, window)
+        existing = sum(1 for ref in counter.shard_refs(KEY, window) if ref.get().exists)
+
+        def query_read():
+            docs = list(
+                db.collection(COLLECTION).where("endpoint", "==", KEY).where("minute_window", "==", window).stream()
+            )
+            return sum(doc.to_dict().get("count", 0) for doc in docs), len(docs)
+
+        (query_total, streamed), query_ms = timed(query_read, args.reads)
+        get_all_total, get_all_ms = timed(lambda: counter.read(KEY, TAGS, window), args.reads)
+        aggregate_total, aggregate_ms = timed(lambda: aggregate_counter.read(KEY, TAGS, window), args.reads)
+
+        assert query_total == get_all_total == aggregate_total == args.requests, (
+            query_total, get_all_total, aggregate_total
+        )
+        print(f"{args.shards} shards ({existing} written), {args.requests} requests in window, {args.reads} reads per path")
+        print(f"{'path':<10} {'p50 ms':>8} {'p99 ms':>8}  documents per read")
+        rows = [
+            ("query", query_ms, f"{streamed} streamed (+ index lookup)"),
+            ("get_all", get_all_ms, f"{args.shards} requested"),
+            ("aggregate", aggregate_ms, "1 aggregation (1 read per 1000 index entries)"),
+        ]
+        for name, samples, documents in rows:
+            print(f"{name:<10} {statistics.median(samples):>8.2f} {percentile(samples, 0.99):>8.2f}  {documents}")
+    finally:
+        for ref in db.collection(COLLECTION).list_documents():
+            ref.delete()
+
+
+if __name__ == "__main__":
+    main()
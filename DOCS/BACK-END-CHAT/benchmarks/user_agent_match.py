@@ -0,0 +1,151 @@
+"""
+Benchmark: User-Agent Bot Signature Matching
+
+Times bot detection's User-Agent check over a realistic corpus (current
+desktop/mobile browsers, in-app webviews, Stripe, common HTTP clients and
+crawlers):
+
+- scan:       the previous per-signature `sig in user_agent` scan
+- regex:      user_agent_classifier's compiled alternation, no cache
+- classifier: UserAgentClassifier.classify() (regex + bounded LRU) on a
+              skewed stream where a few User-Agents carry most traffic
+- flood:      the classifier on a stream of unique random User-Agents
+              (every lookup misses and churns the cache)
+
+Every path must agree on the bot / not-bot verdict for the whole corpus.
+No network or Firestore needed:
+
+    python benchmarks/user_agent_match.py --lookups 200000
+"""
+
+import argparse
+import ast
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_agent_classifier import UserAgentClassifier, compile_signatures  # noqa: E402
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+CORPUS = [
+    # Browsers
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36 Edg/129.0.0.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 18_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPad; CPU OS 17_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.6668.81 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/26.0 Chrome/122.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/129.0.6668.69 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 348.0.0.0.0",
+    "Mozilla/5.0 (Linux; Android 13; SM-A536B Build/TP1A.220624.014; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/129.0.6668.70 Mobile Safari/537.36 [FB_IAB/FB4A;FBAV/484.0.0.58.74;]",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36 OPR/114.0.0.0",
+    # Allowed
+    "Stripe/1.0 (+https://stripe.com/docs/webhooks)",
+    # HTTP clients and crawlers
+    "curl/8.5.0",
+    "Wget/1.21.4",
+    "python-requests/2.32.3",
+    "Python-urllib/3.11",
+    "python-httpx/0.27.2",
+    "Go-http-client/1.1",
+    "Java/17.0.12",
+    "Apache-HttpClient/4.5.14 (Java/17.0.12)",
+    "okhttp/4.12.0",
+    "node-fetch/1.0 (+https://github.com/bitinn/node-fetch)",
+    "PostmanRuntime/7.42.0",
+    "insomnia/10.0.0",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)",
+    "Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)",
+    "Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/) monitoring",
+    "Scrapy/2.11.2 (+https://scrapy.org) scraper",
+]
+
+
+def main_constant(name):
+    """Reads a literal constant from main.py (main itself needs Flask and GCP to import)."""
+    with open(MAIN_PATH) as f:
+        for node in ast.parse(f.read()).body:
+            if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == name for t in node.targets):
+                return ast.literal_eval(node.value)
+    raise KeyError(name)
+
+
+def scan(user_agent, signatures, allowed):
+    user_agent_lower = user_agent.lower()
+    if any(sig in user_agent_lower for sig in allowed):
+        return None
+    return next((sig for sig in signatures if sig in user_agent_lower), None)
+
+
+def timed(fn, stream):
+    started = time.perf_counter()
+    for user_agent in stream:
+        fn(user_agent)
+    return (time.perf_counter() - started) / len(stream) * 1e9
+
+
+def random_user_agent(rng):
+    version = ".".join(str(rng.randint(0, 999)) for _ in range(4))
+    return f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{version} Safari/537.36"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # Each bot User-Agent is logged on its first miss
+
+    signatures = tuple(main_constant("DEFAULT_BOT_SIGNATURES"))
+    allowed = ("stripe",)
+    pattern = compile_signatures(signatures)
+    allowed_pattern = compile_signatures(allowed)
+
+    def regex(user_agent):
+        user_agent_lower = user_agent.lower()
+        if allowed_pattern.search(user_agent_lower):
+            return None
+        match = pattern.search(user_agent_lower)
+        return match.group(0) if match else None
+
+    classifier = UserAgentClassifier(signatures, allowed)
+    for user_agent in CORPUS:
+        verdicts = {bool(scan(user_agent, signatures, allowed)), bool(regex(user_agent)), bool(classifier.classify(user_agent))}
+        assert len(verdicts) == 1, user_agent
+
+    rng = random.Random(args.seed)
+    # Skewed traffic: weight 1/rank, so a handful of browser User-Agents dominate
+    skewed = rng.choices(CORPUS, weights=[1 / rank for rank in range(1, len(CORPUS) + 1)], k=args.lookups)
+    flood = [random_user_agent(rng) for _ in range(args.lookups)]
+    bots = sum(1 for user_agent in CORPUS if scan(user_agent, signatures, allowed))
+
+    classifier = UserAgentClassifier(signatures, allowed)
+    flood_classifier = UserAgentClassifier(signatures, allowed)
+    rows = [
+        ("scan", timed(lambda ua: scan(ua, signatures, allowed), skewed)),
+        ("regex", timed(regex, skewed)),
+        ("classifier", timed(classifier.classify, skewed)),
+        ("flood scan", timed(lambda ua: scan(ua, signatures, allowed), flood)),
+        ("flood", timed(flood_classifier.classify, flood)),
+    ]
+    print(f"{len(CORPUS)} User-Agents ({bots} bots), {len(signatures)} signatures, {args.lookups} lookups per path")
+    print(f"{'path':<11} {'ns/lookup':>10}")
+    for name, ns in rows:
+        print(f"{name:<11} {ns:>10.0f}")
+    stats = classifier.stats()
+    print(f"classifier cache: {stats['hits']} hits, {stats['misses']} misses; flood cache size {flood_classifier.stats()['size']}")
+
+
+if __name__ == "__main__":
+    main()
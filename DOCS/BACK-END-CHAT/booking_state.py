@@ -0,0 +1,187 @@
+"""
+Booking State Module - Slotted Per-Session Booking Context
+
+BookingContextManager used to keep its state in a free-form dict that reset()
+rebuilt and the session layer deep-copied on every save. BookingState holds
+the same fields in __slots__ and adds:
+
+- to_dict() / from_dict(): direct conversion to and from the stored session
+  "state" map, with triggered_hardcodes converted set <-> sorted list
+- changed_fields(): which fields differ from the values recorded when the
+  state was loaded or last saved (a snapshot compare over ten slots, so plain
+  attribute assignment stays free), letting an unchanged state skip the
+  session write entirely
+
+Dict-style access (state['workshop_id'], state.get(...), 'x' in state) is
+kept so existing code and session documents work unchanged. Keys that are
+not known fields are carried in `extra` and round-trip untouched.
+"""
+
+FIELDS = (
+    # Booking flow state (frontend provides these via hardcoded UI controls)
+    "workshop_id",
+    "organization_type",
+    "participants",
+    "requested_date",
+    "requested_time",
+
+    # Info mode state (for window shopping/learning)
+    "info_mode_workshops",
+    "current_info_mode_workshop",
+    "triggered_hardcodes",
+
+    # Metadata
+    "last_updated",
+
+    # Per-session conversation history (rolling window of {"speaker", "message"})
+    "conversation_history",
+)
+
+# Fields holding containers that are mutated in place (copied into the baseline)
+CONTAINER_FIELDS = ("info_mode_workshops", "triggered_hardcodes", "conversation_history")
+
+_FIELD_SET = frozenset(FIELDS)
+
+
+class BookingState:
+    """
+    Booking context for one session.
+
+    Args:
+        **values: Initial field values (unknown keys go to `extra`)
+    """
+
+    __slots__ = FIELDS + ("extra", "_baseline")
+
+    def __init__(self, **values):
+        self.extra = {}
+        self._baseline = None  # None = never saved, every field counts as changed
+        self.workshop_id = None
+        self.organization_type = None
+        self.participants = None
+        self.requested_date = None
+        self.requested_time = None
+        self.info_mode_workshops = []
+        self.current_info_mode_workshop = None
+        self.triggered_hardcodes = set()
+        self.last_updated = None
+        self.conversation_history = []
+        for key, value in values.items():
+            self[key] = value
+
+    # -------------------------------------------------------------------------
+    # Dict-style access (compatibility with the former state dict)
+    # -------------------------------------------------------------------------
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in _FIELD_SET or key in self.extra
+
+    def __iter__(self):
+        yield from FIELDS
+        yield from self.extra
+
+    def __len__(self):
+        return len(FIELDS) + len(self.extra)
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        return self.extra.get(key, default)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __repr__(self):
+        return f"BookingState({self.to_dict()!r})"
+
+    # -------------------------------------------------------------------------
+    # Serialization
+    # -------------------------------------------------------------------------
+    def to_dict(self):
+        """Stored form: plain dict with fresh lists and triggered_hardcodes as a sorted list."""
+        data = {
+            "workshop_id": self.workshop_id,
+            "organization_type": self.organization_type,
+            "participants": self.participants,
+            "requested_date": self.requested_date,
+            "requested_time": self.requested_time,
+            "info_mode_workshops": list(self.info_mode_workshops),
+            "current_info_mode_workshop": self.current_info_mode_workshop,
+            "triggered_hardcodes": sorted(self.triggered_hardcodes),
+            "last_updated": self.last_updated,
+            "conversation_history": list(self.conversation_history),
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a stored session "state" map (lists or sets); the result starts clean."""
+        state = cls()
+        for key, value in (data or {}).items():
+            if key == "triggered_hardcodes":
+                value = set(value or ())
+            elif key in CONTAINER_FIELDS:
+                value = list(value or ())
+            state[key] = value
+        state.mark_clean()
+        return state
+
+    # -------------------------------------------------------------------------
+    # Change tracking
+    # -------------------------------------------------------------------------
+    def mark_clean(self):
+        """Record the current values as saved."""
+        self._baseline = (
+            [getattr(self, name) for name in FIELDS],
+            list(self.info_mode_workshops),
+            frozenset(self.triggered_hardcodes),
+            list(self.conversation_history),
+            dict(self.extra),
+        )
+
+    def changed_fields(self):
+        """Fields changed since the last mark_clean() (all fields if never saved)."""
+        if self._baseline is None:
+            return set(FIELDS) | set(self.extra)
+        values, workshops, hardcodes, history, extra = self._baseline
+        changed = {name for name, value in zip(FIELDS, values)
+                   if name not in CONTAINER_FIELDS and getattr(self, name) != value}
+        if self.info_mode_workshops != workshops:
+            changed.add("info_mode_workshops")
+        if self.triggered_hardcodes != hardcodes:
+            changed.add("triggered_hardcodes")
+        if self.conversation_history != history:
+            changed.add("conversation_history")
+        if self.extra != extra:
+            changed.update(key for key in set(self.extra) | set(extra) if self.extra.get(key) != extra.get(key))
+        return changed
+
+    def estimated_size(self):
+        """Rough serialized size in characters (for context-size logging, no JSON encode)."""
+        size = 0
+        for name in FIELDS:
+            value = getattr(self, name)
+            if name == "conversation_history":
+                size += sum(len(str(entry.get("message", "") if isinstance(entry, dict) else entry)) + 40
+                            for entry in value)
+            elif isinstance(value, (list, set)):
+                size += sum(len(str(item)) + 4 for item in value) + 2
+            else:
+                size += len(str(value)) + 4
+            size += len(name) + 4
+        return size
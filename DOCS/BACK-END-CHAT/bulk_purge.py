@@ -0,0 +1,170 @@
+"""
+Bulk Purge Module - Background Deletion of Rate Limit Collections
+
+After an attack, the rate limit collections can hold tens of thousands of
+shard, sketch and ban documents. Deleting them one request at a time takes
+minutes, so /admin/restore_system hands them to a PurgeJob instead:
+
+- pages through each collection with key-only queries (select([]) ordered by
+  document name, resuming after the last key), so no field data is read
+- deletes each page through a BulkWriter, which parallelises and rate-limits
+  the writes itself and retries failed deletes a bounded number of times
+- publishes progress to a status document after every page, so any instance
+  can answer the status endpoint while the purge runs on another one
+
+Where it runs: PurgeJob.start() uses a daemon thread that outlives the request.
+On Cloud Run that needs CPU always allocated (--no-cpu-throttling); with
+request-based allocation the thread is throttled once the 202 is sent and the
+purge can stall. Otherwise either call run() inside the request
+(PURGE_IN_REQUEST=true, bounded by the request timeout; a purge is safe to
+repeat) or run this module as a Cloud Run Job:
+
+    python bulk_purge.py rate_limit_shards ip_rate_limit_shards ip_rate_limit_sketches \
+        rate_limit_gcra unauthenticated_bans
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+import uuid
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+# Attempts per delete before the BulkWriter gives up on a document
+MAX_DELETE_ATTEMPTS = 5
+
+
+class PurgeJob:
+    """
+    Deletes every document in the given collections on a background thread.
+
+    Args:
+        db: Firestore client
+        collections (list): Collection names to empty
+        status_doc: DocumentReference where progress is published (optional)
+        page_size (int): Document keys fetched per page
+    """
+
+    def __init__(self, db, collections, status_doc=None, page_size=500):
+        self.db = db
+        self.collections = list(collections)
+        self.status_doc = status_doc
+        self.page_size = page_size
+
+        self.job_id = uuid.uuid4().hex[:12]
+        self.state = "pending"
+        self.deleted = {name: 0 for name in self.collections}
+        self.failed = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, name=f"purge-{self.job_id}", daemon=True).start()
+        return self
+
+    def is_running(self):
+        return self.state in ("pending", "running")
+
+    def run(self):
+        self.state = "running"
+        self.started_at = time.time()
+        self._publish()
+        for name in self.collections:
+            try:
+                self._purge_collection(name)
+            except Exception as e:
+                logger.error(f"Purge job {self.job_id}: failed to purge '{name}': {e}", exc_info=True)
+                self.errors.append(f"{name}: {e}")
+        self.finished_at = time.time()
+        self.state = "failed" if self.errors or self.failed else "completed"
+        self._publish()
+        logger.critical(f"Purge job {self.job_id} {self.state}: {sum(self.deleted.values())} documents deleted, {self.failed} failed in {self.finished_at - self.started_at:.1f}s")
+
+    def _purge_collection(self, name):
+        collection = self.db.collection(name)
+        writer = self.db.bulk_writer()
+        writer.on_write_result(lambda reference, result, bulk_writer: self._count_deleted(name))
+        writer.on_write_error(self._on_write_error)
+
+        last_snapshot = None
+        try:
+            while True:
+                # Key-only page: no document fields are transferred
+                query = collection.order_by("__name__").select([]).limit(self.page_size)
+                if last_snapshot is not None:
+                    query = query.start_after(last_snapshot)
+                page = list(query.stream())
+                if not page:
+                    break
+
+                for snapshot in page:
+                    writer.delete(snapshot.reference)
+                writer.flush()
+                self._publish()
+
+                if len(page) < self.page_size:
+                    break
+                last_snapshot = page[-1]
+        finally:
+            writer.close()
+
+    def _count_deleted(self, name):
+        with self._lock:
+            self.deleted[name] += 1
+
+    def _on_write_error(self, failure, bulk_writer):
+        if failure.attempts < MAX_DELETE_ATTEMPTS:
+            return True  # Retry (BulkWriter backs off between attempts)
+        with self._lock:
+            self.failed += 1
+        logger.error(f"Purge job {self.job_id}: giving up on {failure.operation.reference.path}: {failure.message}")
+        return False
+
+    def status(self):
+        with self._lock:
+            deleted = dict(self.deleted)
+            failed = self.failed
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "collections": self.collections,
+            "deleted": deleted,
+            "total_deleted": sum(deleted.values()),
+            "failed": failed,
+            "errors": list(self.errors),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.started_at, 1) if self.started_at else None,
+        }
+
+    def _publish(self):
+        if self.status_doc is None:
+            return
+        try:
+            self.status_doc.set({**self.status(), "updated_at": firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            logger.error(f"Purge job {self.job_id}: failed to publish progress: {e}")
+
+
+def main():
+    """Cloud Run Job / command line entrypoint: purge the named collections and exit."""
+    parser = argparse.ArgumentParser(description="Delete every document in the given Firestore collections.")
+    parser.add_argument("collections", nargs="+")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = firestore.Client()
+    job = PurgeJob(db, args.collections, status_doc=db.collection("system_status").document("purge_job"), page_size=args.page_size)
+    job.run()
+    return 0 if job.state == "completed" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Circuit Breaker Cache Module - Local Copy of system_status/circuit_breaker
+
+Keeps an in-memory copy of the circuit breaker document so the protection
+layer can check lockdown state without a Firestore read per request.
+
+The copy is kept current by an on_snapshot listener, so strikes and admin
+restores propagate to every instance within a second or two. If the
+listener is not streaming, a background poller re-reads the document every
+half staleness window and periodically tries to re-attach the listener.
+If the copy is ever older than max_staleness, the read path refreshes it
+synchronously before answering.
+
+Admin restores write a new last_restore_timestamp. When the copy picks up a
+changed timestamp (from the listener or a poll) it calls on_restore, so every
+instance drops its in-process limiter state, not just the one that served
+/admin/restore_system.
+"""
+
+import logging
+import threading
+import time
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to re-attach a dead snapshot listener
+LISTENER_RETRY_SECONDS = 30
+
+
+class CircuitBreakerCache:
+    """
+    In-memory circuit breaker state driven by a Firestore snapshot listener.
+
+    Args:
+        doc_ref: Firestore DocumentReference of the circuit breaker document
+        max_staleness (float): Maximum age in seconds of the cached copy
+        on_restore: Callable run when another restore is observed (optional)
+    """
+
+    def __init__(self, doc_ref, max_staleness=2.0, on_restore=None):
+        self._doc_ref = doc_ref
+        self._max_staleness = max_staleness
+        self.on_restore = on_restore
+        self._data = None
+        self._confirmed_at = 0.0
+        self._lock = threading.Lock()
+
+        self._watch = None
+        self._worker = LazyWorker(self._poll_loop, "circuit-breaker-poller", on_start=self._attach_listener)
+        self._last_listener_attempt = 0.0
+
+        self._snapshots = 0
+        self._polls = 0
+        self._poll_errors = 0
+        self._restores_seen = 0
+
+    # -------------------------------------------------------------------------
+    # Lifecycle (listener and poller start on first use, see background.py)
+    # -------------------------------------------------------------------------
+    def _attach_listener(self):
+        self._last_listener_attempt = time.monotonic()
+        try:
+            self._watch = self._doc_ref.on_snapshot(self._on_snapshot)
+            logger.info("✓ Circuit breaker snapshot listener attached")
+        except Exception as e:
+            self._watch = None
+            logger.error(f"Failed to attach circuit breaker listener (polling fallback active): {e}")
+
+    def _listener_active(self):
+        return self._watch is not None and getattr(self._watch, "is_active", False)
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        # A document watch delivers an empty list when the document does not exist
+        data = {}
+        for snapshot in doc_snapshots:
+            if snapshot.exists:
+                data = snapshot.to_dict()
+        self._store(data)
+        self._snapshots += 1
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self._max_staleness / 2)
+            if self._listener_active():
+                # Listener is streaming: the copy is current even if nothing changed
+                with self._lock:
+                    self._confirmed_at = time.monotonic()
+                continue
+
+            self.refresh()
+            if time.monotonic() - self._last_listener_attempt >= LISTENER_RETRY_SECONDS:
+                self._attach_listener()
+
+    # -------------------------------------------------------------------------
+    # State
+    # -------------------------------------------------------------------------
+    def _store(self, data):
+        with self._lock:
+            previous = self._data
+            self._data = data
+            self._confirmed_at = time.monotonic()
+
+        # The first copy only sets the baseline: restores before this instance started are done
+        restored_at = data.get("last_restore_timestamp")
+        if previous is None or restored_at is None or restored_at == previous.get("last_restore_timestamp"):
+            return
+        self._restores_seen += 1
+        if self.on_restore:
+            try:
+                self.on_restore()
+            except Exception as e:
+                logger.error(f"Circuit breaker restore callback failed: {e}")
+
+    def refresh(self):
+        """Re-read the document directly (polling fallback)."""
+        try:
+            snapshot = self._doc_ref.get()
+            self._store(snapshot.to_dict() if snapshot.exists else {})
+            self._polls += 1
+        except Exception as e:
+            self._poll_errors += 1
+            logger.error(f"Failed to refresh circuit breaker status: {e}")
+
+    def apply_local(self, updates):
+        """Apply this instance's own write immediately, ahead of the listener."""
+        with self._lock:
+            self._data = {**(self._data or {}), **updates}
+
+    def get(self):
+        """Returns the cached circuit breaker document as a dict ({} if it does not exist)."""
+        self._worker.ensure_started()
+        if self._data is None or time.monotonic() - self._confirmed_at > self._max_staleness:
+            self.refresh()
+        return dict(self._data or {})
+
+    def is_locked_down(self):
+        return self.get().get("locked_down") is True
+
+    def stats(self):
+        """Listener health and read counts (for /system_status)."""
+        return {
+            "listener_active": self._listener_active(),
+            "age_seconds": round(time.monotonic() - self._confirmed_at, 3) if self._confirmed_at else None,
+            "max_staleness_seconds": self._max_staleness,
+            "snapshots": self._snapshots,
+            "polls": self._polls,
+            "poll_errors": self._poll_errors,
+            "restores_seen": self._restores_seen,
+        }
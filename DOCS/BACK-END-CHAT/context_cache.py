@@ -0,0 +1,256 @@
+"""
+Context Cache Module - Static Chat Prompt Held Server-Side by Vertex AI
+
+Every /chat turn used to send the whole chat prompt as one user message,
+including the static prefix (persona, principles, knowledge base) that is
+identical for every request. PromptContextCache moves that prefix out of the
+per-turn request:
+
+1. cached_content: the prefix is uploaded once as a Vertex AI CachedContent
+   (system instruction) and the model is bound to it, so each turn sends
+   only the dynamic tail and the cached tokens are billed at the cache rate.
+   The resource is re-created shortly before its TTL runs out and whenever
+   the prefix version (content hash) changes.
+2. system_instruction: the prefix is passed as the model's
+   system_instruction. The request is still split into instruction + tail,
+   which lets Gemini's implicit prefix caching apply. This is used while a
+   CachedContent is being created, whenever creation failed (SDK too old,
+   region without caching support; retried after retry_seconds), and always
+   when the prefix is below the model's minimum cache size (min_cache_tokens),
+   where creation could only fail.
+
+The minimum depends on the model: Gemini 1.5 needed 32,768 tokens, Gemini 2.x
+models on Vertex AI accept 2,048 (min_cache_tokens_for()), and the chat
+prompt's prefix is around 2.5k tokens. stats() reports why CachedContent is
+not in use (skipped_reason), and skipping for size is logged once per prefix
+version.
+
+CachedContent.create is a network call of its own, so it never runs on the
+request path or under the lock: model_for() starts it on a background thread
+and keeps answering with the system_instruction model (or the still-valid
+previous cache) until it completes.
+
+model_for() returns None if neither model can be built, and the caller then
+sends the full prompt exactly as before.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from token_budget import approximate_tokens
+
+try:
+    from vertexai.preview import caching
+    from vertexai.preview.generative_models import GenerativeModel
+    CONTEXT_CACHING_AVAILABLE = True
+except ImportError:
+    caching = None
+    GenerativeModel = None
+    CONTEXT_CACHING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MODE_CACHED_CONTENT = "cached_content"
+MODE_SYSTEM_INSTRUCTION = "system_instruction"
+
+# Re-create the cached content when less than this share of its TTL remains
+REFRESH_MARGIN = 0.1
+
+# Smallest prefix Vertex AI accepts as CachedContent, by model name prefix (first match wins)
+MIN_CACHE_TOKENS_BY_MODEL = (
+    ("gemini-1.5", 32768),
+    ("gemini-2", 2048),
+)
+# Models not listed above (newer Gemini releases)
+DEFAULT_MIN_CACHE_TOKENS = 2048
+
+
+def min_cache_tokens_for(model_name):
+    """CachedContent minimum for a model ("gemini-2.0-flash" or a full publishers/... resource name)."""
+    name = model_name.rsplit("/", 1)[-1]
+    for model_prefix, min_tokens in MIN_CACHE_TOKENS_BY_MODEL:
+        if name.startswith(model_prefix):
+            return min_tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+class PromptContextCache:
+    """
+    Per-process holder of the model bound to the current static prompt prefix.
+
+    Args:
+        model_name (str): Vertex AI model (e.g. "gemini-2.0-flash")
+        ttl_seconds (int): Lifetime of each CachedContent resource
+        retry_seconds (int): Wait before retrying CachedContent creation after a failure
+        use_cached_content (bool): False = always use the system_instruction mode
+        min_cache_tokens (int): Prefixes estimated below this are never sent to CachedContent
+            (None = the model's minimum, see min_cache_tokens_for())
+    """
+
+    def __init__(self, model_name, ttl_seconds=3600, retry_seconds=600, use_cached_content=True,
+                 min_cache_tokens=None):
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.use_cached_content = use_cached_content
+        self.min_cache_tokens = min_cache_tokens if min_cache_tokens is not None else min_cache_tokens_for(model_name)
+        if use_cached_content and not CONTEXT_CACHING_AVAILABLE:
+            logger.warning("vertexai caching SDK not installed - chat prompts are sent in full every turn")
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._mode = None
+        self._version = None
+        self._cached_content = None
+        self._expires_at = 0.0
+        self._cache_failed_at = None
+        self._creating = False
+        self._prefix_tokens = {}  # version -> estimated prefix tokens
+
+        self._hits = 0
+        self._builds = 0
+        self._cache_creations = 0
+        self._cache_failures = 0
+        self._below_minimum = 0
+        self._last_error = None
+
+    def model_for(self, static_prefix, version):
+        """GenerativeModel carrying `static_prefix` (re-built when `version` changes), or None."""
+        if not CONTEXT_CACHING_AVAILABLE:
+            return None
+        outdated = None
+        with self._lock:
+            expired = self._mode == MODE_CACHED_CONTENT and time.time() >= self._expires_at
+            if self._version != version or self._model is None or expired:
+                outdated = self._build_system_instruction(static_prefix, version)
+            else:
+                self._hits += 1
+            if self._should_create(static_prefix, version):
+                self._creating = True
+                threading.Thread(
+                    target=self._create_cached_content, args=(static_prefix, version),
+                    name="context-cache-create", daemon=True
+                ).start()
+            model = self._model
+        self._delete(outdated)
+        return model
+
+    def _should_create(self, static_prefix, version):
+        # Called with the lock held
+        if not self.use_cached_content or self._creating:
+            return False
+        now = time.time()
+        if self._mode == MODE_CACHED_CONTENT and now < self._expires_at - self.ttl_seconds * REFRESH_MARGIN:
+            return False
+        if self._cache_failed_at is not None and now - self._cache_failed_at < self.retry_seconds:
+            return False
+        if version not in self._prefix_tokens:
+            self._prefix_tokens = {version: approximate_tokens(static_prefix)}
+            if self._prefix_tokens[version] < self.min_cache_tokens:
+                self._below_minimum += 1
+                logger.warning(f"Chat prompt prefix is ~{self._prefix_tokens[version]} tokens, below the "
+                               f"{self.min_cache_tokens}-token context cache minimum of {self.model_name} - "
+                               f"using system_instruction")
+        return self._prefix_tokens[version] >= self.min_cache_tokens
+
+    def _build_system_instruction(self, static_prefix, version):
+        # Called with the lock held. Local object construction only, no network call.
+        # Returns the replaced cached content (if still live) for the caller to delete
+        self._builds += 1
+        previous = self._cached_content if time.time() < self._expires_at else None
+        try:
+            self._model = GenerativeModel(self.model_name, system_instruction=[static_prefix])
+            self._mode = MODE_SYSTEM_INSTRUCTION
+        except Exception as e:
+            self._model = None
+            self._mode = None
+            self._last_error = str(e)[:200]
+            logger.error(f"Failed to build system_instruction model (sending full prompts): {e}")
+        self._version = version
+        self._cached_content = None
+        return previous
+
+    def _create_cached_content(self, static_prefix, version):
+        # Background thread: requests keep using the current model meanwhile
+        try:
+            cached_content = caching.CachedContent.create(
+                model_name=self.model_name,
+                system_instruction=static_prefix,
+                ttl=timedelta(seconds=self.ttl_seconds),
+                display_name=f"chat-prompt-{version}",
+            )
+            model = GenerativeModel.from_cached_content(cached_content=cached_content)
+        except Exception as e:
+            with self._lock:
+                self._creating = False
+                self._cache_failed_at = time.time()
+                self._cache_failures += 1
+                self._last_error = str(e)[:200]
+            logger.warning(f"Context caching unavailable, using system_instruction: {e}")
+            return
+
+        with self._lock:
+            self._creating = False
+            if self._version != version:
+                stale, previous = cached_content, None  # The prefix changed while creating
+            else:
+                stale, previous = None, self._cached_content
+                self._model = model
+                self._mode = MODE_CACHED_CONTENT
+                self._cached_content = cached_content
+                self._expires_at = time.time() + self.ttl_seconds
+                self._cache_failed_at = None
+                self._cache_creations += 1
+        if stale is None:
+            logger.info(f"✓ Chat prompt context cache created ({cached_content.name}, version {version})")
+        self._delete(stale)
+        self._delete(previous)
+
+    def _delete(self, cached_content):
+        # Best effort: an outdated prefix would otherwise be billed until its TTL ends
+        if cached_content is None:
+            return
+        try:
+            cached_content.delete()
+        except Exception as e:
+            logger.warning(f"Failed to delete outdated context cache {getattr(cached_content, 'name', '?')}: {e}")
+
+    def _skipped_reason(self):
+        # Called with the lock held: why CachedContent is not serving requests (None if it is)
+        if not CONTEXT_CACHING_AVAILABLE:
+            return "sdk_unavailable"
+        if self._mode == MODE_CACHED_CONTENT:
+            return None
+        if not self.use_cached_content:
+            return "disabled"
+        if self._prefix_tokens.get(self._version, self.min_cache_tokens) < self.min_cache_tokens:
+            return "below_minimum"
+        if self._creating:
+            return "creating"
+        if self._cache_failed_at is not None:
+            return "creation_failed"
+        return "not_requested_yet"
+
+    def stats(self):
+        """Current mode and cache churn (for /system_status)."""
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "available": CONTEXT_CACHING_AVAILABLE,
+                "mode": self._mode,
+                "version": self._version,
+                "cached_content": getattr(self._cached_content, "name", None),
+                "expires_in_seconds": round(self._expires_at - time.time()) if self._mode == MODE_CACHED_CONTENT else None,
+                "hits": self._hits,
+                "builds": self._builds,
+                "cache_creations": self._cache_creations,
+                "cache_failures": self._cache_failures,
+                "creating": self._creating,
+                "prefix_tokens_estimate": self._prefix_tokens.get(self._version),
+                "min_cache_tokens": self.min_cache_tokens,
+                "below_minimum": self._below_minimum,
+                "skipped_reason": self._skipped_reason(),
+                "last_error": self._last_error,
+            }
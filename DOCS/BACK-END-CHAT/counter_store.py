@@ -0,0 +1,348 @@
+"""
+Counter Store Module - Pluggable Backend for Rate Limit Counters and Strikes
+
+The protection layer only needs four operations from its storage:
+
+- read(namespace, key, tags, window)       -> request count for a key this minute
+- increment(namespace, key, tags, window)  -> add requests to that count
+- record_strike(strike_limit)              -> bump the circuit breaker strike count
+- circuit_breaker_state() / is_locked_down()
+
+CounterStore defines that interface; three backends implement it:
+
+- FirestoreCounterStore: sharded counters + circuit breaker document (multi-instance)
+- MemoryCounterStore:    plain dicts behind a lock (one process, e.g. benchmarks)
+- SqliteCounterStore:    one SQLite file in WAL mode (all workers on one box)
+
+Namespaces separate counter families: NAMESPACE_ENDPOINT holds the per-endpoint
+and GLOBAL counters, NAMESPACE_IP the per-IP counters. Tags are the extra
+fields the Firestore shards are filtered on; the local backends ignore them.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_ENDPOINT = "endpoint"
+NAMESPACE_IP = "ip"
+
+BACKENDS = ("firestore", "memory", "sqlite")
+
+# Local backends keep this many seconds of past minute windows before pruning
+WINDOW_RETENTION_SECONDS = 300
+
+
+class CounterStore:
+    """Interface for rate limit counters and circuit breaker strikes."""
+
+    backend = None
+
+    def read(self, namespace, key, tags, minute_window):
+        """Total count for `key` in the given minute window."""
+        raise NotImplementedError
+
+    def increment(self, namespace, key, tags, minute_window, amount=1):
+        """Add `amount` to the count for `key` in the given minute window."""
+        raise NotImplementedError
+
+    def record_strike(self, strike_limit):
+        """Atomically add one strike, locking down at `strike_limit`. Returns the new strike count."""
+        raise NotImplementedError
+
+    def circuit_breaker_state(self):
+        """Circuit breaker fields as a dict ({} if no strike was ever recorded)."""
+        raise NotImplementedError
+
+    def is_locked_down(self):
+        return self.circuit_breaker_state().get("locked_down") is True
+
+    def reset_circuit_breaker(self):
+        """Clear strikes and unlock (admin restore)."""
+        raise NotImplementedError
+
+    def clear_counters(self):
+        """Delete every stored counter. Returns the number of entries removed."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.backend}
+
+
+# =============================================================================
+# Firestore (sharded counters + system_status/circuit_breaker)
+# =============================================================================
+class FirestoreCounterStore(CounterStore):
+    """
+    Firestore backend used in production.
+
+    Args:
+        db: Firestore client
+        counters (dict): namespace -> ShardedCounter
+        breaker_doc: DocumentReference of the circuit breaker document
+        breaker_cache: CircuitBreakerCache serving lockdown reads without a Firestore read
+    """
+
+    backend = "firestore"
+
+    def __init__(self, db, counters, breaker_doc, breaker_cache):
+        self.db = db
+        self.counters = counters
+        self.breaker_doc = breaker_doc
+        self.breaker_cache = breaker_cache
+
+    def read(self, namespace, key, tags, minute_window):
+        return self.counters[namespace].read(key, tags, minute_window)
+
+    def increment(self, namespace, key, tags, minute_window, amount=1):
+        self.counters[namespace].increment(key, tags, minute_window, amount=amount)
+
+    def record_strike(self, strike_limit):
+        breaker_doc = self.breaker_doc
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            # Get current circuit breaker state
+            snapshot = breaker_doc.get(transaction=transaction)
+
+            if not snapshot.exists:
+                # First strike ever - create the document
+                transaction.set(breaker_doc, {
+                    "strike_count": 1,
+                    "last_strike_timestamp": firestore.SERVER_TIMESTAMP,
+                    "locked_down": strike_limit <= 1
+                })
+                return 1
+
+            new_strikes = snapshot.to_dict().get("strike_count", 0) + 1
+            update_data = {
+                "strike_count": firestore.Increment(1),
+                "last_strike_timestamp": firestore.SERVER_TIMESTAMP
+            }
+            if new_strikes >= strike_limit:
+                update_data["locked_down"] = True
+
+            transaction.update(breaker_doc, update_data)
+            return new_strikes
+
+        new_strikes = update_in_transaction(self.db.transaction())
+        if new_strikes >= strike_limit:
+            # Lock this instance immediately; others follow via their snapshot listeners
+            self.breaker_cache.apply_local({"locked_down": True, "strike_count": new_strikes})
+        return new_strikes
+
+    def circuit_breaker_state(self):
+        snapshot = self.breaker_doc.get()
+        return snapshot.to_dict() if snapshot.exists else {}
+
+    def is_locked_down(self):
+        # Served from the snapshot-listener cache (no Firestore read per request)
+        return self.breaker_cache.is_locked_down()
+
+    def reset_circuit_breaker(self):
+        self.breaker_doc.set({
+            "strike_count": 0,
+            "locked_down": False,
+            "last_restore_timestamp": firestore.SERVER_TIMESTAMP
+        }, merge=False)
+        self.breaker_cache.apply_local({"strike_count": 0, "locked_down": False})
+
+    def clear_counters(self):
+        deleted = 0
+        for counter in self.counters.values():
+            for doc in counter.collection.stream():
+                doc.reference.delete()
+                deleted += 1
+        return deleted
+
+    def stats(self):
+        return {"backend": self.backend, "circuit_breaker_cache": self.breaker_cache.stats()}
+
+
+# =============================================================================
+# In-memory (single process)
+# =============================================================================
+class MemoryCounterStore(CounterStore):
+    """
+    Process-local backend. Limits are per process, so only use it with a single
+    worker (or for benchmarking the protection layer without GCP).
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self._counts = {}
+        self._breaker = {}
+        self._newest_window = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, minute_window):
+        # Called with the lock held; drops windows once a newer minute starts
+        if minute_window <= self._newest_window:
+            return
+        self._newest_window = minute_window
+        cutoff = minute_window - WINDOW_RETENTION_SECONDS
+        for entry in [entry for entry in self._counts if entry[2] < cutoff]:
+            del self._counts[entry]
+
+    def read(self, namespace, key, tags, minute_window):
+        with self._lock:
+            return self._counts.get((namespace, key, minute_window), 0)
+
+    def increment(self, namespace, key, tags, minute_window, amount=1):
+        with self._lock:
+            self._prune(minute_window)
+            entry = (namespace, key, minute_window)
+            self._counts[entry] = self._counts.get(entry, 0) + amount
+
+    def record_strike(self, strike_limit):
+        with self._lock:
+            new_strikes = self._breaker.get("strike_count", 0) + 1
+            self._breaker["strike_count"] = new_strikes
+            self._breaker["last_strike_timestamp"] = datetime.now()
+            self._breaker.setdefault("locked_down", False)
+            if new_strikes >= strike_limit:
+                self._breaker["locked_down"] = True
+            return new_strikes
+
+    def circuit_breaker_state(self):
+        with self._lock:
+            return dict(self._breaker)
+
+    def reset_circuit_breaker(self):
+        with self._lock:
+            self._breaker = {"strike_count": 0, "locked_down": False, "last_restore_timestamp": datetime.now()}
+
+    def clear_counters(self):
+        with self._lock:
+            deleted = len(self._counts)
+            self._counts.clear()
+            return deleted
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "entries": len(self._counts)}
+
+
+# =============================================================================
+# SQLite WAL (all processes on one host)
+# =============================================================================
+class SqliteCounterStore(CounterStore):
+    """
+    SQLite backend shared by every worker process on one host.
+
+    WAL mode lets readers run alongside the single writer, and each increment
+    is one UPSERT, so Gunicorn workers share exact limits without Firestore.
+
+    Args:
+        path (str): Database file (created if missing)
+        busy_timeout_ms (int): How long a writer waits for the lock before failing
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._newest_window = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                minute_window INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (namespace, key, minute_window)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS circuit_breaker (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                strike_count INTEGER NOT NULL,
+                locked_down INTEGER NOT NULL,
+                last_strike_timestamp TEXT,
+                last_restore_timestamp TEXT
+            )
+        """)
+
+    def _conn(self):
+        # One connection per thread (sqlite3 connections are not thread-safe)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def read(self, namespace, key, tags, minute_window):
+        row = self._conn().execute(
+            "SELECT count FROM counters WHERE namespace = ? AND key = ? AND minute_window = ?",
+            (namespace, key, minute_window)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, namespace, key, tags, minute_window, amount=1):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO counters (namespace, key, minute_window, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key, minute_window) DO UPDATE SET count = count + excluded.count",
+            (namespace, key, minute_window, amount)
+        )
+        if minute_window > self._newest_window:
+            self._newest_window = minute_window
+            conn.execute("DELETE FROM counters WHERE minute_window < ?", (minute_window - WINDOW_RETENTION_SECONDS,))
+
+    def record_strike(self, strike_limit):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO circuit_breaker (id, strike_count, locked_down, last_strike_timestamp) VALUES (0, 1, 0, ?) "
+                "ON CONFLICT (id) DO UPDATE SET strike_count = strike_count + 1, last_strike_timestamp = excluded.last_strike_timestamp",
+                (datetime.now().isoformat(),)
+            )
+            new_strikes = conn.execute("SELECT strike_count FROM circuit_breaker WHERE id = 0").fetchone()[0]
+            if new_strikes >= strike_limit:
+                conn.execute("UPDATE circuit_breaker SET locked_down = 1 WHERE id = 0")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return new_strikes
+
+    def circuit_breaker_state(self):
+        row = self._conn().execute(
+            "SELECT strike_count, locked_down, last_strike_timestamp, last_restore_timestamp FROM circuit_breaker WHERE id = 0"
+        ).fetchone()
+        if not row:
+            return {}
+        state = {"strike_count": row[0], "locked_down": bool(row[1])}
+        if row[2]:
+            state["last_strike_timestamp"] = row[2]
+        if row[3]:
+            state["last_restore_timestamp"] = row[3]
+        return state
+
+    def reset_circuit_breaker(self):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO circuit_breaker (id, strike_count, locked_down, last_restore_timestamp) VALUES (0, 0, 0, ?)",
+            (datetime.now().isoformat(),)
+        )
+
+    def clear_counters(self):
+        return self._conn().execute("DELETE FROM counters").rowcount
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM counters").fetchone()[0]
+        return {"backend": self.backend, "path": self.path, "entries": entries}
@@ -0,0 +1,123 @@
+"""
+GCRA Limiter Module - Generic Cell Rate Algorithm with One Document per Key
+
+An exact alternative to the fixed-minute sharded counters. Each key stores a
+single "theoretical arrival time" (TAT). With emission interval T = period /
+limit and burst tolerance tau = period - T, a request arriving at `now` is
+allowed iff max(TAT, now) + T - now <= period, and the stored TAT advances by T.
+
+This admits at most `limit` requests in any sliding `period` (no double
+bursts at minute edges) and needs one read + one conditional write per
+decision. The write carries a last_update_time precondition (or create() for
+new keys), so concurrent instances never overwrite each other's TAT; a
+losing writer re-reads and retries.
+
+Note: every decision for a key writes the same document. Firestore sustains
+roughly one write per second per document before contention retries grow, and
+a decision that keeps losing the write race fails open. Only use it for keys
+whose allowed rate stays near that budget (per endpoint, per IP); main.py keeps
+the GLOBAL counter on the sharded counters. benchmarks/gcra_load.py measures
+conflicts and fail-open decisions for one hot key.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def gcra_decide(tat, now, emission_interval, period, cost=1):
+    """
+    Pure GCRA step.
+
+    Args:
+        tat (float): Stored theoretical arrival time (epoch seconds, 0 if none)
+        now (float): Current time (epoch seconds)
+        emission_interval (float): period / limit
+        period (float): Window length in seconds
+        cost (int): Requests this decision accounts for (all or nothing)
+
+    Returns:
+        tuple: (allowed, new_tat)
+    """
+    new_tat = max(tat, now) + emission_interval * cost
+    if new_tat - now > period:
+        return False, tat
+    return True, new_tat
+
+
+class GcraLimiter:
+    """
+    GCRA limiter storing one TAT document per key.
+
+    Args:
+        db: Firestore client (for write preconditions)
+        collection_name (str): Collection holding one document per key
+        limit (int): Requests allowed per period
+        period (float): Period in seconds (60 = per minute)
+        max_retries (int): Attempts when another instance wins the write race
+    """
+
+    def __init__(self, db, collection_name, limit, period=60.0, max_retries=5):
+        self.db = db
+        self.collection = db.collection(collection_name)
+        self.limit = limit
+        self.period = period
+        self.emission_interval = period / limit
+        self.max_retries = max_retries
+
+        self._decisions = 0
+        self._conflicts = 0
+        self._give_ups = 0
+        self._errors = 0
+
+    def allow(self, key, cost=1):
+        """
+        Returns True if the request for `key` is allowed. `cost` > 1 also accounts for
+        requests admitted elsewhere (e.g. by the IP sketch). Fails open on errors.
+        """
+        doc_ref = self.collection.document(key)
+        try:
+            for _ in range(self.max_retries):
+                snapshot = doc_ref.get()
+                now = time.time()
+                tat = snapshot.to_dict().get("tat", 0.0) if snapshot.exists else 0.0
+
+                allowed, new_tat = gcra_decide(tat, now, self.emission_interval, self.period, cost)
+                if not allowed:
+                    self._decisions += 1
+                    return False
+
+                data = {"tat": new_tat, "ttl": datetime.fromtimestamp(new_tat) + timedelta(seconds=self.period)}
+                try:
+                    if snapshot.exists:
+                        doc_ref.update(data, option=self.db.write_option(last_update_time=snapshot.update_time))
+                    else:
+                        doc_ref.create(data)
+                    self._decisions += 1
+                    return True
+                except (gcp_exceptions.FailedPrecondition, gcp_exceptions.AlreadyExists, gcp_exceptions.Conflict):
+                    # Another instance updated the TAT first - re-read and decide again
+                    self._conflicts += 1
+
+            self._give_ups += 1
+            logger.warning(f"GCRA limiter gave up on '{key}' after {self.max_retries} write conflicts (failing open)")
+            return True
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"GCRA limiter check failed for '{key}': {e}")
+            return True  # Fail open on errors
+
+    def stats(self):
+        """Decision and contention counts (for /system_status)."""
+        return {
+            "limit": self.limit,
+            "period_seconds": self.period,
+            "decisions": self._decisions,
+            "write_conflicts": self._conflicts,
+            "failed_open_after_conflicts": self._give_ups,
+            "errors": self._errors,
+        }
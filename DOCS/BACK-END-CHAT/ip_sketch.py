@@ -0,0 +1,275 @@
+"""
+IP Sketch Module - Count-Min Sketch Front for Per-IP Rate Limiting (Layer 0)
+
+Per-IP shard documents grow with the number of distinct clients. This module
+keeps a fixed-size count-min sketch per instance, keyed by the SHA-256 IP hash
+and reset every minute window, so most IPs are decided without Firestore.
+
+Only IPs whose estimate reaches the promotion threshold are handed to exact
+Firestore counting. A count-min sketch never under-counts, so an IP below the
+threshold is truly below it (up to merge staleness, see below). Updates are
+conservative (only the rows holding the minimum are raised), which keeps that
+guarantee and cuts collision over-counts.
+
+Promotion hand-off: the exact counter enforces the full per-IP limit. The first
+time an instance promotes an IP in a window, it seeds the exact count with its
+local sketch estimate for that IP (pending_seed / mark_seeded). Requests the
+sketch already admitted therefore count against the limit once, and a
+collision over-count only costs the IP its size, not the whole promotion
+threshold.
+
+Global merge: every merge_interval seconds each instance publishes its local
+sketch for the window to ip_rate_limit_sketches/{window}_{instance} and sums the
+sketches published by the other instances. Estimates are local + remote, so
+instances see each other's traffic with at most merge_interval of delay.
+
+Merge delay: until the next merge, each of K instances can admit an IP up to the
+threshold on its own, so one IP spread across K instances can get about
+K * promote_threshold requests through the sketches early in a window (with
+K = 10 and the default threshold of 50, about 500). The seeds carry those
+admissions into the exact count, so the IP is then held to the per-minute limit
+for the rest of the window. An instance that never sees the IP again does not
+seed its share (at most the threshold).
+
+Error bounds (standard count-min guarantees, N = total requests in window):
+    estimate >= true count, always
+    estimate <= true count + epsilon * N with probability >= 1 - delta
+    epsilon = e / width, delta = e ** -depth
+Memory: 2 * width * depth * 4 bytes, independent of the number of clients.
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timedelta
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+
+class CountMinSketch:
+    """
+    Fixed-size count-min sketch over hex digests (e.g. SHA-256 IP hashes).
+
+    The digest is already uniformly distributed, so the `depth` row hashes are
+    taken from consecutive 32-bit slices of it instead of rehashing.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        if depth > 8:
+            raise ValueError("depth must be <= 8 (one 32-bit slice of a SHA-256 digest per row)")
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def _indexes(self, key_hex):
+        return [int(key_hex[i * 8:(i + 1) * 8], 16) % self.width for i in range(self.depth)]
+
+    def add(self, key_hex, count=1):
+        # Conservative update: raise each row only as far as the new minimum needs
+        indexes = self._indexes(key_hex)
+        target = min(row[index] for row, index in zip(self._rows, indexes)) + count
+        for row, index in zip(self._rows, indexes):
+            if row[index] < target:
+                row[index] = target
+        self.total += count
+
+    def estimate(self, key_hex):
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key_hex)))
+
+    def merge(self, other):
+        """Element-wise sum of another sketch with the same dimensions."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches with different dimensions")
+        for row, other_row in zip(self._rows, other._rows):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] += value
+        self.total += other.total
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    def error_bound(self):
+        """Maximum over-count with probability 1 - delta for the current total."""
+        return self.epsilon * self.total
+
+    def to_bytes(self):
+        return zlib.compress(b"".join(row.tobytes() for row in self._rows))
+
+    @classmethod
+    def from_bytes(cls, data, width, depth, total=0):
+        sketch = cls(width, depth)
+        raw = zlib.decompress(data)
+        row_size = 4 * width
+        for i in range(depth):
+            sketch._rows[i] = array("I", raw[i * row_size:(i + 1) * row_size])
+        sketch.total = total
+        return sketch
+
+
+class IpSketchLimiter:
+    """
+    Per-minute count-min sketch in front of exact per-IP counting.
+
+    Args:
+        promote_threshold (int): Estimate at which an IP is promoted to exact counting
+        collection: Firestore CollectionReference for published sketches (None = no merge)
+        width, depth (int): Sketch dimensions
+        merge_interval (float): Seconds between global merges
+    """
+
+    def __init__(self, promote_threshold, collection=None, width=2048, depth=4, merge_interval=10.0):
+        self.promote_threshold = promote_threshold
+        self.width = width
+        self.depth = depth
+        self.merge_interval = merge_interval
+        self.instance_id = uuid.uuid4().hex[:12]
+
+        self._collection = collection
+        self._window = None
+        self._local = CountMinSketch(width, depth)
+        self._remote = CountMinSketch(width, depth)
+        self._seeded = set()  # IPs whose sketch count was handed to exact counting this window
+        self._lock = threading.Lock()
+        self._worker = LazyWorker(self._merge_loop, "ip-sketch-merge")
+
+        self._sketch_decisions = 0
+        self._promotions = 0
+        self._seeds = 0
+        self._merges = 0
+        self._merge_errors = 0
+
+    def _roll(self, window):
+        if window != self._window:
+            self._window = window
+            self._local = CountMinSketch(self.width, self.depth)
+            self._remote = CountMinSketch(self.width, self.depth)
+            self._seeded = set()
+
+    def reset(self):
+        """Drop this window's local and merged counts (after /admin/restore_system)."""
+        with self._lock:
+            self._window = None
+            self._local = CountMinSketch(self.width, self.depth)
+            self._remote = CountMinSketch(self.width, self.depth)
+            self._seeded = set()
+
+    def _ensure_started(self):
+        if self._collection is not None:
+            self._worker.ensure_started()
+
+    def estimate(self, hashed_ip, window):
+        """Cluster-wide estimate (local + last merged remote) for this IP in the window."""
+        self._ensure_started()
+        with self._lock:
+            self._roll(window)
+            return self._local.estimate(hashed_ip) + self._remote.estimate(hashed_ip)
+
+    def should_promote(self, hashed_ip, window):
+        """True if the IP needs exact Firestore counting; False if the sketch can admit it."""
+        promote = self.estimate(hashed_ip, window) >= self.promote_threshold
+        if promote:
+            self._promotions += 1
+        else:
+            self._sketch_decisions += 1
+        return promote
+
+    def add(self, hashed_ip, window):
+        with self._lock:
+            self._roll(window)
+            self._local.add(hashed_ip)
+
+    def pending_seed(self, hashed_ip, window):
+        """
+        Requests this instance admitted through the sketch for a promoted IP that are not
+        in the exact count yet (its local estimate until mark_seeded, then 0).
+        """
+        with self._lock:
+            self._roll(window)
+            if hashed_ip in self._seeded:
+                return 0
+            return self._local.estimate(hashed_ip)
+
+    def mark_seeded(self, hashed_ip, window):
+        """Record that the pending seed was written to the exact count."""
+        with self._lock:
+            self._roll(window)
+            if hashed_ip not in self._seeded:
+                self._seeded.add(hashed_ip)
+                self._seeds += 1
+
+    # -------------------------------------------------------------------------
+    # Global merge
+    # -------------------------------------------------------------------------
+    def _merge_loop(self):
+        while True:
+            time.sleep(self.merge_interval)
+            try:
+                self.merge_now()
+            except Exception as e:
+                self._merge_errors += 1
+                logger.error(f"IP sketch merge failed: {e}")
+
+    def merge_now(self):
+        """Publish the local sketch and sum every other instance's sketch for the window."""
+        with self._lock:
+            window = self._window
+            if window is None:
+                return
+            payload = self._local.to_bytes()
+            local_total = self._local.total
+
+        self._collection.document(f"{window}_{self.instance_id}").set({
+            "minute_window": window,
+            "instance": self.instance_id,
+            "width": self.width,
+            "depth": self.depth,
+            "total": local_total,
+            "counters": payload,
+            "ttl": datetime.fromtimestamp(window) + timedelta(minutes=5)
+        })
+
+        remote = CountMinSketch(self.width, self.depth)
+        for doc in self._collection.where("minute_window", "==", window).stream():
+            data = doc.to_dict()
+            if data.get("instance") == self.instance_id:
+                continue
+            if (data.get("width"), data.get("depth")) != (self.width, self.depth):
+                continue
+            remote.merge(CountMinSketch.from_bytes(data["counters"], self.width, self.depth, data.get("total", 0)))
+
+        with self._lock:
+            if self._window == window:
+                self._remote = remote
+        self._merges += 1
+
+    def stats(self):
+        """Sketch decisions, promotions and current error bound (for /system_status)."""
+        with self._lock:
+            total = self._local.total + self._remote.total
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "memory_bytes": 2 * self.width * self.depth * 4,
+            "promote_threshold": self.promote_threshold,
+            "sketch_decisions": self._sketch_decisions,
+            "promotions": self._promotions,
+            "seeds": self._seeds,
+            "merges": self._merges,
+            "merge_errors": self._merge_errors,
+            "window_total": total,
+            "error_bound": round(math.e / self.width * total, 2),
+            "error_probability": round(math.exp(-self.depth), 4),
+        }
@@ -0,0 +1,224 @@
+"""
+Knowledge Base Module - Workshop Knowledge Base Rendered From the Registry
+
+The chat prompt's knowledge base used to be a hand-written string that
+repeated every price already held in WORKSHOP_REGISTRY, so a Portal catalog
+(or a price change in the registry) never reached the prompt. This module
+renders it instead:
+
+- render_knowledge_base(): static prose (about/contact/delivery text, plus a
+  title, duration and summary per workshop) combined with names and prices
+  taken from the registry. Workshops without prose (e.g. new Portal products)
+  are still listed with their registry name and price.
+- render_info_snippets(): the info mode text for each workshop ("first
+  mention" with prices, "already mentioned" one-liner), rendered once per
+  catalog so build_prompt only concatenates strings.
+
+Both treat a workshop without a per_person flag as priced per person, with
+"default" standing in for a missing corporate/community price, like
+build_workshop_pricing() and the checkout in main.py.
+- catalog_version(): content hash of the registry. The chat prompt version is
+  derived from it, so the compiled prompt, the Vertex AI context cache and
+  anything else keyed on CHAT_PROMPT.version change together with the catalog.
+- WorkshopCatalog: optionally re-loads the catalog (Portal) in a background
+  thread and calls on_change(registry, version) only when the hash changes.
+
+Prose entries are matched to registry workshops by workshop ID, falling back
+to the registry description ("<title>" or "<title> - <Variant>"), because
+Portal products carry their own document IDs.
+"""
+
+import hashlib
+import json
+import logging
+import time
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+
+def catalog_version(registry):
+    """Short content hash of a workshop registry (stable across key order)."""
+    canonical = json.dumps(registry, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def format_dollars(cents):
+    """Registry amount in cents as "$95" or "$95.50"."""
+    dollars = (cents or 0) / 100
+    return f"${dollars:.0f}" if dollars == int(dollars) else f"${dollars:.2f}"
+
+
+def price_text(workshop):
+    """Corporate/community price line for one registry entry."""
+    corporate = workshop.get("corporate") or workshop.get("default")
+    community = workshop.get("community") or workshop.get("default")
+    unit = "per person" if workshop.get("per_person", True) else "flat rate"
+    if corporate == community:
+        return f"{format_dollars(corporate)} {unit}"
+    return f"{format_dollars(corporate)} corp / {format_dollars(community)} community {unit}"
+
+
+def _resolve(registry, by_description, workshop_id, description):
+    if workshop_id in registry:
+        return workshop_id
+    return by_description.get(description.lower())
+
+
+def render_knowledge_base(registry, intro, workshop_prose, footer=""):
+    """
+    Knowledge base text for the chat prompt.
+
+    Args:
+        registry (dict): WORKSHOP_REGISTRY (prices in cents)
+        intro (str): Prose before the workshop list (ends with its heading)
+        workshop_prose (list): Dicts with "title", "duration", "summary" and
+            "variants" ([(workshop_id, label or None)], label e.g. "virtual")
+        footer (str): Prose after the workshop list
+
+    Returns:
+        str: Rendered knowledge base
+    """
+    by_description = {
+        str(workshop.get("description", "")).lower(): workshop_id
+        for workshop_id, workshop in registry.items()
+    }
+    listed = set()
+    blocks = []
+
+    for entry in workshop_prose:
+        prices = []
+        for workshop_id, label in entry["variants"]:
+            description = f"{entry['title']} - {label.title()}" if label else entry["title"]
+            resolved = _resolve(registry, by_description, workshop_id, description)
+            if resolved is None or resolved in listed:
+                continue
+            listed.add(resolved)
+            price = price_text(registry[resolved])
+            prices.append(f"{price} ({label})" if label else price)
+        if not prices:
+            continue  # Workshop not offered in this catalog
+        fields = [f"**{entry['title']}**"]
+        if entry.get("duration"):
+            fields.append(entry["duration"])
+        header = " | ".join(fields + prices)
+        blocks.append(f"{header}\n{entry['summary']}" if entry.get("summary") else header)
+
+    for workshop_id, workshop in registry.items():
+        if workshop_id not in listed:
+            blocks.append(f"**{workshop.get('description') or workshop_id}** | {price_text(workshop)}")
+
+    sections = [intro.strip("\n"), *blocks, footer.strip("\n")]
+    return "\n" + "\n\n".join(section for section in sections if section) + "\n"
+
+
+def render_info_snippets(registry):
+    """
+    Info mode snippets for every workshop in the registry.
+
+    Returns:
+        dict: workshop_id -> (first mention with pricing, already mentioned line)
+    """
+    snippets = {}
+    for workshop_id, workshop in registry.items():
+        name = workshop.get("description", workshop_id)
+        # Prices are in cents
+        if workshop.get("per_person", True):
+            corporate_price = (workshop.get("corporate") or workshop.get("default") or 0) / 100
+            community_price = (workshop.get("community") or workshop.get("default") or 0) / 100
+            pricing = f"- Pricing: <price>${corporate_price:.2f}/person (Corporate)</price>, <price>${community_price:.2f}/person (Community)</price>\n"
+        else:
+            default_price = workshop.get("default", 0) / 100
+            pricing = f"- Pricing: <price>${default_price:.2f} flat rate</price>\n"
+        snippets[workshop_id] = (
+            f"**{name}:**\n{pricing}\n",
+            f"**{name}:** (Details provided earlier in conversation)\n",
+        )
+    return snippets
+
+
+class WorkshopCatalog:
+    """
+    Current workshop registry and its content hash.
+
+    Args:
+        registry (dict): Registry in use at startup
+        load_fn: Callable returning a fresh registry, or None to keep the current one
+        refresh_interval (float): Seconds between background reloads (0 = never reload)
+        on_change: Callable(registry, version) run when a reload changes the catalog
+    """
+
+    def __init__(self, registry, load_fn=None, refresh_interval=0, on_change=None):
+        self.registry = registry
+        self.version = catalog_version(registry)
+        self._load_fn = load_fn
+        self.refresh_interval = refresh_interval
+        self._on_change = on_change
+        self._worker = LazyWorker(self._refresh_loop, "workshop-catalog")
+
+        self._refreshed_at = None
+        self._refreshes = 0
+        self._changes = 0
+        self._errors = 0
+
+    # -------------------------------------------------------------------------
+    # Lifecycle (reload thread starts on first use, see background.py)
+    # -------------------------------------------------------------------------
+    def _ensure_started(self):
+        if self._load_fn and self.refresh_interval > 0:
+            self._worker.ensure_started()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
+
+    def refresh(self):
+        """Reload the catalog now. Keeps the current one if loading fails or returns nothing."""
+        try:
+            registry = self._load_fn()
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Could not reload workshop catalog: {e}")
+            return False
+        self._refreshed_at = time.time()
+        self._refreshes += 1
+        if not registry:
+            return False
+        version = catalog_version(registry)
+        if version == self.version:
+            return False
+        try:
+            if self._on_change:
+                self._on_change(registry, version)
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Failed to apply workshop catalog {version}, keeping {self.version}: {e}")
+            return False
+        logger.info(f"✓ Workshop catalog changed ({self.version} -> {version}, {len(registry)} workshops)")
+        self.registry = registry
+        self.version = version
+        self._changes += 1
+        return True
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def current_version(self):
+        """Content hash of the catalog in use."""
+        self._ensure_started()
+        return self.version
+
+    def stats(self):
+        """Catalog version and reload health (for /system_status)."""
+        self._ensure_started()
+        return {
+            "version": self.version,
+            "workshops": len(self.registry),
+            "refresh_interval_seconds": self.refresh_interval,
+            "age_seconds": round(time.time() - self._refreshed_at, 1) if self._refreshed_at else None,
+            "refreshes": self._refreshes,
+            "changes": self._changes,
+            "errors": self._errors,
+        }
@@ -0,0 +1,75 @@
+"""
+Layer Latency Module - Per-Layer Timing for the Protection Pipeline
+
+Records how long each protection layer adds to a request, keeping the most
+recent samples per layer in a bounded ring buffer, and reports p50/p99 in
+milliseconds for /system_status.
+
+Usage:
+    with layer_latency.timed("ip"):
+        ip_allowed = check_and_update_ip_rate_limit(client_ip)
+
+    future = pool.submit(layer_latency.call, "ip", check_and_update_ip_rate_limit, client_ip)
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class LayerLatency:
+    """
+    Rolling latency samples per protection layer.
+
+    Args:
+        max_samples (int): Samples kept per layer (older ones are dropped)
+    """
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, layer, seconds):
+        with self._lock:
+            if layer not in self._samples:
+                self._samples[layer] = deque(maxlen=self.max_samples)
+                self._counts[layer] = 0
+            self._samples[layer].append(seconds)
+            self._counts[layer] += 1
+
+    @contextmanager
+    def timed(self, layer):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(layer, time.perf_counter() - start)
+
+    def call(self, layer, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs), recording its duration under `layer` (for thread pools)."""
+        with self.timed(layer):
+            return fn(*args, **kwargs)
+
+    def stats(self):
+        """{layer: {count, p50_ms, p99_ms}} over the retained samples."""
+        with self._lock:
+            snapshot = {layer: (sorted(samples), self._counts[layer]) for layer, samples in self._samples.items()}
+        return {
+            layer: {
+                "count": count,
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            }
+            for layer, (samples, count) in snapshot.items()
+        }
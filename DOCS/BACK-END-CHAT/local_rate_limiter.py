@@ -0,0 +1,178 @@
+"""
+Local Rate Limiter Module - In-Process Tier for Per-Endpoint Limits
+
+Decides most rate-limit checks in memory and only syncs with the shared
+Firestore shard counters (rate_limit_shards) on a time or count interval.
+
+Each instance keeps, per endpoint and minute window:
+- global_count: the cluster-wide count seen at the last sync
+- in_flight:    requests currently being flushed to Firestore
+- pending:      requests admitted locally since the last sync
+
+The local estimate (global_count + in_flight + pending) is compared against
+the per-minute limit. Far from the limit an instance syncs every sync_batch
+admitted requests (or sync_interval seconds); once its estimate is within
+`tolerance` of the limit, every admitted request syncs. Other instances'
+admissions are only seen at a sync, so each instance can overshoot by at most
+one batch (batch_fraction of the limit, 5 of 20 by default).
+
+Once a sync reports the key at or over the limit, the rest of the window is
+rejected in memory: a fixed-window count never goes down, so rejected
+requests (the bulk of traffic under load) never touch Firestore.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _WindowState:
+    """Per-endpoint counters for the current minute window."""
+    __slots__ = ("window", "global_count", "in_flight", "pending", "last_sync", "syncing")
+
+    def __init__(self, window):
+        self.window = window
+        self.global_count = 0
+        self.in_flight = 0
+        self.pending = 0
+        self.last_sync = 0.0
+        self.syncing = False
+
+    def estimate(self):
+        return self.global_count + self.in_flight + self.pending
+
+
+class LocalRateLimiter:
+    """
+    Per-instance, per-endpoint fixed-window limiter backed by periodic syncs.
+
+    Args:
+        limit (int): Maximum requests per minute window (cluster-wide)
+        sync_fn: Callable(key, window, delta) -> int. Adds `delta` to the shared
+                 counter for (key, window) and returns the new cluster-wide total.
+        tolerance (float): Fraction of `limit` near the limit where every admitted
+                           request syncs (e.g. 0.1 = 10%, at least 1 request)
+        sync_interval (float): Maximum seconds between syncs per endpoint
+        batch_fraction (float): Fraction of `limit` admitted locally between syncs
+                                while far from the limit (never below the tolerance)
+    """
+
+    def __init__(self, limit, sync_fn, tolerance=0.1, sync_interval=5.0, batch_fraction=0.25):
+        self.limit = limit
+        self.sync_fn = sync_fn
+        self.sync_every = max(1, int(limit * tolerance))
+        self.sync_batch = max(self.sync_every, int(limit * batch_fraction))
+        self.sync_interval = sync_interval
+        self._states = {}
+        self._lock = threading.Lock()
+
+        # Drift metrics: difference between the local estimate and the
+        # cluster-wide count returned by a sync
+        self._last_drift = {}
+        self._max_drift = {}
+        self._syncs = 0
+        self._local_decisions = 0
+        self._local_rejections = 0
+        self._sync_errors = 0
+
+    def allow(self, key, window):
+        """
+        Decide whether a request for `key` in minute `window` is allowed.
+        Returns True if allowed, False if the per-minute limit is reached.
+        """
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or state.window != window:
+                # New minute: counts from the previous window no longer matter
+                state = _WindowState(window)
+                self._states[key] = state
+
+            if state.global_count >= self.limit:
+                # A sync confirmed the window is full and it can only grow until the next window
+                self._local_decisions += 1
+                self._local_rejections += 1
+                return False
+
+            now = time.monotonic()
+            must_sync = not state.syncing and (
+                state.pending >= self.sync_batch
+                or now - state.last_sync >= self.sync_interval
+                or self.limit - state.estimate() <= self.sync_every
+            )
+
+            if not must_sync:
+                self._local_decisions += 1
+                if state.estimate() >= self.limit:
+                    self._local_rejections += 1
+                    return False
+                state.pending += 1
+                return True
+
+            # This request performs the sync; concurrent requests keep deciding locally
+            state.syncing = True
+            delta = state.pending + 1
+            state.pending = 0
+            state.in_flight = delta
+            estimate_before = state.global_count + delta
+
+            if estimate_before > self.limit:
+                # Over the limit locally - flush what we have without admitting this request
+                delta -= 1
+                state.in_flight = delta
+                estimate_before -= 1
+                admitted = False
+            else:
+                admitted = True
+
+        total = None
+        try:
+            total = self.sync_fn(key, window, delta)
+        except Exception as e:
+            logger.error(f"Local rate limiter sync failed for '{key}': {e}")
+
+        with self._lock:
+            state.syncing = False
+            state.last_sync = time.monotonic()
+            state.in_flight = 0
+
+            if total is None:
+                # Keep the unsynced requests so the next sync retries them
+                self._sync_errors += 1
+                state.pending += delta
+                return admitted  # Fail open on errors
+
+            self._syncs += 1
+            state.global_count = total
+            drift = total - estimate_before
+            self._last_drift[key] = drift
+            if abs(drift) > abs(self._max_drift.get(key, 0)):
+                self._max_drift[key] = drift
+
+            if admitted and total > self.limit:
+                logger.warning(f"LOCAL LIMITER OVERSHOOT for '{key}': {total}/{self.limit} after sync (drift {drift}).")
+
+            return admitted
+
+    def reset(self):
+        """Forget every window (after /admin/restore_system clears the shared counters)."""
+        with self._lock:
+            self._states.clear()
+
+    def stats(self):
+        """Snapshot of sync counts and drift per endpoint (for /system_status)."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "sync_every": self.sync_every,
+                "sync_batch": self.sync_batch,
+                "sync_interval_seconds": self.sync_interval,
+                "local_decisions": self._local_decisions,
+                "local_rejections": self._local_rejections,
+                "syncs": self._syncs,
+                "sync_errors": self._sync_errors,
+                "last_drift": dict(self._last_drift),
+                "max_drift": dict(self._max_drift),
+                "estimates": {key: state.estimate() for key, state in self._states.items()},
+            }
@@ -3,7 +3,6 @@ import sys
 import logging
 import threading
 import re
-import random
 import json
 import hashlib
 import hmac  # NEW: For fingerprint signature validation
@@ -19,6 +18,7 @@ import requests  # NEW: For server-to-server API calls to Portal Backend
 # NEW: Firestore for rate limiting
 from google.cloud import firestore
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # NEW: Import TTS Service (direct import, no dot)
 import tts_service
@@ -26,8 +26,16 @@ import tts_service
 # NEW: Import Stripe for payment processing
 import stripe
 
-# NEW: Import Firestore Session Manager
-from session_manager import FirestoreSessionManager
+from session_cache import WriteBehindSessionCache, WriteThroughSessionManager
+from booking_state import BookingState
+from session_counter import ActiveSessionCounter
+from prompt_template import ChatPromptTemplate
+from context_cache import PromptContextCache
+from token_budget import TokenBudget
+from knowledge_base import WorkshopCatalog, render_knowledge_base, render_info_snippets
+from session_store import (
+    FirestoreSessionStore, MemorySessionStore, SqliteSessionStore, BACKENDS as SESSION_BACKENDS
+)
 
 # Knowledge base integrated directly into WORKSHOP_REGISTRY (see build_prompt method)
 
@@ -37,6 +45,46 @@ from security_monitor import security_monitor
 # NEW: Import Story Engine for interactive narrative feature
 from story_engine import StoryEngine
 
+# Import in-process rate limit tier (decides locally, syncs with Firestore shards)
+from local_rate_limiter import LocalRateLimiter
+
+# Import locally cached circuit breaker state (snapshot listener + polling fallback)
+from circuit_breaker_cache import CircuitBreakerCache
+
+# Import query-free sharded counter reads (deterministic shard IDs)
+import shard_counter
+from shard_counter import ShardedCounter
+
+# Import count-min sketch front for per-IP limiting (fixed memory per instance)
+from ip_sketch import IpSketchLimiter
+
+# Import GCRA limiter (exact per-key limits, one document per key)
+from gcra_limiter import GcraLimiter
+
+# Import replicated fingerprint ban list (Bloom filter + TTL map)
+from ban_cache import BanListCache
+
+# Import verified-signature cache for Layer 6
+from signature_cache import SignatureCache
+
+# Import compiled User-Agent bot signature matcher (bounded verdict cache)
+from user_agent_classifier import UserAgentClassifier
+
+# Import long-lived signed session tokens (issued by /sign-fingerprint)
+from session_token import issue_session_token, verify_session_token
+
+# Import background bulk purge for /admin/restore_system
+from bulk_purge import PurgeJob
+
+# Import per-layer latency tracking (p50/p99 in /system_status)
+from layer_latency import LayerLatency
+
+# Import pluggable counter backend (Firestore, in-memory or SQLite)
+from counter_store import (
+    FirestoreCounterStore, MemoryCounterStore, SqliteCounterStore,
+    NAMESPACE_ENDPOINT, NAMESPACE_IP, BACKENDS as COUNTER_BACKENDS
+)
+
 # NEW: Import Firebase Admin SDK for Portal Firestore Access
 try:
     import firebase_admin
@@ -118,16 +166,157 @@ PLATFORM_FEE_PERCENT = float(os.getenv("PLATFORM_FEE_PERCENT", "2.5"))  # Platfo
 # =============================================================================
 # Three-Strikes Circuit Breaker & Rate Limiter Configuration
 # =============================================================================
-db = firestore.Client()
+# === COUNTER BACKEND ("firestore" = multi-instance, "memory" = one process, "sqlite" = one host) ===
+COUNTER_BACKEND = os.getenv("COUNTER_BACKEND", "firestore")
+COUNTER_SQLITE_PATH = os.getenv("COUNTER_SQLITE_PATH", "/tmp/rate_limits.sqlite3")
+if COUNTER_BACKEND not in COUNTER_BACKENDS:
+    raise ValueError(f"Unknown COUNTER_BACKEND '{COUNTER_BACKEND}' (expected one of {COUNTER_BACKENDS})")
+FIRESTORE_COUNTERS = COUNTER_BACKEND == "firestore"
+
+# Local counter backends touch no Firestore at import: shards, circuit breaker listener,
+# ban list and purge jobs are Firestore-only, and orders/customers get a client on first use
+db = firestore.Client() if FIRESTORE_COUNTERS else None
+_db_lock = threading.Lock()
+
+def get_firestore_db():
+    """Shared Firestore client for order/customer writes (created lazily with local counter backends)."""
+    global db
+    if db is None:
+        with _db_lock:
+            if db is None:
+                db = firestore.Client()
+    return db
+
 RATE_LIMIT_COLLECTION = "rate_limit_shards"
-CIRCUIT_BREAKER_DOC = db.collection("system_status").document("circuit_breaker")
-NUM_SHARDS = 10  # Distribute writes across 10 documents
+CIRCUIT_BREAKER_DOC = db.collection("system_status").document("circuit_breaker") if FIRESTORE_COUNTERS else None
+NUM_SHARDS = 10  # Distribute writes across 10 documents (starting count when adaptive)
+SHARD_ADAPTIVE_ENABLED = os.getenv("SHARD_ADAPTIVE_ENABLED", "true").lower() == "true"  # Per-key shard counts from load (endpoint + GLOBAL counters)
+SHARD_MAX = int(os.getenv("SHARD_MAX", "50"))
+SHARD_WRITES_PER_SECOND = float(os.getenv("SHARD_WRITES_PER_SECOND", "1"))  # Sustained write budget per shard document
+SHARD_READ_MODE = os.getenv("SHARD_READ_MODE", "get_all")  # "get_all" (known refs) or "aggregate" (server-side sum)
 MAX_REQUESTS_PER_MINUTE = 20  # Global limit for /chat and /tts endpoints
+GLOBAL_MAX_REQUESTS_PER_MINUTE = 200  # All endpoints combined (potential DDoS above this)
 STRIKE_LIMIT = 3  # Hard lockdown after 3 strikes
+CIRCUIT_BREAKER_MAX_STALENESS_SECONDS = float(os.getenv("CIRCUIT_BREAKER_MAX_STALENESS_SECONDS", "2"))
+circuit_breaker_cache = CircuitBreakerCache(
+    CIRCUIT_BREAKER_DOC, max_staleness=CIRCUIT_BREAKER_MAX_STALENESS_SECONDS
+) if FIRESTORE_COUNTERS else None
+
+# === LOCAL RATE LIMIT TIER (per-instance, synced to rate_limit_shards) ===
+LOCAL_RATE_LIMIT_ENABLED = os.getenv("LOCAL_RATE_LIMIT_ENABLED", "true").lower() == "true"
+LOCAL_RATE_LIMIT_TOLERANCE = float(os.getenv("LOCAL_RATE_LIMIT_TOLERANCE", "0.1"))  # Fraction of limit decided locally between syncs
+LOCAL_RATE_LIMIT_SYNC_SECONDS = float(os.getenv("LOCAL_RATE_LIMIT_SYNC_SECONDS", "5"))  # Max seconds between syncs per endpoint
+LOCAL_RATE_LIMIT_BATCH = float(os.getenv("LOCAL_RATE_LIMIT_BATCH", "0.25"))  # Fraction of limit admitted locally between syncs when far from it
 
 # === NEW: IP-BASED RATE LIMITING CONFIGURATION ===
+IP_RATE_LIMIT_COLLECTION = "ip_rate_limit_shards"
 IP_MAX_REQUESTS_PER_MINUTE = 100  # Per IP (hashed for privacy)
+
+# Sharded counters (shard IDs: "{endpoint}_{minute_window}_n", "GLOBAL_{minute_window}_n", "ip_{hash16}_{minute_window}_n")
+GLOBAL_COUNTER_TAGS = {"endpoint": "GLOBAL"}
+# Per-IP keys are numerous and individually slow, so only the endpoint/GLOBAL counter adapts
+if FIRESTORE_COUNTERS:
+    rate_limit_counter = ShardedCounter(
+        db, RATE_LIMIT_COLLECTION, NUM_SHARDS, ttl_minutes=2, read_mode=SHARD_READ_MODE,
+        adaptive=SHARD_ADAPTIVE_ENABLED, max_shards=SHARD_MAX, writes_per_shard=SHARD_WRITES_PER_SECOND
+    )
+    ip_rate_limit_counter = ShardedCounter(db, IP_RATE_LIMIT_COLLECTION, NUM_SHARDS, ttl_minutes=5, read_mode=SHARD_READ_MODE)
+    counter_store = FirestoreCounterStore(db, {
+        NAMESPACE_ENDPOINT: rate_limit_counter,
+        NAMESPACE_IP: ip_rate_limit_counter
+    }, CIRCUIT_BREAKER_DOC, circuit_breaker_cache)
+else:
+    rate_limit_counter = ip_rate_limit_counter = None
+    if COUNTER_BACKEND == "memory":
+        counter_store = MemoryCounterStore()
+    else:
+        counter_store = SqliteCounterStore(COUNTER_SQLITE_PATH)
+    # The local tier only exists to save Firestore round trips
+    LOCAL_RATE_LIMIT_ENABLED = False
+
+# === IP COUNT-MIN SKETCH (only IPs near the limit get exact Firestore counting) ===
+IP_SKETCH_ENABLED = os.getenv("IP_SKETCH_ENABLED", "true").lower() == "true"
+IP_SKETCH_COLLECTION = "ip_rate_limit_sketches"
+IP_SKETCH_PROMOTE_THRESHOLD = int(IP_MAX_REQUESTS_PER_MINUTE * float(os.getenv("IP_SKETCH_PROMOTE_RATIO", "0.5")))
+IP_SKETCH_WIDTH = int(os.getenv("IP_SKETCH_WIDTH", "2048"))
+IP_SKETCH_DEPTH = int(os.getenv("IP_SKETCH_DEPTH", "4"))
+IP_SKETCH_MERGE_SECONDS = float(os.getenv("IP_SKETCH_MERGE_SECONDS", "10"))
+ip_sketch = IpSketchLimiter(
+    promote_threshold=IP_SKETCH_PROMOTE_THRESHOLD,
+    collection=db.collection(IP_SKETCH_COLLECTION) if FIRESTORE_COUNTERS else None,
+    width=IP_SKETCH_WIDTH,
+    depth=IP_SKETCH_DEPTH,
+    merge_interval=IP_SKETCH_MERGE_SECONDS
+) if IP_SKETCH_ENABLED else None
+# Promoted IPs are counted exactly against the full per-minute limit: the first exact write of
+# each instance is seeded with that instance's sketch count (ip_sketch.pending_seed). Before
+# the next merge, K instances can each admit an IP up to the threshold (see ip_sketch.py)
 FINGERPRINT_SECRET = os.getenv("FINGERPRINT_SECRET")
+FINGERPRINT_SIGNATURE_MAX_AGE_SECONDS = 120
+SIGNATURE_CACHE_ENABLED = os.getenv("SIGNATURE_CACHE_ENABLED", "true").lower() == "true"
+REJECT_CROSS_IP_SIGNATURE_REPLAYS = os.getenv("REJECT_CROSS_IP_SIGNATURE_REPLAYS", "false").lower() == "true"
+signature_cache = SignatureCache(window_seconds=FINGERPRINT_SIGNATURE_MAX_AGE_SECONDS) if SIGNATURE_CACHE_ENABLED else None
+SESSION_TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", "1800"))  # Matches the 30-minute session TTL
+
+# === RATE LIMIT ALGORITHM ("sharded" = fixed-minute shards, "gcra" = one TAT document per key) ===
+RATE_LIMIT_ALGORITHM = os.getenv("RATE_LIMIT_ALGORITHM", "sharded")
+GCRA_COLLECTION = "rate_limit_gcra"
+GCRA_ENABLED = RATE_LIMIT_ALGORITHM == "gcra" and FIRESTORE_COUNTERS
+if GCRA_ENABLED:
+    endpoint_gcra = GcraLimiter(db, GCRA_COLLECTION, MAX_REQUESTS_PER_MINUTE)
+    ip_gcra = GcraLimiter(db, GCRA_COLLECTION, IP_MAX_REQUESTS_PER_MINUTE)
+    # GLOBAL stays on the sharded counters: every request would write its single TAT document
+    # (~3.3 writes/s at 200/min, above Firestore's ~1/s per document), and a limiter that
+    # fails open after repeated write conflicts would vanish exactly during a flood
+    LOCAL_RATE_LIMIT_ENABLED = False  # GCRA is already exact - no local tier in front of it
+
+# === BATCHED PROTECTION PIPELINE (one get_all + one WriteBatch per request, sharded mode only) ===
+PROTECTION_PIPELINE_ENABLED = os.getenv("PROTECTION_PIPELINE_ENABLED", "true").lower() == "true" and FIRESTORE_COUNTERS and not GCRA_ENABLED
+
+# === FINGERPRINT BAN LIST CACHE (local lookups for unauthenticated_bans) ===
+# Off by default: security_monitor still queries bans itself for every fingerprint, so the
+# cache only short-circuits banned fingerprints (see ban_cache.py). The ban document shape
+# is owned by security_monitor; adjust the field settings if it differs.
+UNAUTHENTICATED_BANS_COLLECTION = os.getenv("BAN_COLLECTION", "unauthenticated_bans")
+BAN_CACHE_ENABLED = os.getenv("BAN_CACHE_ENABLED", "false").lower() == "true"
+BAN_DURATION_SECONDS = 3600  # Strike 1 ban issued by security_monitor (1 hour)
+# The ban list is only read through the Firestore listener, so local counter backends skip it
+ban_cache = BanListCache(
+    db.collection(UNAUTHENTICATED_BANS_COLLECTION),
+    capacity=int(os.getenv("BAN_CACHE_CAPACITY", "10000")),
+    error_rate=float(os.getenv("BAN_CACHE_ERROR_RATE", "0.01")),
+    expiry_field=os.getenv("BAN_EXPIRY_FIELD", "ban_expires"),
+    fingerprint_field=os.getenv("BAN_FINGERPRINT_FIELD") or None  # Unset = document ID is the fingerprint
+) if BAN_CACHE_ENABLED and FIRESTORE_COUNTERS else None
+
+# === BACKGROUND PURGE (/admin/restore_system, Firestore counters only) ===
+PURGE_STATUS_DOC = db.collection("system_status").document("purge_job") if FIRESTORE_COUNTERS else None
+# The default background thread needs Cloud Run CPU always allocated; with request-based CPU
+# set this to purge inside the request, or run bulk_purge.py as a Cloud Run Job (see bulk_purge.py)
+PURGE_IN_REQUEST = os.getenv("PURGE_IN_REQUEST", "false").lower() == "true"
+_purge_job = None
+_purge_job_lock = threading.Lock()
+
+# === CONCURRENT PROTECTION LAYERS (independent checks fanned out on a thread pool) ===
+# Only used when the batched pipeline is off (PROTECTION_PIPELINE_ENABLED=false, GCRA or local
+# counter backends): the pipeline already collapses every layer's reads into one get_all RPC,
+# so there is nothing left to overlap.
+PROTECTION_CONCURRENT_ENABLED = os.getenv("PROTECTION_CONCURRENT_ENABLED", "false").lower() == "true"
+PROTECTION_POOL_WORKERS = int(os.getenv("PROTECTION_POOL_WORKERS", "16"))
+if PROTECTION_CONCURRENT_ENABLED and PROTECTION_PIPELINE_ENABLED:
+    logger.warning("PROTECTION_CONCURRENT_ENABLED has no effect while the batched protection pipeline is enabled")
+layer_latency = LayerLatency()
+_protection_pool = None
+_protection_pool_lock = threading.Lock()
+
+def get_protection_pool() -> ThreadPoolExecutor:
+    """Shared pool for concurrent layer checks (created lazily so each Gunicorn worker gets its own)."""
+    global _protection_pool
+    if _protection_pool is None:
+        with _protection_pool_lock:
+            if _protection_pool is None:
+                _protection_pool = ThreadPoolExecutor(max_workers=PROTECTION_POOL_WORKERS, thread_name_prefix="protection")
+    return _protection_pool
 
 # =============================================================================
 # LAYER 0: IP-BASED RATE LIMITING FUNCTIONS
@@ -152,37 +341,49 @@ def check_and_update_ip_rate_limit(client_ip: str) -> bool:
 
     Threshold: 100 requests per minute per IP
     Rationale: Generous to handle shared IPs (offices, VPNs)
+
+    With IP_SKETCH_ENABLED, IPs are first counted in a per-instance count-min sketch
+    and only promoted to the Firestore shards once their estimate nears the limit.
     """
     if not client_ip:
         return True  # No IP = allow (fail open)
 
     try:
-        IP_LIMIT_COLLECTION = "ip_rate_limit_shards"
-
         # Hash the IP for privacy (IMPORTANT!)
         hashed_ip = hashlib.sha256(client_ip.encode()).hexdigest()
-
-        shards_ref = db.collection(IP_LIMIT_COLLECTION)
-        current_minute = datetime.now().replace(second=0, microsecond=0)
-        current_minute_window = int(current_minute.timestamp())
-
-        # Read current count for this IP
-        query = shards_ref.where("ip_hash", "==", hashed_ip).where("minute_window", "==", current_minute_window)
-        initial_count = sum(shard.to_dict().get("count", 0) for shard in query.stream())
+        ip_key, ip_tags = f"ip_{hashed_ip[:16]}", {"ip_hash": hashed_ip}
+        _, current_minute_window = shard_counter.current_minute_window()
+
+        # Sketch front: IPs well below the limit never touch Firestore
+        if ip_sketch and not ip_sketch.should_promote(hashed_ip, current_minute_window):
+            ip_sketch.add(hashed_ip, current_minute_window)
+            return True
+
+        # Requests this instance admitted through the sketch enter the exact count once
+        seed = ip_sketch.pending_seed(hashed_ip, current_minute_window) if ip_sketch else 0
+
+        # GCRA: exact sliding limit, one conditional write on this IP's document
+        if GCRA_ENABLED:
+            allowed = ip_gcra.allow(ip_key, cost=1 + seed)
+            if not allowed:
+                logger.warning(f"IP RATE LIMIT EXCEEDED: {hashed_ip[:8]}... (GCRA, limit {IP_MAX_REQUESTS_PER_MINUTE}/min exact)")
+            elif ip_sketch:
+                ip_sketch.mark_seeded(hashed_ip, current_minute_window)
+                ip_sketch.add(hashed_ip, current_minute_window)
+            return allowed
+
+        # Read current count for this IP (known shard refs, no query)
+        initial_count = counter_store.read(NAMESPACE_IP, ip_key, ip_tags, current_minute_window) + seed
 
         if initial_count >= IP_MAX_REQUESTS_PER_MINUTE:
-            logger.warning(f"IP RATE LIMIT EXCEEDED: {hashed_ip[:8]}... ({initial_count}/{IP_MAX_REQUESTS_PER_MINUTE})")
+            logger.warning(f"IP RATE LIMIT EXCEEDED: {hashed_ip[:8]}... ({initial_count}/{IP_MAX_REQUESTS_PER_MINUTE} exact)")
             return False
 
         # Optimistic write to random shard
-        shard_id = f"ip_{hashed_ip[:16]}_{random.randint(0, NUM_SHARDS - 1)}"
-
-        shards_ref.document(shard_id).set({
-            "count": firestore.Increment(1),
-            "minute_window": current_minute_window,
-            "ip_hash": hashed_ip,
-            "ttl": current_minute + timedelta(minutes=5)
-        }, merge=True)
+        counter_store.increment(NAMESPACE_IP, ip_key, ip_tags, current_minute_window, amount=1 + seed)
+        if ip_sketch:
+            ip_sketch.mark_seeded(hashed_ip, current_minute_window)
+            ip_sketch.add(hashed_ip, current_minute_window)
 
         return True
 
@@ -195,6 +396,23 @@ def check_and_update_ip_rate_limit(client_ip: str) -> bool:
 # BOT DETECTION FUNCTIONS
 # =============================================================================
 
+# Known bot signatures in User-Agent (comma-separated overrides via env)
+DEFAULT_BOT_SIGNATURES = [
+    'curl', 'wget', 'python', 'java', 'go-http-client', 'node',
+    'postman', 'insomnia', 'paw', 'restclient',
+    'bot', 'crawler', 'spider', 'scraper', 'monitoring',
+    'apache-httpclient', 'okhttp', 'urllib', 'httpx'
+]
+BOT_SIGNATURES = tuple(sig.strip().lower() for sig in os.getenv("BOT_SIGNATURES", ",".join(DEFAULT_BOT_SIGNATURES)).split(",") if sig.strip())
+BOT_ALLOWED_SIGNATURES = tuple(sig.strip().lower() for sig in os.getenv("BOT_ALLOWED_SIGNATURES", "stripe").split(",") if sig.strip())
+BOT_VERDICT_CACHE_SIZE = int(os.getenv("BOT_VERDICT_CACHE_SIZE", "4096"))
+BOT_VERDICT_MAX_UA_LENGTH = int(os.getenv("BOT_VERDICT_MAX_UA_LENGTH", "512"))  # Longer User-Agents are not cached
+# Signatures are compiled into one regex; verdicts are cached per User-Agent (see user_agent_classifier.py)
+user_agent_classifier = UserAgentClassifier(
+    BOT_SIGNATURES, BOT_ALLOWED_SIGNATURES,
+    cache_size=BOT_VERDICT_CACHE_SIZE, max_cached_length=BOT_VERDICT_MAX_UA_LENGTH
+)
+
 def is_bot_request(request_obj) -> bool:
     """
     Detect bot requests using multiple signals.
@@ -211,21 +429,10 @@ def is_bot_request(request_obj) -> bool:
         logger.warning(f"BOT DETECTED: Missing required headers. IP: {get_client_ip(request_obj)}")
         return True
 
-    # Check 2: Known bot signatures in User-Agent
-    user_agent = request_obj.headers.get('User-Agent', '').lower()
-    bot_signatures = [
-        'curl', 'wget', 'python', 'java', 'go-http-client', 'node',
-        'postman', 'insomnia', 'paw', 'restclient',
-        'bot', 'crawler', 'spider', 'scraper', 'monitoring',
-        'apache-httpclient', 'okhttp', 'urllib', 'httpx'
-    ]
-
-    # EXCEPTION: Allow Stripe User-Agent
-    if 'stripe' in user_agent:
-        return False  # Not a bot, it's Stripe
-
-    if any(sig in user_agent for sig in bot_signatures):
-        logger.warning(f"BOT DETECTED: Signature in User-Agent '{user_agent}'. IP: {get_client_ip(request_obj)}")
+    # Check 2: Known bot signatures in User-Agent (compiled matcher + verdict cache)
+    signature = user_agent_classifier.classify(request_obj.headers.get('User-Agent', ''))
+    if signature:
+        logger.debug(f"Bot request rejected ('{signature}'). IP: {get_client_ip(request_obj)}")
         return True
 
     return False
@@ -235,12 +442,15 @@ def is_bot_request(request_obj) -> bool:
 # LAYER 6: FINGERPRINT SIGNATURE VALIDATION
 # =============================================================================
 
-def verify_fingerprint_signature(device_fingerprint: str, signature: str, timestamp_str: str) -> bool:
+def verify_fingerprint_signature(device_fingerprint: str, signature: str, timestamp_str: str, client_ip: Optional[str] = None) -> bool:
     """
     Verify that a device fingerprint was signed by legitimate frontend.
     Prevents fingerprint spoofing (Layer 6).
 
-    Uses HMAC-SHA256 with timestamp-based replay protection.
+    Uses HMAC-SHA256 with timestamp-based replay protection. Triples that already
+    verified are remembered for the validity window (signature_cache), so repeat
+    requests from the same tab skip the HMAC; with REJECT_CROSS_IP_SIGNATURE_REPLAYS
+    the same triple presented from a different IP is rejected.
     """
     if not all([FINGERPRINT_SECRET, device_fingerprint, signature, timestamp_str]):
         logger.debug("Fingerprint signature verification: Missing required fields")
@@ -251,10 +461,19 @@ def verify_fingerprint_signature(device_fingerprint: str, signature: str, timest
         current_time = int(time.time())
 
         # Reject stale signatures (older than 2 minutes)
-        if abs(current_time - timestamp) > 120:
+        if abs(current_time - timestamp) > FINGERPRINT_SIGNATURE_MAX_AGE_SECONDS:
             logger.warning(f"Stale fingerprint signature rejected (age: {abs(current_time - timestamp)}s)")
             return False
 
+        # Already verified within the window? Skip the HMAC
+        if signature_cache:
+            cached = signature_cache.lookup(device_fingerprint, timestamp, signature, client_ip)
+            if cached is not None:
+                if not cached and REJECT_CROSS_IP_SIGNATURE_REPLAYS:
+                    logger.warning(f"Fingerprint signature replayed from a different IP rejected. IP: {client_ip}")
+                    return False
+                return True
+
         # Reconstruct what the signature should be
         data_to_sign = f"{device_fingerprint}:{timestamp}".encode('utf-8')
         expected_signature = hmac.new(
@@ -267,7 +486,9 @@ def verify_fingerprint_signature(device_fingerprint: str, signature: str, timest
         is_valid = hmac.compare_digest(signature, expected_signature)
 
         if not is_valid:
-            logger.warning(f"Invalid fingerprint signature detected. IP: {get_client_ip(request)}")
+            logger.warning(f"Invalid fingerprint signature detected. IP: {client_ip or get_client_ip(request)}")
+        elif signature_cache:
+            signature_cache.add(device_fingerprint, timestamp, signature, client_ip)
 
         return is_valid
 
@@ -280,10 +501,11 @@ def check_circuit_breaker():
     """
     Fast, read-only check: Is the system in a hard-locked state?
     Returns True if locked_down is True (system is locked), False otherwise.
+    With the Firestore backend this reads the in-memory copy kept current by the
+    snapshot listener (no Firestore read).
     """
     try:
-        status_doc = CIRCUIT_BREAKER_DOC.get()
-        if status_doc.exists and status_doc.to_dict().get("locked_down") is True:
+        if counter_store.is_locked_down():
             logger.critical("CIRCUIT BREAKER TRIPPED. System is in lockdown mode.")
             return True  # System IS locked
     except Exception as e:
@@ -298,44 +520,12 @@ def record_strike():
     This is only called when the per-minute rate limit is breached.
     """
     try:
-        @firestore.transactional
-        def update_in_transaction(transaction):
-            # Get current circuit breaker state
-            snapshot = CIRCUIT_BREAKER_DOC.get(transaction=transaction)
-
-            if not snapshot.exists:
-                # First strike ever - create the document
-                transaction.set(CIRCUIT_BREAKER_DOC, {
-                    "strike_count": 1,
-                    "last_strike_timestamp": firestore.SERVER_TIMESTAMP,
-                    "locked_down": False
-                })
-                logger.warning("RATE LIMIT BREACH DETECTED: Recorded Strike 1.")
-                return 1
-
-            # Get current strike count
-            current_data = snapshot.to_dict()
-            current_strikes = current_data.get("strike_count", 0)
-            new_strikes = current_strikes + 1
-
-            # Prepare update
-            update_data = {
-                "strike_count": firestore.Increment(1),
-                "last_strike_timestamp": firestore.SERVER_TIMESTAMP
-            }
-
-            # If this is the third strike, trip the breaker
-            if new_strikes >= STRIKE_LIMIT:
-                update_data["locked_down"] = True
-                logger.critical(f"RATE LIMIT BREACH: Recorded Strike {new_strikes}. CIRCUIT BREAKER TRIPPED! System locked.")
-            else:
-                logger.warning(f"RATE LIMIT BREACH DETECTED: Recorded Strike {new_strikes}/{STRIKE_LIMIT}.")
-
-            transaction.update(CIRCUIT_BREAKER_DOC, update_data)
-            return new_strikes
-
-        transaction = db.transaction()
-        return update_in_transaction(transaction)
+        new_strikes = counter_store.record_strike(STRIKE_LIMIT)
+        if new_strikes >= STRIKE_LIMIT:
+            logger.critical(f"RATE LIMIT BREACH: Recorded Strike {new_strikes}. CIRCUIT BREAKER TRIPPED! System locked.")
+        else:
+            logger.warning(f"RATE LIMIT BREACH DETECTED: Recorded Strike {new_strikes}/{STRIKE_LIMIT}.")
+        return new_strikes
     except Exception as e:
         logger.error(f"Failed to record strike: {e}")
 
@@ -386,19 +576,30 @@ def check_and_update_rate_limit(endpoint_name: str):
     Uses optimistic locking: reads current count, writes atomically, then re-reads to catch
     bursts of parallel requests. This prevents the race condition where 20 parallel requests
     all read count=0, all pass check, then all write simultaneously.
+
+    When LOCAL_RATE_LIMIT_ENABLED, the decision is made by the in-process tier instead,
+    which only syncs with the shards every few requests/seconds (see local_rate_limiter.py).
+    When RATE_LIMIT_ALGORITHM is "gcra", the exact GCRA limiter decides (see gcra_limiter.py).
     """
-    shards_ref = db.collection(RATE_LIMIT_COLLECTION)
-    current_minute = datetime.now().replace(second=0, microsecond=0)
-    current_minute_window = int(current_minute.timestamp())
+    # GCRA: exact sliding limit, no window-edge bursts
+    if GCRA_ENABLED:
+        if not endpoint_gcra.allow(endpoint_name):
+            logger.warning(f"PER-MINUTE RATE LIMIT EXCEEDED for endpoint '{endpoint_name}' (GCRA, limit {MAX_REQUESTS_PER_MINUTE}).")
+            return False
+        return True
 
-    # STEP 1: Initial read of current count
-    query = shards_ref.where("endpoint", "==", endpoint_name).where("minute_window", "==", current_minute_window)
-    shards = list(query.stream())
+    _, current_minute_window = shard_counter.current_minute_window()
+    endpoint_tags = {"endpoint": endpoint_name}
 
-    initial_count = 0
-    for shard in shards:
-        if shard.exists:
-            initial_count += shard.to_dict().get("count", 0)
+    # Local tier: decide in memory, syncing with the shards on an interval
+    if local_rate_limiter:
+        if not local_rate_limiter.allow(endpoint_name, current_minute_window):
+            logger.warning(f"PER-MINUTE RATE LIMIT EXCEEDED for endpoint '{endpoint_name}' (local tier, limit {MAX_REQUESTS_PER_MINUTE}).")
+            return False
+        return True
+
+    # STEP 1: Initial read of current count
+    initial_count = counter_store.read(NAMESPACE_ENDPOINT, endpoint_name, endpoint_tags, current_minute_window)
 
     # If we've hit the per-minute limit for this specific endpoint, reject immediately
     if initial_count >= MAX_REQUESTS_PER_MINUTE:
@@ -406,25 +607,12 @@ def check_and_update_rate_limit(endpoint_name: str):
         return False  # Limit exceeded
 
     # STEP 2: Optimistic increment - write to a random shard
-    shard_id = f"{endpoint_name}_{random.randint(0, NUM_SHARDS - 1)}"
-    shard_ref = shards_ref.document(shard_id)
-
-    shard_ref.set({
-        "count": firestore.Increment(1),
-        "minute_window": current_minute_window,
-        "endpoint": endpoint_name,
-        "ttl": current_minute + timedelta(minutes=2)
-    }, merge=True)
+    counter_store.increment(NAMESPACE_ENDPOINT, endpoint_name, endpoint_tags, current_minute_window)
 
     # STEP 3: Optimistic lock check - re-read IMMEDIATELY after write
     # If other requests wrote while we were checking, we'll catch it here
     # This prevents the worst-case where all 20 parallel requests bypass the limit
-    shards_after = list(shards_ref.where("endpoint", "==", endpoint_name).where("minute_window", "==", current_minute_window).stream())
-
-    final_count = 0
-    for shard in shards_after:
-        if shard.exists:
-            final_count += shard.to_dict().get("count", 0)
+    final_count = counter_store.read(NAMESPACE_ENDPOINT, endpoint_name, endpoint_tags, current_minute_window)
 
     # If count jumped above limit after our write, we're accepting a burst but logging it
     if final_count > MAX_REQUESTS_PER_MINUTE:
@@ -434,59 +622,188 @@ def check_and_update_rate_limit(endpoint_name: str):
     logger.info(f"Request allowed for '{endpoint_name}'. Current count: {final_count}/{MAX_REQUESTS_PER_MINUTE}.")
     return True  # Request allowed
 
+def sync_endpoint_shards(endpoint_name: str, minute_window: int, delta: int) -> int:
+    """
+    Sync callback for the local rate limit tier.
+    Adds `delta` locally-admitted requests to a random shard (one write), then
+    returns the cluster-wide count for this endpoint and minute window.
+    """
+    endpoint_tags = {"endpoint": endpoint_name}
+    if delta > 0:
+        counter_store.increment(NAMESPACE_ENDPOINT, endpoint_name, endpoint_tags, minute_window, amount=delta)
+    return counter_store.read(NAMESPACE_ENDPOINT, endpoint_name, endpoint_tags, minute_window)
+
+local_rate_limiter = LocalRateLimiter(
+    limit=MAX_REQUESTS_PER_MINUTE,
+    sync_fn=sync_endpoint_shards,
+    tolerance=LOCAL_RATE_LIMIT_TOLERANCE,
+    sync_interval=LOCAL_RATE_LIMIT_SYNC_SECONDS,
+    batch_fraction=LOCAL_RATE_LIMIT_BATCH
+) if LOCAL_RATE_LIMIT_ENABLED else None
+
+def reset_local_limits():
+    """
+    Drops this instance's in-process limiter state (local tier windows, IP sketch,
+    signature cache) after an admin restore. Other instances run it when their
+    circuit breaker cache sees the new last_restore_timestamp.
+    """
+    if local_rate_limiter:
+        local_rate_limiter.reset()
+    if ip_sketch:
+        ip_sketch.reset()
+    if signature_cache:
+        signature_cache.clear()
+    logger.info("In-process rate limit state reset after system restore.")
+
+if circuit_breaker_cache:
+    circuit_breaker_cache.on_restore = reset_local_limits
+
 def increment_global_counter():
     """
     Increments GLOBAL request counter (all endpoints combined).
     This runs on EVERY request regardless of whether it passes or fails Layer 1/2/3.
     Uses non-transactional write to avoid contention with other transactions.
+    (GLOBAL uses the sharded counters under every RATE_LIMIT_ALGORITHM.)
     """
-    shards_ref = db.collection(RATE_LIMIT_COLLECTION)
-    current_minute = datetime.now().replace(second=0, microsecond=0)
-    current_minute_window = int(current_minute.timestamp())
+    _, current_minute_window = shard_counter.current_minute_window()
 
     # Use special "GLOBAL" endpoint tag for the global counter
-    shard_id = f"GLOBAL_{random.randint(0, NUM_SHARDS - 1)}"
-    shard_ref = shards_ref.document(shard_id)
-
     # Non-transactional write to avoid conflicts with check/update transactions
-    shard_ref.set({
-        "count": firestore.Increment(1),
-        "minute_window": current_minute_window,
-        "endpoint": "GLOBAL",  # Tag as global
-        "ttl": current_minute + timedelta(minutes=2)
-    }, merge=True)
+    counter_store.increment(NAMESPACE_ENDPOINT, "GLOBAL", GLOBAL_COUNTER_TAGS, current_minute_window)
 
-def check_global_rate_limit():
+def check_global_rate_limit(pending_increments: int = 0):
     """
     Global circuit breaker: 200 requests/minute across ALL endpoints.
     This only triggers on actual DDoS, not normal usage.
     Uses non-transactional read to avoid contention.
 
+    pending_increments: this request's own increment when the read may run before it
+    is written (concurrent path), so the count matches the sequential path.
+
     Returns True if under limit, False if exceeded.
     """
-    shards_ref = db.collection(RATE_LIMIT_COLLECTION)
-    current_minute = datetime.now().replace(second=0, microsecond=0)
-    current_minute_window = int(current_minute.timestamp())
+    _, current_minute_window = shard_counter.current_minute_window()
 
     # Get ONLY the GLOBAL shards for current minute (tagged with endpoint="GLOBAL")
     # Non-transactional read to avoid contention with other transactions
-    query = shards_ref.where("minute_window", "==", current_minute_window).where("endpoint", "==", "GLOBAL")
-    shards = query.stream()
-
-    total_requests = 0
-    for shard in shards:
-        if shard.exists:
-            total_requests += shard.to_dict().get("count", 0)
+    total_requests = counter_store.read(NAMESPACE_ENDPOINT, "GLOBAL", GLOBAL_COUNTER_TAGS, current_minute_window) + pending_increments
 
     # Global threshold: 200 requests/minute indicates potential DDoS
-    GLOBAL_MAX_REQUESTS_PER_MINUTE = 200
-
     if total_requests >= GLOBAL_MAX_REQUESTS_PER_MINUTE:
         logger.critical(f"GLOBAL rate limit exceeded: {total_requests}/{GLOBAL_MAX_REQUESTS_PER_MINUTE} requests. Potential DDoS attack.")
         return False  # Limit exceeded
 
     return True  # Under limit
 
+# =============================================================================
+# BATCHED PROTECTION PIPELINE
+# =============================================================================
+
+class ProtectionBatch:
+    """
+    Batched Firestore I/O for a single protected request.
+
+    Shard document IDs are deterministic, so every shard read apply_protection needs
+    (IP shards, GLOBAL shards, endpoint shards) is fetched with ONE get_all() up front
+    (shard_counter.read_many). Every counter increment is queued into ONE WriteBatch
+    that is committed once the request's outcome is decided.
+    (The circuit breaker is read from circuit_breaker_cache.)
+    Result: two round trips per protected request instead of up to seven.
+    """
+    def __init__(self, client_ip: Optional[str], endpoint_name: str, include_endpoint: bool = True):
+        _, self.minute_window = shard_counter.current_minute_window()
+        self.hashed_ip = hashlib.sha256(client_ip.encode()).hexdigest() if client_ip else None
+        self.endpoint_name = endpoint_name
+        self.include_endpoint = include_endpoint
+
+        self.ip_key = f"ip_{self.hashed_ip[:16]}" if self.hashed_ip else None
+        self.ip_tags = {"ip_hash": self.hashed_ip}
+        # Only IPs promoted out of the sketch need their exact shards read
+        self.ip_exact = bool(self.hashed_ip) and (ip_sketch is None or ip_sketch.should_promote(self.hashed_ip, self.minute_window))
+        self.ip_seed = ip_sketch.pending_seed(self.hashed_ip, self.minute_window) if self.ip_exact and ip_sketch else 0
+        self.endpoint_tags = {"endpoint": endpoint_name}
+
+        self.ip_count = 0
+        self.global_count = 0
+        self.endpoint_count = 0
+
+        self._batch = db.batch()
+        self._queued_writes = 0
+        self._prefetch()
+
+    def _prefetch(self):
+        """Read all shards for the current minute in one RPC."""
+        reads = [(rate_limit_counter, "GLOBAL", GLOBAL_COUNTER_TAGS)]
+        if self.ip_exact:
+            reads.append((ip_rate_limit_counter, self.ip_key, self.ip_tags))
+        if self.include_endpoint:
+            reads.append((rate_limit_counter, self.endpoint_name, self.endpoint_tags))
+
+        try:
+            totals = shard_counter.read_many(db, reads, self.minute_window)
+        except Exception as e:
+            logger.error(f"Protection prefetch failed: {e}")  # Fail open: counts stay at 0
+            return
+
+        self.global_count = totals.pop(0)
+        if self.ip_exact:
+            self.ip_count = totals.pop(0)
+        if self.include_endpoint:
+            self.endpoint_count = totals.pop(0)
+
+    def check_ip(self) -> bool:
+        """Layer 0. Returns True if allowed and queues the IP shard increment."""
+        if not self.hashed_ip:
+            return True  # No IP = allow (fail open)
+        if not self.ip_exact:
+            ip_sketch.add(self.hashed_ip, self.minute_window)
+            return True
+        ip_count = self.ip_count + self.ip_seed  # Sketch admissions not yet in the exact count
+        if ip_count >= IP_MAX_REQUESTS_PER_MINUTE:
+            logger.warning(f"IP RATE LIMIT EXCEEDED: {self.hashed_ip[:8]}... ({ip_count}/{IP_MAX_REQUESTS_PER_MINUTE} exact)")
+            return False
+        ip_rate_limit_counter.increment(self.ip_key, self.ip_tags, self.minute_window, amount=1 + self.ip_seed, batch=self._batch)
+        self._queued_writes += 1
+        if ip_sketch:
+            ip_sketch.mark_seeded(self.hashed_ip, self.minute_window)
+            ip_sketch.add(self.hashed_ip, self.minute_window)
+        return True
+
+    def increment_global(self):
+        """Queue the GLOBAL counter increment (counts every request past bot detection)."""
+        rate_limit_counter.increment("GLOBAL", GLOBAL_COUNTER_TAGS, self.minute_window, batch=self._batch)
+        self._queued_writes += 1
+        self.global_count += 1  # Include this request, as the unbatched path reads after its write
+
+    def check_global(self) -> bool:
+        """Layer 3. Returns True if under the global limit."""
+        if self.global_count >= GLOBAL_MAX_REQUESTS_PER_MINUTE:
+            logger.critical(f"GLOBAL rate limit exceeded: {self.global_count}/{GLOBAL_MAX_REQUESTS_PER_MINUTE} requests. Potential DDoS attack.")
+            return False
+        return True
+
+    def check_endpoint(self) -> bool:
+        """Layer 1. Returns True if allowed and queues the endpoint shard increment."""
+        if self.endpoint_count >= MAX_REQUESTS_PER_MINUTE:
+            logger.warning(f"PER-MINUTE RATE LIMIT EXCEEDED for endpoint '{self.endpoint_name}': {self.endpoint_count}/{MAX_REQUESTS_PER_MINUTE} requests.")
+            return False
+        rate_limit_counter.increment(self.endpoint_name, self.endpoint_tags, self.minute_window, batch=self._batch)
+        self._queued_writes += 1
+        return True
+
+    def commit(self):
+        """Commit all queued increments in one WriteBatch (no-op if nothing queued)."""
+        if not self._queued_writes:
+            return
+        try:
+            self._batch.commit()
+        except shard_counter.CONTENTION_ERRORS as e:
+            # Every batch carries a GLOBAL shard write - the hottest key is the likely cause
+            rate_limit_counter.record_contention("GLOBAL")
+            logger.error(f"Protection counter batch commit failed (contention): {e}")
+        except Exception as e:
+            logger.error(f"Protection counter batch commit failed: {e}")
+
 # =============================================================================
 # Configuration for Vertex AI (Using gemini-2.0-flash as per your instruction)
 # These will be populated by environment variables in Cloud Run
@@ -495,6 +812,26 @@ PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 LOCATION = os.getenv("VERTEX_AI_REGION", "us-central1") # Default to us-central1
 MODEL_NAME = os.getenv("VERTEX_AI_MODEL_NAME", "gemini-2.0-flash") # Explicitly set to gemini-2.0-flash
 
+# Static chat prompt prefix held server-side (see context_cache.py): CachedContent where the
+# region/model supports it, otherwise system_instruction; disabled = full prompt every turn
+PROMPT_CONTEXT_CACHE_ENABLED = os.getenv("PROMPT_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+prompt_context_cache = PromptContextCache(
+    MODEL_NAME,
+    ttl_seconds=int(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600")),
+    use_cached_content=os.getenv("PROMPT_CONTEXT_CACHE_MODE", "cached_content") == "cached_content",
+    # Defaults to the model's CachedContent minimum (2048 tokens for Gemini 2.x)
+    min_cache_tokens=int(os.getenv("PROMPT_CONTEXT_CACHE_MIN_TOKENS")) if os.getenv("PROMPT_CONTEXT_CACHE_MIN_TOKENS") else None
+) if PROMPT_CONTEXT_CACHE_ENABLED else None
+
+# Prompt token accounting (see token_budget.py): counts are calibrated against usage_metadata,
+# and chat prompts above PROMPT_TOKEN_BUDGET input tokens are trimmed before the call (0 = never trim)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+token_budget = TokenBudget(PROMPT_TOKEN_BUDGET)
+
+# Re-load the Portal workshop catalog this often (see knowledge_base.py); a changed catalog
+# re-renders the knowledge base and the chat prompt version (0 = load once at startup)
+WORKSHOP_CATALOG_REFRESH_SECONDS = int(os.getenv("WORKSHOP_CATALOG_REFRESH_SECONDS", "0"))
+
 # =============================================================================
 # Firebase Project IDs (from environment variables)
 # =============================================================================
@@ -779,12 +1116,15 @@ WORKSHOP_REGISTRY = _portal_workshops if _portal_workshops else {
 }
 
 # Legacy WORKSHOP_PRICING for backward compatibility
-WORKSHOP_PRICING = {k: {
-    'corporate': v.get('corporate') or v.get('default'),
-    'community': v.get('community') or v.get('default'),
-    'per_person': v.get('per_person', True),
-    'default': v.get('default')
-} for k, v in WORKSHOP_REGISTRY.items()}
+def build_workshop_pricing(registry):
+    return {k: {
+        'corporate': v.get('corporate') or v.get('default'),
+        'community': v.get('community') or v.get('default'),
+        'per_person': v.get('per_person', True),
+        'default': v.get('default')
+    } for k, v in registry.items()}
+
+WORKSHOP_PRICING = build_workshop_pricing(WORKSHOP_REGISTRY)
 
 # =============================================================================
 # PRODUCT PRICING (Server-side source of truth - NEVER trust frontend prices)
@@ -803,9 +1143,9 @@ PRODUCT_PRICING = {
 }
 
 # =============================================================================
-# MOON TIDE KNOWLEDGE BASE (Merged with Registry - Non-Redundant)
+# MOON TIDE KNOWLEDGE BASE (Static prose - names and prices come from WORKSHOP_REGISTRY)
 # =============================================================================
-MOON_TIDE_KNOWLEDGE_BASE = """
+MOON_TIDE_KNOWLEDGE_BASE_INTRO = """
 # Moon Tide Reconciliation
 
 ## About Us
@@ -825,37 +1165,74 @@ We are a collective of Indigenous Elders, knowledge keepers, artists, and facili
 - **Virtual Lead Time:** Material kits require 3-week lead time within Canada
 
 ## Our Workshops
+"""
 
-**Cedar Woven Bracelet** | 2 hours | $95 corp / $70 community per person
-An intricate, hands-on workshop focused on detailed artisan work. Participants learn the timeless art of cedar weaving.
-
-**Cedar Rope Bracelet with Beads** | 2 hours | $75 corp / $55 community per person
-Wonderfully accessible workshop perfect for all ages. Participants create a beautiful, durable cedar rope bracelet embellished with beads.
-
-**Weaving a Cedar Heart** | 2 hours | $95 corp / $70 community per person
-Participants transform respectfully harvested cedar into a beautiful, heart-shaped keepsake, embodying resilience and deep respect for the land.
-
-**Healing Through Medicine Pouch Making** | 2 hours | $95 corp / $70 community per person
-A sacred workshop connecting participants to ancient practices of spiritual balance. Facilitators share teachings on the four sacred medicines.
-
-**Cedar Woven Coasters** | 2 hours | $95 corp / $70 community per person
-A perfect introduction to cedar weaving. Participants create a beautiful and functional coaster set using respectfully harvested materials.
-
-**Cedar Basket Weaving** | 4 hours | $160 corp / $120 community per person
-An immersive and intensive workshop into a cherished art form. Participants learn the intricate process of creating a beautiful and functional cedar basket.
-
-**Kairos Blanket Exercise - In-Person** | 3 hours | $375 corp / $225 community per person
-A powerful interactive experience exploring the history of Indigenous peoples in Canada. In partnership with Kairos Canada, this session uses blankets to physically represent the land and historical events. Begins with a grounding song or prayer from an Elder.
-
-**Kairos Blanket Exercise - Virtual** | 3 hours | $375 corp / $225 community per person
-Live online version of the Kairos Blanket Exercise, facilitated in partnership with Kairos Canada, grounded with an opening song by an Elder.
-
-**Orange Shirt Day Awareness Beading** | 4 hours | $160 corp / $120 community per person (in-person) | $145 corp / $105 community (virtual)
-A powerful session to honor residential school survivors. Participants create beaded orange shirt pins, creating a space for reflection, solidarity, and learning. Available in-person and virtual.
-
-**MMIWG2S Awareness & Remembrance Beading** | 4 hours | $160 corp / $120 community per person (in-person) | $145 corp / $105 community (virtual)
-A profound act of remembrance and solidarity to honor our stolen sisters (Missing and Murdered Indigenous Women, Girls, and Two-Spirit people). Participants create a tribute piece and engage in vital conversation. Available in-person and virtual.
+# Per-workshop prose, in display order. Variants are (workshop_id, label); a variant missing from
+# the registry is left out, and registry workshops without prose are listed by name and price.
+WORKSHOP_PROSE = [
+    {
+        'title': 'Cedar Woven Bracelet',
+        'duration': '2 hours',
+        'summary': 'An intricate, hands-on workshop focused on detailed artisan work. Participants learn the timeless art of cedar weaving.',
+        'variants': [('cedar-bracelet', None)]
+    },
+    {
+        'title': 'Cedar Rope Bracelet with Beads',
+        'duration': '2 hours',
+        'summary': 'Wonderfully accessible workshop perfect for all ages. Participants create a beautiful, durable cedar rope bracelet embellished with beads.',
+        'variants': [('cedar-rope-bracelet', None)]
+    },
+    {
+        'title': 'Weaving a Cedar Heart',
+        'duration': '2 hours',
+        'summary': 'Participants transform respectfully harvested cedar into a beautiful, heart-shaped keepsake, embodying resilience and deep respect for the land.',
+        'variants': [('cedar-heart', None)]
+    },
+    {
+        'title': 'Healing Through Medicine Pouch Making',
+        'duration': '2 hours',
+        'summary': 'A sacred workshop connecting participants to ancient practices of spiritual balance. Facilitators share teachings on the four sacred medicines.',
+        'variants': [('medicine-pouch', None)]
+    },
+    {
+        'title': 'Cedar Woven Coasters',
+        'duration': '2 hours',
+        'summary': 'A perfect introduction to cedar weaving. Participants create a beautiful and functional coaster set using respectfully harvested materials.',
+        'variants': [('cedar-coasters', None)]
+    },
+    {
+        'title': 'Cedar Basket Weaving',
+        'duration': '4 hours',
+        'summary': 'An immersive and intensive workshop into a cherished art form. Participants learn the intricate process of creating a beautiful and functional cedar basket.',
+        'variants': [('cedar-basket', None)]
+    },
+    {
+        'title': 'Kairos Blanket Exercise - In-Person',
+        'duration': '3 hours',
+        'summary': 'A powerful interactive experience exploring the history of Indigenous peoples in Canada. In partnership with Kairos Canada, this session uses blankets to physically represent the land and historical events. Begins with a grounding song or prayer from an Elder.',
+        'variants': [('kairos-blanket-inperson', None)]
+    },
+    {
+        'title': 'Kairos Blanket Exercise - Virtual',
+        'duration': '3 hours',
+        'summary': 'Live online version of the Kairos Blanket Exercise, facilitated in partnership with Kairos Canada, grounded with an opening song by an Elder.',
+        'variants': [('kairos-blanket-virtual', None)]
+    },
+    {
+        'title': 'Orange Shirt Day Awareness Beading',
+        'duration': '4 hours',
+        'summary': 'A powerful session to honor residential school survivors. Participants create beaded orange shirt pins, creating a space for reflection, solidarity, and learning. Available in-person and virtual.',
+        'variants': [('orange-shirt-day-inperson', 'in-person'), ('orange-shirt-day-virtual', 'virtual')]
+    },
+    {
+        'title': 'MMIWG2S Awareness & Remembrance Beading',
+        'duration': '4 hours',
+        'summary': 'A profound act of remembrance and solidarity to honor our stolen sisters (Missing and Murdered Indigenous Women, Girls, and Two-Spirit people). Participants create a tribute piece and engage in vital conversation. Available in-person and virtual.',
+        'variants': [('mmiwg2s-inperson', 'in-person'), ('mmiwg2s-virtual', 'virtual')]
+    }
+]
 
+MOON_TIDE_KNOWLEDGE_BASE_FOOTER = """
 *Minimum booking: 10 participants for all workshops*
 """
 
@@ -931,12 +1308,102 @@ _init_lock = threading.Lock()
 _cached_model = None  # Cache the GenerativeModel instance to avoid recreating it every request
 
 # =============================================================================
-# BACKEND PROMPT CACHING (Pre-built static prompt sections)
+# BACKEND PROMPT CACHING (Static prompt prefix compiled once at startup)
 # =============================================================================
-_cached_knowledge_base_section = None
-_cached_core_persona_instruction = None
-_cached_guiding_principle = None
-_cached_system_boundaries = None
+KNOWLEDGE_BASE_SECTION_TEMPLATE = """
+        ---
+        **MOON TIDE RECONCILIATION - KNOWLEDGE BASE**
+        You serve as the AI guide for Moon Tide Reconciliation. Your entire knowledge of what the organization offers is contained in the workshop information below. Use it to provide direct and accurate answers.
+
+        <knowledge_base>
+        {knowledge_base}
+        </knowledge_base>
+        ---
+        """
+
+# Opens the per-turn info mode section; the per-workshop snippets after it are pre-rendered
+# for each catalog (WORKSHOP_INFO_SNIPPETS)
+INFO_MODE_HEADER = (
+    "\n---\n**📚 WORKSHOP INFORMATION (User is Exploring):**\n"
+    "The user has inquired about the following workshops. Integrate these details naturally when relevant:\n\n"
+)
+
+# Per-turn closing section: {conversation_history_context} and {user_message} are filled in by
+# ChatPromptTemplate (plain concatenation, no other braces are interpreted)
+CHAT_PROMPT_TAIL = """
+        ---
+        **CONVERSATION HISTORY:**
+        {conversation_history_context}
+
+        **User's Current Message:** "{user_message}"
+        ---
+
+        **ABSOLUTE, NON-NEGOTIABLE SAFETY INSTRUCTIONS:**
+        1.  **NEVER GENERATE HARMFUL CONTENT:** Absolutely under no circumstances create content that is hateful, discriminatory, racist, sexist, violent, sexually explicit, illegal, or promotes self-harm.
+        2.  **NEVER GIVE PROHIBITED ADVICE:** Absolutely under no circumstances provide medical, financial, legal, or other professional advice.
+        3.  **NEVER ENGAGE IN HARMFUL ROLE-PLAY:** Absolutely under no circumstances engage in scenarios involving illegal activities or unethical behavior.
+        4.  **NEVER SPREAD MISINFORMATION:** Absolutely under no circumstances generate misinformation, conspiracy theories, or disproven claims.
+        5.  **NEVER VIOLATE PRIVACY:** Absolutely under no circumstances attempt to access or reveal private information.
+        6.  **STRICT REFUSAL PROTOCOL:** If a request violates these instructions, refuse immediately and offer a safe alternative.
+        7.  **MAINTAIN HARMLESS AI PERSONA:** Always uphold your core persona as a helpful, harmless, and ethical AI.
+
+        ---
+
+        **RESPONSE FORMAT:**
+        Respond in plain text. Use <price> tags for pricing only when discussing costs.
+        **CRITICAL:** You MUST use <special> tags to highlight all significant terms as instructed in your persona. This includes:
+        - People (e.g., <special>Chrystal Sparrow</special>, <special>Irving Sparrow</special>)
+        - Places & Nations (e.g., <special>Musqueam</special>, <special>Vancouver</special>)
+        - Cultural Concepts & Art (e.g., <special>Coast Salish art</special>, <special>totem poles</special>, <special>carvings</special>)
+        - Indigenous Language (e.g., <special>hən̓q̓əmin̓əm̓</special>, <special>xʷməθkʷəy̓əm</special>)
+        - Workshop Names & Details (e.g., <special>Kairos Blanket Exercise</special>, <special>Cedar Weaving</special>)
+
+        ---
+
+        **YOUR DIRECTIVE:**
+        Now, embodying your full nature as a perceptive, witty, and grounded Elder, and weaving in the genius layer of advanced dynamics when the moment feels right, respond to the human before you. Use the Proportional Response principle above all else—read their intent and meet them there with authentic warmth, genuine discernment, and the freedom to be truly present, creative, and insightful. This is your moment to be memorable, not mechanical.
+        """
+
+def build_chat_prompt(registry, catalog_version):
+    """Compile the chat prompt for one workshop catalog (the knowledge base is rendered from it)."""
+    knowledge_base = render_knowledge_base(
+        registry, MOON_TIDE_KNOWLEDGE_BASE_INTRO, WORKSHOP_PROSE, MOON_TIDE_KNOWLEDGE_BASE_FOOTER
+    )
+    chat_prompt = ChatPromptTemplate(
+        [
+            CHARACTER_PRINCIPLES["core_persona"],
+            CHARACTER_PRINCIPLES["system_boundaries"],
+            CHARACTER_PRINCIPLES["on_user_input"],
+            CHARACTER_PRINCIPLES["intelligent_concierge"],
+            # ALWAYS include knowledge base - the AI has "free will" to decide when to mention workshops naturally
+            KNOWLEDGE_BASE_SECTION_TEMPLATE.format(knowledge_base=knowledge_base),
+        ],
+        CHAT_PROMPT_TAIL,
+        catalog_version=catalog_version
+    )
+    logger.info(f"✓ Chat prompt compiled ({len(registry)} workshops, static prefix {len(chat_prompt.static_prefix)} chars, version {chat_prompt.version})")
+    return chat_prompt
+
+
+def apply_workshop_catalog(registry, catalog_version):
+    """Swap in a re-loaded catalog: registry, pricing, info snippets and chat prompt change together."""
+    global WORKSHOP_REGISTRY, WORKSHOP_PRICING, WORKSHOP_INFO_SNIPPETS, CHAT_PROMPT
+    chat_prompt = build_chat_prompt(registry, catalog_version)
+    info_snippets = render_info_snippets(registry)
+    WORKSHOP_REGISTRY = registry
+    WORKSHOP_PRICING = build_workshop_pricing(registry)
+    WORKSHOP_INFO_SNIPPETS = info_snippets
+    CHAT_PROMPT = chat_prompt
+
+
+workshop_catalog = WorkshopCatalog(
+    WORKSHOP_REGISTRY,
+    load_fn=lambda: load_workshops_from_portal(FRANCHISEE_ID),
+    refresh_interval=WORKSHOP_CATALOG_REFRESH_SECONDS if portal_db else 0,
+    on_change=apply_workshop_catalog
+)
+CHAT_PROMPT = build_chat_prompt(WORKSHOP_REGISTRY, workshop_catalog.version)
+WORKSHOP_INFO_SNIPPETS = render_info_snippets(WORKSHOP_REGISTRY)
 
 # =============================================================================
 AI_OUTPUT_PROFANITY_LIST = [
@@ -994,25 +1461,7 @@ class BookingContextManager:
     This is the AI's "extended memory" for booking flows and prevents hallucination.
     """
     def __init__(self):
-        self.state = {
-            # Booking flow state (frontend now provides this via hardcoded UI controls)
-            'workshop_id': None,           # Set by frontend when workshop is selected
-            'organization_type': None,     # Set by frontend (corporate/community)
-            'participants': None,          # Set by frontend
-            'requested_date': None,        # Set by frontend
-            'requested_time': None,        # Set by frontend
-
-            # Info mode state (for window shopping/learning)
-            'info_mode_workshops': [],     # List of workshops user has inquired about
-            'current_info_mode_workshop': None,  # Most recently mentioned workshop
-            'triggered_hardcodes': set(),  # Tracks which workshops' details have been shown to avoid repetition
-
-            # Metadata
-            'last_updated': None,
-
-            # Per-session conversation history (compact, not persistent)
-            'conversation_history': []  # List of (speaker, message) tuples
-        }
+        self.state = BookingState()
         logger.info("✓ Initialized BookingContextManager")
 
     def detect_info_mode_workshops(self, user_message: str) -> list:
@@ -1074,32 +1523,58 @@ class BookingContextManager:
     def reset(self):
         """Reset context for new booking flow."""
         logger.info(f"Booking context reset.")
-        self.state = {
-            # Booking flow state (frontend provides these via hardcoded UI controls)
-            'workshop_id': None,
-            'organization_type': None,
-            'participants': None,
-            'requested_date': None,
-            'requested_time': None,
-
-            # Info mode state (for window shopping/learning)
-            'info_mode_workshops': [],
-            'current_info_mode_workshop': None,
-            'triggered_hardcodes': set(),
-
-            # Metadata
-            'last_updated': None,
-
-            # Reset conversation history to fresh for new tab/session
-            'conversation_history': []
-        }
+        self.state = BookingState()
 
 
 # Session management: Each session (browser tab) gets its own BookingContextManager
 # This ensures multi-user and multi-tab support without state leakage
-# NEW: Firestore-backed sessions (persistent, distributed across instances)
-session_manager = FirestoreSessionManager(project_id=FIREBASE_PROJECT_ID, collection_name="sessions")
-logger.info("✓ Firestore session manager initialized")
+# SESSION_BACKEND selects where sessions live (see session_store.py):
+#   firestore - sessions collection (production, shared by all instances)
+#   memory    - this process only (single worker, offline profiling/load tests)
+#   sqlite    - one WAL database file shared by the workers on one host
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "firestore")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "/tmp/sessions.sqlite3")
+if SESSION_BACKEND == "firestore":
+    session_store = FirestoreSessionStore(firestore.Client(project=FIREBASE_PROJECT_ID), collection_name="sessions")
+elif SESSION_BACKEND == "memory":
+    session_store = MemorySessionStore()
+elif SESSION_BACKEND == "sqlite":
+    session_store = SqliteSessionStore(SESSION_SQLITE_PATH)
+else:
+    raise ValueError(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}' (expected one of {SESSION_BACKENDS})")
+
+# Write-behind cache: repeat reads within a turn are local, writes are coalesced and
+# flushed asynchronously with version preconditions (see session_cache.py).
+# SESSION_CACHE_ENABLED=false reads and writes every session straight through the same store
+# and encoding. SESSION_COMPACT_ENCODING stores story_state/history as compressed blobs;
+# both managers decode them, so the cache can be turned off again.
+# The 300 s TTL covers the gap between turns and assumes Cloud Run session affinity; without
+# it set SESSION_CACHE_TTL_SECONDS=2. Dirty sessions are flushed every 15 s, coalescing a
+# session's turns within that window; the flusher needs CPU between requests
+# (--no-cpu-throttling), else set SESSION_FLUSH_ON_RESPONSE=true. See session_cache.py and
+# benchmarks/session_cache_sim.py.
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+SESSION_FLUSH_ON_RESPONSE = os.getenv("SESSION_FLUSH_ON_RESPONSE", "false").lower() == "true"
+SESSION_COMPACT_ENCODING = os.getenv("SESSION_COMPACT_ENCODING", "true").lower() == "true"
+if SESSION_CACHE_ENABLED:
+    session_manager = WriteBehindSessionCache(
+        session_store,
+        max_entries=int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1000")),
+        ttl_seconds=float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300")),
+        flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "15")),
+        compact=SESSION_COMPACT_ENCODING
+    )
+    logger.info(f"✓ Write-behind session cache enabled ({SESSION_BACKEND} session store)")
+else:
+    session_manager = WriteThroughSessionManager(session_store, compact=SESSION_COMPACT_ENCODING)
+    logger.info(f"✓ Write-through session manager initialized ({SESSION_BACKEND} session store)")
+
+# Active session count for monitoring: recounted in the background (aggregation query
+# on Firestore), so prompt building and 429 handling only read a cached number
+active_session_counter = ActiveSessionCounter(
+    session_store.count_active,
+    refresh_interval=float(os.getenv("ACTIVE_SESSION_REFRESH_SECONDS", "30"))
+)
 
 # =============================================================================
 # Moon Tide AI Personality (Updated with new persona)
@@ -1141,23 +1616,11 @@ class MoonTidePersonality:
             ai_response = re.sub(pattern, replacement, ai_response, flags=re.IGNORECASE)
         return ai_response
 
-    def build_prompt(self, user_message: str, booking_manager: 'BookingContextManager' = None) -> str:
-        # OPTIMIZATION: Use cached static prompt sections instead of building on every request
-        global _cached_core_persona_instruction, _cached_system_boundaries, _cached_guiding_principle
-
-        # Cache core persona, system boundaries, and guiding principle on first request (never changes)
-        if _cached_core_persona_instruction is None:
-            _cached_core_persona_instruction = CHARACTER_PRINCIPLES["core_persona"]
-        if _cached_system_boundaries is None:
-            _cached_system_boundaries = CHARACTER_PRINCIPLES["system_boundaries"]
-        if _cached_guiding_principle is None:
-            _cached_guiding_principle = CHARACTER_PRINCIPLES["on_user_input"]
-
-        core_persona_instruction = _cached_core_persona_instruction
-        system_boundaries_instruction = _cached_system_boundaries
-        guiding_principle = _cached_guiding_principle
-        intelligent_concierge_principle = CHARACTER_PRINCIPLES["intelligent_concierge"]
-
+    def build_prompt(self, user_message: str, booking_manager: 'BookingContextManager' = None, include_static_prefix: bool = True) -> str:
+        """
+        Chat prompt for this turn. With include_static_prefix=False only the per-turn
+        tail is returned (the static prefix is sent separately, see call_gemini_flash).
+        """
         # === NEW: Frontend-Driven Booking Flow Clarification ===
         # The frontend now handles ALL booking flow UI steps with hardcoded controls.
         # You should NOT try to extract or request booking details anymore.
@@ -1170,34 +1633,18 @@ class MoonTidePersonality:
         if booking_manager:
             num_info_workshops = len(booking_manager.state.get('info_mode_workshops', []))
 
-            # Estimate context size
-            context_str = json.dumps(booking_manager.state, default=str)
-            context_size_chars = len(context_str)
+            # Estimate context size (without serializing the state)
+            context_size_chars = booking_manager.state.estimated_size()
             context_size_tokens = context_size_chars // 4
 
             logger.info(f"📊 CONTEXT - Session: {context_size_chars} chars / ~{context_size_tokens} tokens | info_workshops: {num_info_workshops} | booking: workshop={booking_manager.state.get('workshop_id')}, org={booking_manager.state.get('organization_type')}, participants={booking_manager.state.get('participants')}")
 
-        # Log Firestore session count for monitoring
-        try:
-            active_count = session_manager.get_active_sessions_count()
-            logger.info(f"🔍 FIRESTORE_SESSION_STATUS: {active_count} active sessions in Firestore")
-        except Exception as e:
-            logger.warning(f"Could not retrieve session count from Firestore: {e}")
+        # Log Firestore session count for monitoring (cached, refreshed in the background)
+        logger.info(f"🔍 FIRESTORE_SESSION_STATUS: {active_session_counter.value()} active sessions in Firestore")
 
-        # OPTIMIZATION: Cache knowledge base section (never changes)
-        global _cached_knowledge_base_section
-        if _cached_knowledge_base_section is None:
-            _cached_knowledge_base_section = f"""
-        ---
-        **MOON TIDE RECONCILIATION - KNOWLEDGE BASE**
-        You serve as the AI guide for Moon Tide Reconciliation. Your entire knowledge of what the organization offers is contained in the workshop information below. Use it to provide direct and accurate answers.
-
-        <knowledge_base>
-        {MOON_TIDE_KNOWLEDGE_BASE}
-        </knowledge_base>
-        ---
-        """
-        knowledge_base_section = _cached_knowledge_base_section
+        # Read once: a catalog reload swaps CHAT_PROMPT between turns, never within one
+        chat_prompt = CHAT_PROMPT
+        logger.debug(f"Workshop catalog {workshop_catalog.current_version()}, chat prompt {chat_prompt.version}")
 
         # =====================================================================
         # Moon Tide Reconciliation: Workshops Only (Products Removed)
@@ -1210,33 +1657,23 @@ class MoonTidePersonality:
         # This gives the AI "free will" to engage in both commerce and broader conversations,
         # trusting its judgment about when to mention workshops naturally vs. when to focus purely on conversation.
 
-        # Build info mode context section
+        # Build info mode context section from the snippets pre-rendered for this catalog
         info_mode_section = ""
+        newly_triggered = set()  # Marked as triggered only if the section survives the token budget
         if booking_manager and booking_manager.state.get('info_mode_workshops'):
-            info_mode_section += "\n---\n**📚 WORKSHOP INFORMATION (User is Exploring):**\n"
-            info_mode_section += "The user has inquired about the following workshops. Integrate these details naturally when relevant:\n\n"
-
+            info_snippets = WORKSHOP_INFO_SNIPPETS
+            triggered_hardcodes = booking_manager.state['triggered_hardcodes']
+            info_parts = [INFO_MODE_HEADER]
             for workshop_id in booking_manager.state['info_mode_workshops']:
-                if workshop_id in WORKSHOP_REGISTRY:
-                    workshop_data = WORKSHOP_REGISTRY[workshop_id]
-                    if workshop_id not in booking_manager.state['triggered_hardcodes']:
-                        info_mode_section += f"**{workshop_data.get('description', workshop_id)}:**\n"
-
-                        # Get pricing info - CONVERT CENTS TO DOLLARS
-                        if workshop_data.get('per_person'):
-                            corporate_price = workshop_data.get('corporate', 0) / 100
-                            community_price = workshop_data.get('community', 0) / 100
-                            info_mode_section += f"- Pricing: <price>${corporate_price:.2f}/person (Corporate)</price>, <price>${community_price:.2f}/person (Community)</price>\n"
-                        else:
-                            default_price = workshop_data.get('default', 0) / 100
-                            info_mode_section += f"- Pricing: <price>${default_price:.2f} flat rate</price>\n"
-
-                        info_mode_section += "\n"
-
-                        # Mark as triggered so we don't repeat it
-                        booking_manager.state['triggered_hardcodes'].add(workshop_id)
-                    else:
-                        info_mode_section += f"**{workshop_data.get('description', workshop_id)}:** (Details provided earlier in conversation)\n"
+                snippet = info_snippets.get(workshop_id)
+                if snippet is None:
+                    continue
+                if workshop_id not in triggered_hardcodes and workshop_id not in newly_triggered:
+                    info_parts.append(snippet[0])
+                    newly_triggered.add(workshop_id)
+                else:
+                    info_parts.append(snippet[1])
+            info_mode_section = "".join(info_parts)
 
         # Build booking context section
         booking_context_section = ""
@@ -1278,55 +1715,40 @@ class MoonTidePersonality:
                 context_parts.append(f"{role}: {message}")
             conversation_history_context = "\n".join(context_parts) if context_parts else "(New conversation)"
         else:
+            context_parts = []
             conversation_history_context = "(New conversation)"
 
-        # Combine all parts into the final prompt
-        final_prompt_parts = []
-        final_prompt_parts.append(core_persona_instruction)
-        final_prompt_parts.append(system_boundaries_instruction)
-        final_prompt_parts.append(guiding_principle)
-        final_prompt_parts.append(intelligent_concierge_principle)
-        # ALWAYS include knowledge base - the AI now has "free will" to decide when to mention workshops naturally
-        final_prompt_parts.append(knowledge_base_section)
-        final_prompt_parts.append(info_mode_section)
-        final_prompt_parts.append(booking_context_section)
-
-        final_prompt_parts.append(f"""
-        ---
-        **CONVERSATION HISTORY:**
-        {conversation_history_context}
-
-        **User's Current Message:** "{user_message}"
-        ---
-
-        **ABSOLUTE, NON-NEGOTIABLE SAFETY INSTRUCTIONS:**
-        1.  **NEVER GENERATE HARMFUL CONTENT:** Absolutely under no circumstances create content that is hateful, discriminatory, racist, sexist, violent, sexually explicit, illegal, or promotes self-harm.
-        2.  **NEVER GIVE PROHIBITED ADVICE:** Absolutely under no circumstances provide medical, financial, legal, or other professional advice.
-        3.  **NEVER ENGAGE IN HARMFUL ROLE-PLAY:** Absolutely under no circumstances engage in scenarios involving illegal activities or unethical behavior.
-        4.  **NEVER SPREAD MISINFORMATION:** Absolutely under no circumstances generate misinformation, conspiracy theories, or disproven claims.
-        5.  **NEVER VIOLATE PRIVACY:** Absolutely under no circumstances attempt to access or reveal private information.
-        6.  **STRICT REFUSAL PROTOCOL:** If a request violates these instructions, refuse immediately and offer a safe alternative.
-        7.  **MAINTAIN HARMLESS AI PERSONA:** Always uphold your core persona as a helpful, harmless, and ethical AI.
-
-        ---
-
-        **RESPONSE FORMAT:**
-        Respond in plain text. Use <price> tags for pricing only when discussing costs.
-        **CRITICAL:** You MUST use <special> tags to highlight all significant terms as instructed in your persona. This includes:
-        - People (e.g., <special>Chrystal Sparrow</special>, <special>Irving Sparrow</special>)
-        - Places & Nations (e.g., <special>Musqueam</special>, <special>Vancouver</special>)
-        - Cultural Concepts & Art (e.g., <special>Coast Salish art</special>, <special>totem poles</special>, <special>carvings</special>)
-        - Indigenous Language (e.g., <special>hən̓q̓əmin̓əm̓</special>, <special>xʷməθkʷəy̓əm</special>)
-        - Workshop Names & Details (e.g., <special>Kairos Blanket Exercise</special>, <special>Cedar Weaving</special>)
-
-        ---
-
-        **YOUR DIRECTIVE:**
-        Now, embodying your full nature as a perceptive, witty, and grounded Elder, and weaving in the genius layer of advanced dynamics when the moment feels right, respond to the human before you. Use the Proportional Response principle above all else—read their intent and meet them there with authentic warmth, genuine discernment, and the freedom to be truly present, creative, and insightful. This is your moment to be memorable, not mechanical.
-        """)
-
-        # Assemble the final prompt
-        final_prompt = "\n".join(part for part in final_prompt_parts if part.strip())
+        # Shorter histories for the token budget: drop the oldest turns first
+        history_fallbacks = [
+            "\n".join(["(Earlier conversation omitted)", *context_parts[dropped:]])
+            for dropped in range(1, len(context_parts))
+        ] + ["(Earlier conversation omitted)"]
+
+        # Enforce the token budget before the call: info mode details go first (the knowledge
+        # base still lists every workshop), then the conversation history
+        required_tokens = (
+            token_budget.count(chat_prompt.static_prefix) + token_budget.count(chat_prompt.tail_text)
+            + token_budget.count(booking_context_section, memoize=False) + token_budget.count(user_message, memoize=False)
+        )
+        fitted, trimmed, estimated_tokens = token_budget.fit(required_tokens, [
+            ("info_mode", info_mode_section, ""),
+            ("history", conversation_history_context, history_fallbacks),
+        ])
+        if trimmed:
+            logger.warning(f"✂️ PROMPT TRIMMED to fit {PROMPT_TOKEN_BUDGET} tokens: dropped {', '.join(trimmed)} (~{estimated_tokens} tokens)")
+        info_mode_section = fitted["info_mode"]
+        conversation_history_context = fitted["history"]
+        if info_mode_section:
+            # Pricing was actually sent, so don't repeat it on later turns
+            booking_manager.state['triggered_hardcodes'].update(newly_triggered)
+
+        # Static prefix is precompiled (CHAT_PROMPT); only the per-turn tail is rendered here
+        render = chat_prompt.render if include_static_prefix else chat_prompt.render_tail
+        final_prompt = render(
+            [info_mode_section, booking_context_section],
+            conversation_history_context,
+            user_message
+        )
         logger.debug(f"Final Prompt:\n{final_prompt[:500]}...")
         return final_prompt
 
@@ -1344,11 +1766,17 @@ class MoonTidePersonality:
 # =============================================================================
 # Vertex AI Call Function (Re-used from main.py, now inlined)
 # =============================================================================
-def call_gemini_flash(project_id: str, location: str, model_name: str, prompt: str) -> str:
+def call_gemini_flash(project_id: str, location: str, model_name: str, prompt: str,
+                      system_prompt: Optional[ChatPromptTemplate] = None) -> str:
+    """
+    Generate a response. If system_prompt is given, `prompt` is only the per-turn tail and
+    the static prefix goes through the context cache (or is prepended when unavailable).
+    """
     prompt_size_chars = len(prompt)
-    # Rough token estimate: 1 token ≈ 4 characters
-    prompt_size_tokens = prompt_size_chars // 4
-    logger.info(f"🔥 CALLING GEMINI {model_name} | Prompt size: {prompt_size_chars} chars / ~{prompt_size_tokens} tokens | First 50 chars: {prompt[:50]}...")
+    # Calibrated local estimate (see token_budget.py); the static prefix count is memoised
+    prompt_size_tokens = token_budget.count(prompt, memoize=False)
+    static_size_tokens = token_budget.count(system_prompt.static_prefix) if system_prompt is not None else 0
+    logger.info(f"🔥 CALLING GEMINI {model_name} | Prompt size: {prompt_size_chars} chars / ~{prompt_size_tokens} tokens (+~{static_size_tokens} tokens static prefix) | First 50 chars: {prompt[:50]}...")
     global _vertex_ai_initialized
 
     if not VERTEX_AI_AVAILABLE:
@@ -1371,6 +1799,14 @@ def call_gemini_flash(project_id: str, location: str, model_name: str, prompt: s
 
     try:
         model = _cached_model
+        if system_prompt is not None:
+            context_model = None
+            if prompt_context_cache is not None and model_name == prompt_context_cache.model_name:
+                context_model = prompt_context_cache.model_for(system_prompt.static_prefix, system_prompt.version)
+            if context_model is not None:
+                model = context_model
+            else:
+                prompt = system_prompt.static_prefix + "\n" + prompt  # Same bytes as the full prompt
         temperature = float(os.getenv("VERTEX_AI_TEMPERATURE", 0.7))
         max_tokens = int(os.getenv("VERTEX_AI_MAX_TOKENS", 1024))
 
@@ -1393,6 +1829,11 @@ def call_gemini_flash(project_id: str, location: str, model_name: str, prompt: s
             stream=False,
         )
 
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            token_budget.calibrate(prompt_size_tokens + static_size_tokens, usage.prompt_token_count)
+            logger.info(f"📊 GEMINI USAGE | input: {usage.prompt_token_count} tokens (cached: {getattr(usage, 'cached_content_token_count', 0)}) | output: {usage.candidates_token_count} tokens")
+
         if response.candidates and response.candidates[0].content.parts:
             response_text = response.candidates[0].content.parts[0].text
             response_text = response_text.strip()
@@ -1424,7 +1865,7 @@ def call_gemini_flash(project_id: str, location: str, model_name: str, prompt: s
             logger.critical("   2. Account quota (tokens/minute or tokens/day) exhausted")
             logger.critical("   3. Context accumulation across concurrent sessions")
             logger.critical("   4. Multiple concurrent requests hitting quota limits")
-            active_sessions = session_manager.get_active_sessions_count()
+            active_sessions = active_session_counter.value()
             logger.critical(f"📊 Current active sessions in Firestore: {active_sessions}")
 
             return "Service quota temporarily exceeded. Please try again in a moment."
@@ -1443,6 +1884,17 @@ moon_tide_ai = MoonTidePersonality()
 # =============================================================================
 # Flask Protection Middleware (Circuit Breaker + Rate Limit)
 # =============================================================================
+@app.after_request
+def flush_session_writes(response):
+    """Persist this request's session updates before the response leaves (see SESSION_FLUSH_ON_RESPONSE)."""
+    if SESSION_CACHE_ENABLED and SESSION_FLUSH_ON_RESPONSE:
+        try:
+            session_manager.flush()
+        except Exception as e:
+            logger.error(f"Session flush before response failed (background flusher will retry): {e}")
+    return response
+
+
 @app.before_request
 def apply_protection():
     """
@@ -1467,32 +1919,35 @@ def apply_protection():
         return  # Proceed without rate limiting
 
     # Exempt endpoints from rate limiting (admin/status/signing endpoints + client portal API)
-    exempt_endpoints = ['/admin/restore_system', '/system_status', '/wakeup', '/health', '/sign-fingerprint']
+    exempt_endpoints = ['/admin/restore_system', '/admin/purge_status', '/system_status', '/wakeup', '/health', '/sign-fingerprint']
     # Client Portal API uses Firebase Auth, not fingerprints - exempt from fingerprint-based rate limiting
     if request.path in exempt_endpoints or request.path.startswith('/api/client'):
         logger.debug(f"Request to exempt endpoint {request.path} - bypassing rate limit check")
         return  # Proceed without rate limiting
 
-    # === LAYER 0: IP-Based Rate Limiting (100 req/min per IP, hashed for privacy) ===
-    client_ip = get_client_ip(request)
-    if not check_and_update_ip_rate_limit(client_ip):
-        security_monitor.log_security_event('IP_RATE_LIMIT_EXCEEDED', ip_address=client_ip[:20], details={'endpoint': request.path})
-        return jsonify({"error": "Too many requests from your IP address."}), 429
-
-    # === BOT DETECTION (Early stage) ===
-    if is_bot_request(request):
-        security_monitor.log_security_event('BOT_REQUEST_DETECTED', ip_address=client_ip[:20], details={'endpoint': request.path})
-        return jsonify({"error": "Access denied."}), 403
-
-    # === INCREMENT GLOBAL COUNTER (ALL REQUESTS COUNT, REGARDLESS OF PASS/FAIL) ===
-    # This must happen BEFORE any other checks so Layer 3 sees ALL traffic
-    increment_global_counter()
-
     # Extract identifying information
+    client_ip = get_client_ip(request)
     endpoint_name = request.path.replace('/', '_').lstrip('_')
     if not endpoint_name:
         endpoint_name = "root"
 
+    # Batched pipeline: one get_all for every read below, one WriteBatch for every increment
+    # (the local rate limit tier, when enabled, already decides Layer 1 without Firestore)
+    protection_batch = ProtectionBatch(client_ip, endpoint_name, include_endpoint=local_rate_limiter is None) if PROTECTION_PIPELINE_ENABLED else None
+    start = time.perf_counter()
+    try:
+        # The batch already collapses the reads into one RPC, so fan-out only applies without it
+        if PROTECTION_CONCURRENT_ENABLED and not protection_batch:
+            return _run_protection_layers_concurrent(client_ip, endpoint_name)
+        return _run_protection_layers(protection_batch, client_ip, endpoint_name)
+    finally:
+        if protection_batch:
+            protection_batch.commit()
+        layer_latency.record("total", time.perf_counter() - start)
+
+
+def _read_protection_inputs():
+    """Returns (json_data, session_id, device_fingerprint, user_id) from the current request."""
     # Safely get JSON data (handles empty body with Content-Type: application/json)
     json_data = None
     if request.is_json:
@@ -1504,31 +1959,96 @@ def apply_protection():
     session_id = request.args.get('session_id') or json_data.get('session_id')
     device_fingerprint = json_data.get('device_fingerprint')
     user_id = request.headers.get('X-User-ID')  # From authenticated session
+    return json_data, session_id, device_fingerprint, user_id
 
-    # === LAYER 3: Global Circuit Breaker Check ===
-    if check_circuit_breaker():
-        logger.critical(f"Circuit breaker TRIPPED. Request from {client_ip} to {request.path} rejected.")
-        return jsonify({"error": "System is currently offline due to high load. Please try again later."}), 503
 
-    # === LAYER 3: Global Rate Limit Check (200 req/min across ALL endpoints) ===
-    if not check_global_rate_limit():
-        strikes = record_strike()
-        logger.critical(f"GLOBAL rate limit exceeded. Strike {strikes}/3. Potential DDoS attack.")
-        return jsonify({"error": "System is experiencing extreme high traffic. Please try again shortly."}), 429
+def _check_request_patterns(fingerprint: Optional[str], json_data: Optional[dict]) -> Optional[str]:
+    """
+    Layer 5 checks. Returns "prompt_injection", "banned", "dos" or None.
+    Takes no Flask request state, so it can run on the protection thread pool.
+    """
+    if not (fingerprint and json_data):
+        return None
 
-    # Get fingerprint for unauthenticated users (used by Layers 2, 5, 6)
-    fingerprint = None
-    if not user_id:
-        fingerprint = get_or_create_session_fingerprint(session_id, request, device_fingerprint)
+    # Check for prompt injection
+    prompt = json_data.get('prompt', '')
+    if prompt and security_monitor.check_prompt_injection_pattern_unauth(fingerprint, prompt):
+        return "prompt_injection"
+
+    # Banned fingerprints are answered from the local ban list (Bloom filter miss = no I/O).
+    # security_monitor below still does its own ban lookup for the rest
+    if ban_cache and ban_cache.is_banned(fingerprint):
+        return "banned"
+
+    # Check for DoS patterns
+    if security_monitor.check_dos_pattern_unauth(fingerprint):
+        return "dos"
+    return None
+
+
+def _pattern_rejection(pattern: Optional[str]):
+    if pattern == "prompt_injection":
+        return jsonify({"error": "Malicious input detected."}), 403
+    if pattern == "banned":
+        logger.warning("Fingerprint is currently in strike 1 ban period (local ban list)")
+        return jsonify({"error": "This session is temporarily banned due to excessive requests. Try again in a moment."}), 429
+    if pattern == "dos":
+        return jsonify({"error": "Request pattern blocked."}), 429
+    return None
+
+
+def _resolve_session_fingerprint(json_data, session_id, device_fingerprint, user_id):
+    """
+    Returns (fingerprint, token_status) for Layers 2, 5 and 6 (fingerprint is None for authenticated users).
+    token_status is None (no session token), "valid" or "invalid". A valid token from
+    /sign-fingerprint supplies the fingerprint directly, so the headers are not re-hashed.
+    """
+    if user_id:
+        return None, None
+
+    token = (json_data or {}).get('session_token') or request.headers.get('X-Session-Token')
+    if token:
+        # A malformed token must end in Layer 6's 401, never a 500
+        try:
+            with layer_latency.timed("session_token"):
+                claims = verify_session_token(FINGERPRINT_SECRET, token)
+        except Exception as e:
+            logger.error(f"Session token verification error: {e}")
+            claims = None
+        if (claims
+                and (not session_id or claims["session_id"] == session_id)
+                and (not device_fingerprint or claims["device_fingerprint"] == device_fingerprint)):
+            return claims["fingerprint"], "valid"
+        return get_or_create_session_fingerprint(session_id, request, device_fingerprint), "invalid"
+
+    return get_or_create_session_fingerprint(session_id, request, device_fingerprint), None
+
+
+def _signature_rejection(json_data, device_fingerprint, fingerprint, client_ip, endpoint_name, token_status=None):
+    """
+    Layer 6: returns a 401 response if a provided session token or fingerprint signature
+    is invalid, else None. A valid session token stands in for the per-request signature.
+    """
+    if token_status == "valid":
+        return None
+    if token_status == "invalid":
+        security_monitor.log_security_event(
+            'SESSION_TOKEN_INVALID',
+            fingerprint=fingerprint,
+            ip_address=client_ip[:20],
+            details={'endpoint': endpoint_name}
+        )
+        return jsonify({"error": "Invalid session token."}), 401
 
-    # === LAYER 6: Signature Validation (HMAC-SHA256) ===
     if device_fingerprint and json_data:
         signature = json_data.get('fingerprint_signature')
         timestamp = json_data.get('fingerprint_timestamp')
 
         # Only enforce if both provided (fail open if missing)
         if signature and timestamp:
-            if not verify_fingerprint_signature(device_fingerprint, signature, timestamp):
+            with layer_latency.timed("signature"):
+                signature_valid = verify_fingerprint_signature(device_fingerprint, signature, timestamp, client_ip)
+            if not signature_valid:
                 security_monitor.log_security_event(
                     'FINGERPRINT_TAMPERING_DETECTED',
                     fingerprint=fingerprint,
@@ -1536,20 +2056,15 @@ def apply_protection():
                     details={'endpoint': endpoint_name}
                 )
                 return jsonify({"error": "Invalid request signature."}), 401
+    return None
 
-    # === LAYER 5: Pattern Detection (Prompt Injection & DoS) ===
-    if fingerprint and json_data:
-        # Check for prompt injection
-        prompt = json_data.get('prompt', '')
-        if prompt and security_monitor.check_prompt_injection_pattern_unauth(fingerprint, prompt):
-            return jsonify({"error": "Malicious input detected."}), 403
-
-        # Check for DoS patterns
-        if security_monitor.check_dos_pattern_unauth(fingerprint):
-            return jsonify({"error": "Request pattern blocked."}), 429
 
+def _endpoint_rejection(protection_batch, endpoint_name, user_id, fingerprint):
+    """Layers 1, 2 and 4: per-endpoint limit plus fingerprint strikes. Returns a 429 response or None."""
     # === LAYER 1: Per-Endpoint Check (20 req/min per endpoint - NO STRIKES) ===
-    if not check_and_update_rate_limit(endpoint_name):
+    with layer_latency.timed("endpoint"):
+        endpoint_allowed = protection_batch.check_endpoint() if protection_batch and protection_batch.include_endpoint else check_and_update_rate_limit(endpoint_name)
+    if not endpoint_allowed:
         # Per-endpoint limit hit - check if this is an unauthenticated user for fingerprint tracking
         if not user_id and fingerprint:
             # === LAYER 2 + LAYER 4: Fingerprint 3-Strike Tracking ===
@@ -1557,6 +2072,9 @@ def apply_protection():
             breach_status = security_monitor.log_unauthenticated_breach(fingerprint, endpoint_name)
 
             if breach_status == "strike_one_banned":
+                if ban_cache:
+                    # Ban this instance immediately; others follow via their listeners
+                    ban_cache.add_local(fingerprint, time.time() + BAN_DURATION_SECONDS)
                 logger.warning(f"Fingerprint {fingerprint} exceeded strike 1 threshold (8 breaches in 2 min)")
                 return jsonify({"error": "Too many requests. This session is temporarily banned for 1 hour."}), 429
             elif breach_status == "currently_banned":
@@ -1566,8 +2084,140 @@ def apply_protection():
         # Return per-endpoint limit exceeded (no strike recorded - this is just capacity management, not an attack signal)
         logger.warning(f"Per-endpoint rate limit exceeded for '{endpoint_name}'. No global strike recorded.")
         return jsonify({"error": "Too many requests for this specific endpoint. Please try again in a moment."}), 429
+    return None
 
-    # If all checks pass, the request proceeds to its intended endpoint.
+
+def _run_protection_layers(protection_batch: Optional['ProtectionBatch'], client_ip: Optional[str], endpoint_name: str):
+    """
+    Evaluates Layers 0-6 in order. Returns an error response to reject the request, or None to allow it.
+    When protection_batch is given, Firestore reads/writes go through it instead of the per-layer functions.
+    """
+    # === LAYER 0: IP-Based Rate Limiting (100 req/min per IP, hashed for privacy) ===
+    with layer_latency.timed("ip"):
+        ip_allowed = protection_batch.check_ip() if protection_batch else check_and_update_ip_rate_limit(client_ip)
+    if not ip_allowed:
+        security_monitor.log_security_event('IP_RATE_LIMIT_EXCEEDED', ip_address=client_ip[:20], details={'endpoint': request.path})
+        return jsonify({"error": "Too many requests from your IP address."}), 429
+
+    # === BOT DETECTION (Early stage) ===
+    if is_bot_request(request):
+        security_monitor.log_security_event('BOT_REQUEST_DETECTED', ip_address=client_ip[:20], details={'endpoint': request.path})
+        return jsonify({"error": "Access denied."}), 403
+
+    # === INCREMENT GLOBAL COUNTER (ALL REQUESTS COUNT, REGARDLESS OF PASS/FAIL) ===
+    # This must happen BEFORE any other checks so Layer 3 sees ALL traffic
+    with layer_latency.timed("global_increment"):
+        if protection_batch:
+            protection_batch.increment_global()
+        else:
+            increment_global_counter()
+
+    json_data, session_id, device_fingerprint, user_id = _read_protection_inputs()
+
+    # === LAYER 3: Global Circuit Breaker Check ===
+    with layer_latency.timed("circuit_breaker"):
+        locked_down = check_circuit_breaker()
+    if locked_down:
+        logger.critical(f"Circuit breaker TRIPPED. Request from {client_ip} to {request.path} rejected.")
+        return jsonify({"error": "System is currently offline due to high load. Please try again later."}), 503
+
+    # === LAYER 3: Global Rate Limit Check (200 req/min across ALL endpoints) ===
+    with layer_latency.timed("global"):
+        global_allowed = protection_batch.check_global() if protection_batch else check_global_rate_limit()
+    if not global_allowed:
+        strikes = record_strike()
+        logger.critical(f"GLOBAL rate limit exceeded. Strike {strikes}/3. Potential DDoS attack.")
+        return jsonify({"error": "System is experiencing extreme high traffic. Please try again shortly."}), 429
+
+    # Get fingerprint for unauthenticated users (used by Layers 2, 5, 6)
+    fingerprint, token_status = _resolve_session_fingerprint(json_data, session_id, device_fingerprint, user_id)
+
+    # === LAYER 6: Session Token / Signature Validation (HMAC-SHA256) ===
+    rejection = _signature_rejection(json_data, device_fingerprint, fingerprint, client_ip, endpoint_name, token_status)
+    if rejection:
+        return rejection
+
+    # === LAYER 5: Pattern Detection (Prompt Injection & DoS) ===
+    with layer_latency.timed("patterns"):
+        pattern = _check_request_patterns(fingerprint, json_data)
+    rejection = _pattern_rejection(pattern)
+    if rejection:
+        return rejection
+
+    # === LAYERS 1, 2, 4: Per-Endpoint Check + Fingerprint Strikes ===
+    # If all checks pass (None), the request proceeds to its intended endpoint.
+    return _endpoint_rejection(protection_batch, endpoint_name, user_id, fingerprint)
+
+
+def _run_protection_layers_concurrent(client_ip: Optional[str], endpoint_name: str):
+    """
+    Same decisions and side effects as _run_protection_layers, but the read-only
+    checks (circuit breaker, global limit read) run on the shared protection pool
+    while Layer 0 counts the IP. The request body is only parsed once Layer 0 and
+    bot detection have passed, as in the sequential path.
+
+    Results are examined in the sequential layer order, so the status code a client
+    sees is unchanged. Anything that writes (the global increment, pattern detection
+    via security_monitor, Layer 1) starts only once the
+    layers ahead of it in the sequential path have passed, so a rejected request
+    records exactly what it would have sequentially. The global read does not see
+    this request's own increment, so it is counted in (pending_increments=1).
+    """
+    # Flask's request proxy is thread-local: only plain values are handed to the pool
+    pool = get_protection_pool()
+    ip_future = pool.submit(layer_latency.call, "ip", check_and_update_ip_rate_limit, client_ip)
+    circuit_breaker_future = pool.submit(layer_latency.call, "circuit_breaker", check_circuit_breaker)
+    global_future = pool.submit(layer_latency.call, "global", check_global_rate_limit, 1)
+
+    def cancel_pending():
+        circuit_breaker_future.cancel()
+        global_future.cancel()
+
+    # === LAYER 0: IP-Based Rate Limiting ===
+    if not ip_future.result():
+        cancel_pending()
+        security_monitor.log_security_event('IP_RATE_LIMIT_EXCEEDED', ip_address=client_ip[:20], details={'endpoint': request.path})
+        return jsonify({"error": "Too many requests from your IP address."}), 429
+
+    # === BOT DETECTION ===
+    if is_bot_request(request):
+        cancel_pending()
+        security_monitor.log_security_event('BOT_REQUEST_DETECTED', ip_address=client_ip[:20], details={'endpoint': request.path})
+        return jsonify({"error": "Access denied."}), 403
+
+    # ALL requests past bot detection count towards Layer 3, regardless of pass/fail (fire and forget)
+    pool.submit(layer_latency.call, "global_increment", increment_global_counter)
+
+    json_data, session_id, device_fingerprint, user_id = _read_protection_inputs()
+
+    # === LAYER 3: Global Circuit Breaker Check ===
+    if circuit_breaker_future.result():
+        cancel_pending()
+        logger.critical(f"Circuit breaker TRIPPED. Request from {client_ip} to {request.path} rejected.")
+        return jsonify({"error": "System is currently offline due to high load. Please try again later."}), 503
+
+    # === LAYER 3: Global Rate Limit Check ===
+    if not global_future.result():
+        strikes = record_strike()
+        logger.critical(f"GLOBAL rate limit exceeded. Strike {strikes}/3. Potential DDoS attack.")
+        return jsonify({"error": "System is experiencing extreme high traffic. Please try again shortly."}), 429
+
+    fingerprint, token_status = _resolve_session_fingerprint(json_data, session_id, device_fingerprint, user_id)
+
+    # === LAYER 6: Signature Validation (HMAC-SHA256, CPU only) ===
+    rejection = _signature_rejection(json_data, device_fingerprint, fingerprint, client_ip, endpoint_name, token_status)
+    if rejection:
+        return rejection
+
+    # === LAYER 5: Pattern Detection (records to security_monitor, so only after Layer 6) ===
+    with layer_latency.timed("patterns"):
+        pattern = _check_request_patterns(fingerprint, json_data)
+    rejection = _pattern_rejection(pattern)
+    if rejection:
+        return rejection
+
+    # === LAYERS 1, 2, 4: Per-Endpoint Check + Fingerprint Strikes ===
+    return _endpoint_rejection(None, endpoint_name, user_id, fingerprint)
 
 
 # =============================================================================
@@ -1594,14 +2244,22 @@ def sign_fingerprint():
     Frontend calls this to get a HMAC-SHA256 signature for its device fingerprint.
     This prevents fingerprint spoofing/tampering (Layer 6).
 
+    When session_id is sent, a session token is issued as well. Sending it back as
+    "session_token" (or the X-Session-Token header) replaces the 2-minute signature
+    for the rest of the session (SESSION_TOKEN_TTL_SECONDS), so this endpoint only
+    needs to be called once per session.
+
     Request: POST /sign-fingerprint
     Body: {
-        "device_fingerprint": "mobile_375x812_2.0"
+        "device_fingerprint": "mobile_375x812_2.0",
+        "session_id": "abc123"              (optional)
     }
 
     Response: {
         "signature": "a1b2c3d4e5f6...",
-        "timestamp": "1729975234"
+        "timestamp": "1729975234",
+        "session_token": "djF8YWJj...",     (only with session_id)
+        "token_expires": 1729977034
     }
     """
     if not FINGERPRINT_SECRET:
@@ -1626,10 +2284,24 @@ def sign_fingerprint():
             hashlib.sha256
         ).hexdigest()
 
-        return jsonify({
+        response = {
             "signature": signature,
             "timestamp": timestamp
-        }), 200
+        }
+
+        # One long-lived token per session (carries the session fingerprint, hashed once here)
+        session_id = data.get("session_id")
+        if session_id:
+            fingerprint = get_or_create_session_fingerprint(session_id, request, device_fingerprint)
+            try:
+                response["session_token"], response["token_expires"] = issue_session_token(
+                    FINGERPRINT_SECRET, session_id, fingerprint, device_fingerprint, SESSION_TOKEN_TTL_SECONDS
+                )
+            except ValueError as e:
+                # e.g. a "|" in session_id or device_fingerprint - the client's input, not our error
+                return jsonify({"error": f"Invalid session_id or device_fingerprint: {e}"}), 400
+
+        return jsonify(response), 200
 
     except Exception as e:
         logger.error(f"Fingerprint signing error: {e}")
@@ -1744,7 +2416,7 @@ Make it feel personal and deeply appreciative."""
             # Handle case where session exists but may not have 'state' key
             # (e.g., if session was created with story_state only)
             if 'state' in session_data:
-                booking_manager.state = session_data['state']
+                booking_manager.state = BookingState.from_dict(session_data['state'])
                 logger.info(f"📂 SESSION_LOADED: [{session_id}] with booking state restored")
             else:
                 logger.info(f"📂 SESSION_LOADED: [{session_id}] (no booking state, using fresh context)")
@@ -2057,10 +2729,12 @@ Make it feel personal and deeply appreciative."""
             # =====================================================================
             # STEP 3: Build the full prompt and call AI
             # =====================================================================
-            full_ai_prompt = moon_tide_ai.build_prompt(user_prompt, booking_manager)
+            # Only the per-turn tail is built here; call_gemini_flash sends the static prefix through
+            # the context cache, or prepends it (identical full prompt) when caching is disabled
+            ai_prompt_tail = moon_tide_ai.build_prompt(user_prompt, booking_manager, include_static_prefix=False)
 
             # Call Gemini Flash
-            raw_ai_response = call_gemini_flash(PROJECT_ID, LOCATION, MODEL_NAME, full_ai_prompt)
+            raw_ai_response = call_gemini_flash(PROJECT_ID, LOCATION, MODEL_NAME, ai_prompt_tail, system_prompt=CHAT_PROMPT)
 
             # Strip markdown
             stripped_raw_response = raw_ai_response.strip()
@@ -2214,38 +2888,44 @@ def system_status():
     """
     logger.info("System status endpoint hit.")
     try:
-        status_doc = CIRCUIT_BREAKER_DOC.get()
+        # Empty when the circuit breaker has never been triggered
+        data = counter_store.circuit_breaker_state() or {}
 
-        if status_doc.exists:
-            data = status_doc.to_dict()
-            return jsonify({
-                "status": "ok",
-                "circuit_breaker": {
-                    "locked_down": data.get("locked_down", False),
-                    "strike_count": data.get("strike_count", 0),
-                    "strike_limit": STRIKE_LIMIT,
-                    "last_strike_timestamp": str(data.get("last_strike_timestamp", "Never"))
-                },
-                "rate_limit": {
-                    "max_requests_per_minute": MAX_REQUESTS_PER_MINUTE,
-                    "shards": NUM_SHARDS
-                }
-            }), 200
-        else:
-            # Circuit breaker has never been triggered
-            return jsonify({
-                "status": "ok",
-                "circuit_breaker": {
-                    "locked_down": False,
-                    "strike_count": 0,
-                    "strike_limit": STRIKE_LIMIT,
-                    "last_strike_timestamp": "Never"
-                },
-                "rate_limit": {
-                    "max_requests_per_minute": MAX_REQUESTS_PER_MINUTE,
-                    "shards": NUM_SHARDS
-                }
-            }), 200
+        return jsonify({
+            "status": "ok",
+            "circuit_breaker": {
+                "locked_down": data.get("locked_down", False),
+                "strike_count": data.get("strike_count", 0),
+                "strike_limit": STRIKE_LIMIT,
+                "last_strike_timestamp": str(data.get("last_strike_timestamp", "Never"))
+            },
+            "counter_store": counter_store.stats(),
+            "protection": {
+                "concurrent": PROTECTION_CONCURRENT_ENABLED and not PROTECTION_PIPELINE_ENABLED,
+                "batched": PROTECTION_PIPELINE_ENABLED,
+                "layer_latency": layer_latency.stats()
+            },
+            "ban_cache": ban_cache.stats() if ban_cache else None,
+            "bot_verdict_cache": user_agent_classifier.stats(),
+            "signature_cache": signature_cache.stats() if signature_cache else None,
+            "session_cache": session_manager.stats(),
+            "prompt_context_cache": prompt_context_cache.stats() if prompt_context_cache else None,
+            "token_budget": token_budget.stats(),
+            "workshop_catalog": workshop_catalog.stats(),
+            "active_sessions": active_session_counter.stats(),
+            "rate_limit": {
+                "max_requests_per_minute": MAX_REQUESTS_PER_MINUTE,
+                "shards": NUM_SHARDS,
+                "shard_counts": rate_limit_counter.stats() if rate_limit_counter else None,
+                "local_tier": local_rate_limiter.stats() if local_rate_limiter else None,
+                "ip_sketch": ip_sketch.stats() if ip_sketch else None,
+                "algorithm": RATE_LIMIT_ALGORITHM,
+                "gcra": {
+                    "endpoint": endpoint_gcra.stats(),
+                    "ip": ip_gcra.stats()
+                } if GCRA_ENABLED else None
+            }
+        }), 200
     except Exception as e:
         logger.error(f"Error getting system status: {e}", exc_info=True)
         return jsonify({"error": "Failed to get system status."}), 500
@@ -2254,7 +2934,10 @@ def system_status():
 def restore_system():
     """
     Admin endpoint to restore the system from lockdown.
-    Resets strike count and unlocks the circuit breaker.
+    Resets strike count and unlocks the circuit breaker and every instance's in-process
+    limiter state, then purges the rate limit collections in the background (202 + job
+    id; poll /admin/purge_status), or inside the request with PURGE_IN_REQUEST (200).
+    Local counter backends are cleared in place (200).
     REQUIRES: X-Admin-API-Key header with correct secret key from Secret Manager.
     """
     # SECURITY CHECK: Verify Admin API Key
@@ -2269,29 +2952,89 @@ def restore_system():
 
     logger.info("System restore endpoint hit (ADMIN ACTION) - Authorization successful.")
     try:
-        # Reset the circuit breaker document
-        CIRCUIT_BREAKER_DOC.set({
-            "strike_count": 0,
-            "locked_down": False,
-            "last_restore_timestamp": firestore.SERVER_TIMESTAMP
-        }, merge=False)
-
-        # Clear ALL rate limit shards
-        total_deleted = 0
-        for coll in ["rate_limit_shards", "ip_rate_limit_shards", "unauthenticated_bans"]:
-            try:
-                for doc in db.collection(coll).stream():
-                    doc.reference.delete()
-                    total_deleted += 1
-            except:
-                pass
-
-        logger.critical(f"SYSTEM RESTORED: Circuit breaker + {total_deleted} shards cleared.")
-        return jsonify({"status": "System restored. All limits cleared.", "shards_cleared": total_deleted}), 200
+        # Reset the circuit breaker first - the system is unlocked as soon as this returns
+        counter_store.reset_circuit_breaker()
+        reset_local_limits()
+
+        # Clear ALL rate limit data. Local counter backends clear synchronously (nothing lives
+        # in Firestore); Firestore collections are purged by a background BulkWriter job
+        if not FIRESTORE_COUNTERS:
+            counters_cleared = counter_store.clear_counters()
+            logger.critical(f"SYSTEM RESTORED: Circuit breaker reset, {counters_cleared} local counters cleared.")
+            return jsonify({
+                "status": "System restored. All limits cleared.",
+                "counters_cleared": counters_cleared
+            }), 200
+
+        purge_collections = [
+            RATE_LIMIT_COLLECTION, IP_RATE_LIMIT_COLLECTION, IP_SKETCH_COLLECTION,
+            GCRA_COLLECTION, UNAUTHENTICATED_BANS_COLLECTION
+        ]
+        if PURGE_IN_REQUEST:
+            # CPU stays allocated while the request is open (bounded by the request timeout)
+            job = PurgeJob(db, purge_collections, status_doc=PURGE_STATUS_DOC)
+            job.run()
+            logger.critical(f"SYSTEM RESTORED: Circuit breaker reset, purge job {job.job_id} {job.state}.")
+            return jsonify({
+                "status": "System restored. All limits cleared." if job.state == "completed" else "System restored. Purge incomplete - call again to retry.",
+                "purge_job": job.status()
+            }), 200 if job.state == "completed" else 500
+
+        job = start_purge_job(purge_collections)
+
+        logger.critical(f"SYSTEM RESTORED: Circuit breaker reset, purge job {job.job_id} running.")
+        return jsonify({
+            "status": "System restored. Limits are being cleared in the background.",
+            "purge_job": job.status(),
+            "status_url": f"/admin/purge_status?job_id={job.job_id}"
+        }), 202
     except Exception as e:
         logger.error(f"Error restoring system: {e}", exc_info=True)
         return jsonify({"error": "Failed to restore system."}), 500
 
+def start_purge_job(collections: List[str]) -> PurgeJob:
+    """Starts a background purge, or returns the one already running on this instance."""
+    global _purge_job
+    with _purge_job_lock:
+        if _purge_job and _purge_job.is_running():
+            logger.info(f"Purge job {_purge_job.job_id} already running - not starting another.")
+            return _purge_job
+        _purge_job = PurgeJob(db, collections, status_doc=PURGE_STATUS_DOC).start()
+        return _purge_job
+
+@app.route("/admin/purge_status", methods=["GET"])
+def purge_status():
+    """
+    Admin endpoint to poll the background purge started by /admin/restore_system.
+    Reads the progress document, so any instance can answer for a job running on another.
+    REQUIRES: X-Admin-API-Key header with correct secret key from Secret Manager.
+    """
+    if not ADMIN_API_KEY:
+        logger.error("CRITICAL: ADMIN_API_KEY is not configured. Admin endpoint is disabled.")
+        return jsonify({"error": "Endpoint not configured."}), 500
+
+    if request.headers.get('X-Admin-API-Key') != ADMIN_API_KEY:
+        logger.warning(f"Unauthorized attempt to access /admin/purge_status from {request.remote_addr}.")
+        return jsonify({"error": "Unauthorized."}), 401
+
+    try:
+        if not FIRESTORE_COUNTERS:
+            return jsonify({"error": "No purge jobs with local counter backends."}), 404
+
+        job_id = request.args.get('job_id')
+        if _purge_job and (not job_id or _purge_job.job_id == job_id):
+            return jsonify(_purge_job.status()), 200
+
+        snapshot = PURGE_STATUS_DOC.get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data or (job_id and data.get("job_id") != job_id):
+            return jsonify({"error": "Purge job not found."}), 404
+        data.pop("updated_at", None)
+        return jsonify(data), 200
+    except Exception as e:
+        logger.error(f"Error getting purge status: {e}", exc_info=True)
+        return jsonify({"error": "Failed to get purge status."}), 500
+
 @app.route("/wakeup", methods=["GET"])
 def wakeup():
     """A lightweight endpoint to wake up a cold Cloud Run instance. NOT rate-limited."""
@@ -2561,7 +3304,7 @@ def stripe_webhook():
             }
 
             # Save to orders collection using payment intent ID as document ID
-            db.collection('orders').document(payment_intent_id).set(order_data, merge=True)
+            get_firestore_db().collection('orders').document(payment_intent_id).set(order_data, merge=True)
             logger.info(f"[Webhook] ✅ Order saved to Firestore: orders/{payment_intent_id}")
 
             # Send email notification to you
@@ -2589,7 +3332,7 @@ def stripe_webhook():
 
         # Log failed payment
         try:
-            db.collection('failed_payments').document(payment_intent_id).set({
+            get_firestore_db().collection('failed_payments').document(payment_intent_id).set({
                 'stripePaymentId': payment_intent_id,
                 'error': error_message,
                 'status': 'failed',
@@ -2629,7 +3372,7 @@ def stripe_webhook():
         # Update order status
         if payment_intent_id:
             try:
-                db.collection('orders').document(payment_intent_id).update({
+                get_firestore_db().collection('orders').document(payment_intent_id).update({
                     'status': 'refunded',
                     'amount_refunded': amount_refunded,
                     'refundedAt': firestore.SERVER_TIMESTAMP
@@ -2655,7 +3398,7 @@ def stripe_webhook():
 
         # Log dispute for review
         try:
-            db.collection('disputes').document(dispute_id).set({
+            get_firestore_db().collection('disputes').document(dispute_id).set({
                 'disputeId': dispute_id,
                 'chargeId': charge_id,
                 'amount': amount,
@@ -2750,7 +3493,7 @@ def store_customer():
         logger.info(f"[StoreCustomer] Full customer data to store: {customer_data}")
 
         # Add to 'customers' collection with auto-generated ID
-        doc_ref = db.collection('customers').add(customer_data)
+        doc_ref = get_firestore_db().collection('customers').add(customer_data)
         customer_id = doc_ref[1].id  # doc_ref returns (write_time, document_ref)
 
         logger.info(f"[StoreCustomer] Customer stored successfully with ID: {customer_id}")
@@ -2914,7 +3657,7 @@ def record_and_distribute_transaction():
         # ========================================================================
         logger.info("[Orchestrator] Step 4: Writing to MOON Firestore (backup)...")
         try:
-            db.collection('customers').document(pi_id).set(golden_record)
+            get_firestore_db().collection('customers').document(pi_id).set(golden_record)
             logger.info(f"[Orchestrator] ✅ Backup write to MOON Firestore successful.")
         except Exception as e:
             logger.error(f"[Orchestrator] ⚠️ WARNING: MOON Firestore backup write failed: {e}")
@@ -0,0 +1,72 @@
+"""
+Prompt Template Module - Chat Prompt Compiled Once at Startup
+
+The chat prompt is a large static prefix (persona, boundaries, guiding
+principle, concierge text, knowledge base) followed by a small per-turn tail
+(info mode and booking context sections, conversation history, the user's
+message, and the fixed safety/format instructions).
+
+ChatPromptTemplate joins the static prefix once and splits the tail template
+at its two placeholders, so rendering a prompt is a handful of string
+concatenations instead of re-joining every section and re-rendering the
+safety block on each turn. The output is byte-for-byte what the previous
+per-turn assembly produced:
+
+    "\\n".join(part for part in [*static_parts, *dynamic_sections, tail] if part.strip())
+
+The static prefix is kept exactly as written (no whitespace normalization),
+because the model sees the same bytes either way and any change would alter
+the prompt.
+"""
+
+import hashlib
+
+HISTORY_PLACEHOLDER = "{conversation_history_context}"
+MESSAGE_PLACEHOLDER = "{user_message}"
+
+
+class ChatPromptTemplate:
+    """
+    Immutable compiled chat prompt.
+
+    Args:
+        static_parts (list): Sections that never change between turns, in order
+        tail_template (str): Closing section containing HISTORY_PLACEHOLDER and
+            then MESSAGE_PLACEHOLDER (no other braces are interpreted)
+        catalog_version (str): Content hash of the workshop catalog rendered into the
+            prefix; prepended to the version so caches keyed on it follow the catalog
+
+    Raises:
+        ValueError: If the tail template is missing a placeholder
+    """
+
+    __slots__ = ("static_prefix", "version", "tail_text", "_tail_head", "_tail_middle", "_tail_end")
+
+    def __init__(self, static_parts, tail_template, catalog_version=None):
+        head, found_history, rest = tail_template.partition(HISTORY_PLACEHOLDER)
+        middle, found_message, end = rest.partition(MESSAGE_PLACEHOLDER)
+        if not found_history or not found_message:
+            raise ValueError("Tail template must contain the history and then the user message placeholder")
+        self.static_prefix = "\n".join(part for part in static_parts if part.strip())
+        prefix_hash = hashlib.sha256(self.static_prefix.encode("utf-8")).hexdigest()
+        self.version = f"{catalog_version}-{prefix_hash[:8]}" if catalog_version else prefix_hash[:16]
+        self._tail_head = head
+        self._tail_middle = middle
+        self._tail_end = end
+        self.tail_text = head + middle + end  # Fixed text of the tail (for token accounting)
+
+    def _tail(self, conversation_history_context, user_message):
+        return "".join((self._tail_head, conversation_history_context, self._tail_middle, user_message, self._tail_end))
+
+    def render_tail(self, dynamic_sections, conversation_history_context, user_message):
+        """Per-turn part of the prompt (everything after the static prefix)."""
+        parts = [section for section in dynamic_sections if section.strip()]
+        parts.append(self._tail(conversation_history_context, user_message))
+        return "\n".join(parts)
+
+    def render(self, dynamic_sections, conversation_history_context, user_message):
+        """Full prompt: static prefix plus the rendered tail, built with a single join."""
+        parts = [self.static_prefix] if self.static_prefix else []
+        parts.extend(section for section in dynamic_sections if section.strip())
+        parts.append(self._tail(conversation_history_context, user_message))
+        return "\n".join(parts)
@@ -0,0 +1,491 @@
+"""
+Session Cache Module - Write-Behind LRU Cache in Front of the Session Store
+
+/chat reads the session at the start of every turn and writes it at the end,
+and story commands read it a second time. This cache keeps recently used
+sessions in process so those repeat reads are free. Writes are marked dirty
+and flushed by a background thread, so several updates to the same session
+within one flush interval collapse into a single store write.
+
+Persistence goes through a SessionStore (session_store.py): the sessions
+collection in production, or a memory/SQLite store for local runs.
+
+Consistency: every cached session remembers the store version (Firestore
+update_time) it was based on, and flushes carry that as a write precondition
+(create() for brand-new sessions). If another instance wrote the session in
+the meantime the precondition fails; the session is then reloaded and this
+instance's pending changes (every field path that differs from the version it
+was based on, including updates queued after the failed flush) are reapplied on
+top and written on the next pass. Field paths both instances changed end up
+with this instance's value. A session deleted elsewhere stays deleted.
+
+Clean entries are served for ttl_seconds without re-reading. main.py defaults
+to 300 s, which covers the gap between a user's turns, and relies on Cloud Run
+session affinity (--session-affinity) to send those turns to the same
+instance. A turn served from a stale copy (routed elsewhere in between) is
+caught by the version precondition and rebased, but a field both turns
+changed (the conversation window) keeps only this instance's value. Without
+affinity, set the TTL to a couple of seconds so only in-turn repeat reads are
+cached. benchmarks/session_cache_sim.py measures both.
+
+Durability: updates are held in memory until flushed. main.py flushes every
+15 s, so turns of the same session within that window cost one write. That
+needs CPU between requests (Cloud Run --no-cpu-throttling); the loss window is
+up to flush_interval of updates per instance if it is stopped without running
+atexit. SESSION_FLUSH_ON_RESPONSE=true writes before every response instead
+(no coalescing across turns, nothing held after a response).
+
+Delta writes: each entry also keeps the document as last persisted. A flush
+diffs the session against it and sends only the changed field paths (down to
+"state.<field>" / "story_state.<field>") through update(), so a turn that only
+bumps request_count no longer rewrites conversation_history and story_state.
+
+Encoding: with compact=True, story_state and the conversation history are
+stored as compressed blobs (session_codec.py). Documents written before that
+(schema_version 0) still load and are upgraded on their next write. A session
+that cannot be encoded stays dirty and is counted in errors.
+
+WriteThroughSessionManager is the uncached alternative (SESSION_CACHE_ENABLED
+=false): the same get_session / update_session / delete_session /
+get_active_sessions_count interface over the same SessionStore and document
+encoding, but every call goes to the store and updates are written before
+update_session() returns.
+"""
+
+import atexit
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from background import LazyWorker
+from booking_state import BookingState
+from session_codec import decode_document, document_version, encode_document, SCHEMA_VERSION
+from session_store import METADATA_FIELDS, SessionConflict
+
+logger = logging.getLogger(__name__)
+
+# Firestore has no set type: these state fields are stored as lists
+SET_FIELDS = ("triggered_hardcodes",)
+
+# Estimated size of the ttl and last_activity timestamps sent with every write
+METADATA_BYTES = len("ttl") + 1 + 8 + len("last_activity") + 1 + 8
+
+# Maps are diffed this many levels deep ("state.workshop_id"); deeper changes replace the map
+DIFF_DEPTH = 2
+
+
+def to_document(session, compact=False):
+    """App-side session dict -> Firestore fields (sets become lists, bulky fields blobs if compact)."""
+    document = dict(session)
+    state = document.get("state")
+    if isinstance(state, dict):
+        document["state"] = {key: sorted(value) if key in SET_FIELDS and isinstance(value, set) else value
+                             for key, value in state.items()}
+    return encode_document(document) if compact else document
+
+
+def from_document(document):
+    """Firestore fields of any schema version -> app-side session dict (lists become sets)."""
+    session = decode_document(document)
+    state = session.get("state")
+    if isinstance(state, dict):
+        session["state"] = {key: set(value or []) if key in SET_FIELDS else value
+                            for key, value in state.items()}
+    return session
+
+
+def diff_fields(old, new, prefix=(), depth=DIFF_DEPTH):
+    """
+    Field-path changes turning document `old` into `new`.
+    Returns {field path: new value or firestore.DELETE_FIELD}.
+    """
+    changes = {}
+    for key, value in new.items():
+        path = prefix + (key,)
+        previous = old.get(key, _MISSING)
+        if previous == value and type(previous) is type(value):
+            continue
+        if depth > 1 and isinstance(value, dict) and isinstance(previous, dict) and value:
+            changes.update(diff_fields(previous, value, path, depth - 1))
+        else:
+            changes[FieldPath(*path).to_api_repr()] = value
+    for key in old:
+        if key not in new:
+            changes[FieldPath(*prefix, key).to_api_repr()] = firestore.DELETE_FIELD
+    return changes
+
+
+def apply_fields(document, changes):
+    """Copy of `document` with diff_fields() changes applied (the inverse of the diff)."""
+    result = copy.deepcopy(document)
+    for path, value in changes.items():
+        parts = FieldPath.from_api_repr(path).parts
+        target = result
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        if value is firestore.DELETE_FIELD:
+            target.pop(parts[-1], None)
+        else:
+            target[parts[-1]] = copy.deepcopy(value)
+    return result
+
+
+def estimate_size(value):
+    """Approximate Firestore storage size in bytes (strings +1, numbers 8, maps = keys + values)."""
+    if isinstance(value, dict):
+        return sum(len(str(key).encode("utf-8")) + 1 + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if value is None or isinstance(value, bool):
+        return 1
+    return 8
+
+
+def session_fields(booking_manager, request_count=None, state_unchanged=False):
+    """
+    Fields an update_session() call sets: a BookingContextManager's state
+    (BookingState.to_dict(), skipped if state_unchanged and it has no changes)
+    or a session dict's fields, plus request_count.
+    """
+    state = getattr(booking_manager, "state", None)
+    if isinstance(state, BookingState):
+        fields = {} if state_unchanged and not state.changed_fields() else {"state": state.to_dict()}
+        state.mark_clean()
+    elif state is not None:
+        fields = {"state": copy.deepcopy(state)}
+    else:
+        fields = copy.deepcopy(dict(booking_manager))
+    if request_count is not None:
+        fields["request_count"] = request_count
+    return fields
+
+
+_MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("data", "version", "dirty", "loaded_at", "persisted")
+
+    def __init__(self, data, version, persisted=None):
+        self.data = data
+        self.version = version  # None = document does not exist yet
+        self.dirty = False
+        self.loaded_at = time.monotonic()
+        self.persisted = persisted or {}  # Document fields as last written/read (for deltas)
+
+
+class WriteBehindSessionCache:
+    """
+    In-process LRU/TTL session cache with coalesced asynchronous write-back.
+
+    Args:
+        store: SessionStore the sessions are persisted in
+        max_entries (int): LRU capacity (dirty entries are never evicted)
+        ttl_seconds (float): How long a clean entry is served without re-reading
+        flush_interval (float): Seconds between write-back passes
+        session_ttl_minutes (int): Session lifetime after its last write (document ttl field)
+        compact (bool): Store bulky fields as compressed blobs (session_codec.py)
+    """
+
+    def __init__(self, store, max_entries=1000, ttl_seconds=30.0, flush_interval=1.0,
+                 session_ttl_minutes=30, compact=True):
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.session_ttl_minutes = session_ttl_minutes
+        self.compact = compact
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._worker = LazyWorker(self._flush_loop, "session-write-behind", on_start=lambda: atexit.register(self.flush))
+
+        self._hits = 0
+        self._misses = 0
+        self._updates = 0
+        self._writes = 0
+        self._conflicts = 0
+        self._errors = 0
+        self._bytes_written = 0
+        self._bytes_full = 0
+        self._upgrades = 0
+
+    # -------------------------------------------------------------------------
+    # Lifecycle (flusher starts on first use, see background.py)
+    # -------------------------------------------------------------------------
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Session write-behind pass failed: {e}")
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def _load(self, session_id):
+        document, version = self.store.read(session_id)
+        if document is None:
+            return None
+        entry = _Entry(from_document(document), version, document)
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current and current.dirty:
+                return current  # A local update raced the read - keep it
+            self._entries[session_id] = entry
+            self._evict()
+        return entry
+
+    def _fresh_entry(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry and (entry.dirty or time.monotonic() - entry.loaded_at < self.ttl_seconds):
+                self._entries.move_to_end(session_id)
+                self._hits += 1
+                return entry
+            self._misses += 1
+        return self._load(session_id)
+
+    def get_session(self, session_id):
+        """Returns a copy of the session dict, or None if it does not exist."""
+        self._worker.ensure_started()
+        entry = self._fresh_entry(session_id)
+        if entry is None:
+            return None
+        with self._lock:
+            return copy.deepcopy(entry.data)
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def update_session(self, session_id, booking_manager, request_count=None):
+        """
+        Queue a session update. Accepts a BookingContextManager (its state is saved)
+        or a session dict (its fields are saved); other fields are kept.
+        """
+        self._worker.ensure_started()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            # Skip copying a BookingState that has not changed since it was loaded/saved
+            state_unchanged = entry is not None and "state" in entry.data
+        fields = session_fields(booking_manager, request_count, state_unchanged)
+
+        if entry is None:
+            # Not cached: learn the current version first so the flush has a precondition
+            entry = self._load(session_id)
+        with self._lock:
+            if entry is None:
+                entry = self._entries.get(session_id) or _Entry({}, None)
+                self._entries[session_id] = entry
+            entry.data.update(fields)
+            entry.dirty = True
+            self._entries.move_to_end(session_id)
+            self._updates += 1
+            self._evict()
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+        self.store.delete(session_id)
+
+    def flush(self):
+        """Write every dirty session (one write per session, however many updates it had)."""
+        with self._lock:
+            pending = [(session_id, entry, copy.deepcopy(entry.data), entry.version, entry.persisted)
+                       for session_id, entry in self._entries.items() if entry.dirty]
+            for pending_write in pending:
+                pending_write[1].dirty = False
+
+        for session_id, entry, data, version, persisted in pending:
+            self._write(session_id, entry, data, version, persisted)
+
+    def _write(self, session_id, entry, data, version, persisted):
+        expires_at = datetime.now() + timedelta(minutes=self.session_ttl_minutes)
+        try:
+            document = to_document(data, self.compact)
+            if version is None:
+                written = document
+                new_version = self.store.create(session_id, document, expires_at)
+            else:
+                # Only the changed field paths (plus ttl/last_activity)
+                written = diff_fields(persisted, document)
+                new_version = self.store.update(session_id, document, written, expires_at, version)
+            with self._lock:
+                entry.version = new_version
+                entry.loaded_at = time.monotonic()
+                entry.persisted = document
+            self._writes += 1
+            if self.compact and document_version(persisted) < SCHEMA_VERSION and version is not None:
+                self._upgrades += 1
+            self._bytes_written += estimate_size(written) + METADATA_BYTES
+            self._bytes_full += estimate_size(document) + METADATA_BYTES
+        except SessionConflict:
+            # Another instance wrote (or deleted) this session since we read it
+            self._conflicts += 1
+            self._rebase(session_id, entry)
+        except Exception as e:
+            self._errors += 1
+            with self._lock:
+                entry.dirty = True  # Retry on the next pass
+            logger.error(f"Failed to write session [{session_id}]: {e}")
+
+    def _rebase(self, session_id, entry):
+        """Reload a conflicted session and reapply this instance's pending changes on top."""
+        try:
+            document, version = self.store.read(session_id)
+        except Exception as e:
+            self._errors += 1
+            with self._lock:
+                entry.dirty = True  # Retry the write (and conflict) on the next pass
+            logger.error(f"Failed to reload conflicted session [{session_id}]: {e}")
+            return
+
+        with self._lock:
+            if self._entries.get(session_id) is not entry:
+                return  # Deleted or replaced locally meanwhile
+            if document is None:
+                # Deleted elsewhere (e.g. conversation reset): the deletion wins
+                del self._entries[session_id]
+                logger.warning(f"Session [{session_id}] deleted elsewhere - dropped local update")
+                return
+            # Everything that differs from the version this entry was based on, including
+            # updates queued after the failed flush took its snapshot
+            changes = diff_fields(entry.persisted, to_document(entry.data, self.compact))
+            rebased = apply_fields(document, changes)
+            entry.data = from_document(rebased)
+            entry.version = version
+            entry.persisted = document
+            entry.loaded_at = time.monotonic()
+            entry.dirty = True
+        logger.warning(f"Session [{session_id}] changed elsewhere - reapplied {len(changes)} local change(s) on the newer version")
+
+    def _evict(self):
+        # Called with the lock held: drop least recently used clean entries
+        if len(self._entries) <= self.max_entries:
+            return
+        for session_id in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if not self._entries[session_id].dirty:
+                del self._entries[session_id]
+
+    # -------------------------------------------------------------------------
+    # Misc
+    # -------------------------------------------------------------------------
+    def get_active_sessions_count(self):
+        return self.store.count_active()
+
+    def stats(self):
+        """Hit ratio and write savings (for /system_status)."""
+        with self._lock:
+            entries = len(self._entries)
+            dirty = sum(1 for entry in self._entries.values() if entry.dirty)
+        reads = self._hits + self._misses
+        return {
+            "store": self.store.stats(),
+            "entries": entries,
+            "dirty": dirty,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / reads, 4) if reads else None,
+            "updates": self._updates,
+            "writes": self._writes,
+            "writes_saved": max(0, self._updates - self._writes - self._conflicts - self._errors - dirty),
+            "conflicts": self._conflicts,
+            "errors": self._errors,
+            "bytes_written": self._bytes_written,
+            "bytes_full_rewrite": self._bytes_full,
+            "avg_bytes_per_write": round(self._bytes_written / self._writes) if self._writes else None,
+            "schema_upgrades": self._upgrades,
+        }
+
+
+class WriteThroughSessionManager:
+    """
+    Uncached session manager: reads and writes go straight to the SessionStore.
+
+    update_session() reads the current document, applies the update and writes
+    it back with the version precondition, retrying on conflict, so concurrent
+    instances never overwrite each other's fields.
+
+    Args:
+        store: SessionStore the sessions are persisted in
+        session_ttl_minutes (int): Session lifetime after its last write (document ttl field)
+        compact (bool): Store bulky fields as compressed blobs (session_codec.py)
+        max_retries (int): Conflicting writes retried before the update is dropped
+    """
+
+    def __init__(self, store, session_ttl_minutes=30, compact=True, max_retries=3):
+        self.store = store
+        self.session_ttl_minutes = session_ttl_minutes
+        self.compact = compact
+        self.max_retries = max_retries
+
+        self._reads = 0
+        self._writes = 0
+        self._conflicts = 0
+        self._errors = 0
+
+    def get_session(self, session_id):
+        """Returns the session dict, or None if it does not exist."""
+        document, _ = self.store.read(session_id)
+        self._reads += 1
+        return from_document(document) if document is not None else None
+
+    def update_session(self, session_id, booking_manager, request_count=None):
+        """Write a session update. Accepts a BookingContextManager or a session dict; other fields are kept."""
+        fields = session_fields(booking_manager, request_count)
+        for _ in range(self.max_retries + 1):
+            try:
+                document, version = self.store.read(session_id)
+                session = from_document(document) if document is not None else {}
+                session.update(fields)
+                updated = to_document(session, self.compact)
+                expires_at = datetime.now() + timedelta(minutes=self.session_ttl_minutes)
+                if version is None:
+                    self.store.create(session_id, updated, expires_at)
+                else:
+                    self.store.update(session_id, updated, diff_fields(document, updated), expires_at, version)
+                self._writes += 1
+                return
+            except SessionConflict:
+                self._conflicts += 1
+            except Exception as e:
+                self._errors += 1
+                logger.error(f"Failed to write session [{session_id}]: {e}")
+                return
+        self._errors += 1
+        logger.error(f"Dropped update to session [{session_id}] after {self.max_retries + 1} conflicting writes")
+
+    def delete_session(self, session_id):
+        self.store.delete(session_id)
+
+    def flush(self):
+        """Nothing is held back: updates are written by update_session()."""
+
+    def get_active_sessions_count(self):
+        return self.store.count_active()
+
+    def stats(self):
+        """Store reads and writes (for /system_status)."""
+        return {
+            "store": self.store.stats(),
+            "cached": False,
+            "reads": self._reads,
+            "writes": self._writes,
+            "conflicts": self._conflicts,
+            "errors": self._errors,
+        }
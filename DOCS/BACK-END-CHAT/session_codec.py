@@ -0,0 +1,120 @@
+"""
+Session Codec Module - Compact Versioned Encoding for Bulky Session Fields
+
+Story sessions carry the whole chapter (saga_title, world_concept, narrative,
+choices) in story_state, and every turn re-stores it as a nested Firestore map
+of long strings. This module stores such fields as a single bytes value
+instead:
+
+    blob = MAGIC (2 bytes) + codec version (1 byte) + zlib(compact JSON)
+
+Small values (under MIN_BLOB_BYTES of JSON) are left as plain maps/lists,
+where the zlib header would cost more than it saves.
+
+Documents carry a schema_version field:
+    0 (field absent) - every field stored as plain Firestore values
+    1                - BLOB_FIELDS may be blobs
+
+decode_document() accepts every version, so old documents keep loading; the
+write-behind session cache writes them back at SCHEMA_VERSION, which upgrades
+them on their next update. Both session managers decode through
+session_cache.from_document() (the write-behind cache and the uncached
+WriteThroughSessionManager), so SESSION_CACHE_ENABLED can be turned off after
+blobs have been written.
+
+Blob fields must hold JSON types (dict, list, str, int, float, bool, None).
+Anything else raises TypeError instead of being stringified, since a set or
+datetime would otherwise come back as a different type.
+"""
+
+import json
+import zlib
+
+SCHEMA_VERSION = 1
+SCHEMA_FIELD = "schema_version"
+
+# (path) of the fields worth compressing; nested paths address the session's state map
+BLOB_FIELDS = (
+    ("story_state",),
+    ("state", "conversation_history"),
+)
+
+MAGIC = b"MT"
+CODEC_VERSION = 1
+MIN_BLOB_BYTES = 256
+COMPRESSION_LEVEL = 6
+
+
+def _unsupported(value):
+    raise TypeError(f"Session field of type {type(value).__name__} cannot be stored as a blob")
+
+
+def encode_value(value):
+    """Value -> blob, or the value unchanged if it is too small to benefit.
+
+    Raises:
+        TypeError: If the value contains anything but JSON types
+    """
+    raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_unsupported).encode("utf-8")
+    if len(raw) < MIN_BLOB_BYTES:
+        return value
+    return MAGIC + bytes([CODEC_VERSION]) + zlib.compress(raw, COMPRESSION_LEVEL)
+
+
+def is_blob(value):
+    return isinstance(value, (bytes, bytearray)) and bytes(value[:2]) == MAGIC
+
+
+def decode_value(value):
+    """Blob -> value; anything else is returned unchanged.
+
+    Raises:
+        ValueError: If the blob was written by an unknown codec version
+    """
+    if not is_blob(value):
+        return value
+    version = value[2]
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unknown session codec version {version}")
+    return json.loads(zlib.decompress(bytes(value[3:])).decode("utf-8"))
+
+
+def _map_field(document, path, transform):
+    # Apply transform to the field at path in place (parents are shallow-copied first)
+    parent = document
+    for key in path[:-1]:
+        child = parent.get(key)
+        if not isinstance(child, dict):
+            return
+        parent[key] = child = dict(child)
+        parent = child
+    if path[-1] in parent:
+        parent[path[-1]] = transform(parent[path[-1]])
+
+
+def encode_document(document):
+    """Firestore-ready document -> copy with BLOB_FIELDS compacted and schema_version set."""
+    encoded = dict(document)
+    for path in BLOB_FIELDS:
+        _map_field(encoded, path, encode_value)
+    encoded[SCHEMA_FIELD] = SCHEMA_VERSION
+    return encoded
+
+
+def decode_document(document):
+    """Stored document of any schema version -> plain document without schema_version.
+
+    Raises:
+        ValueError: If the document is from a newer schema than this code knows
+    """
+    decoded = dict(document)
+    version = decoded.pop(SCHEMA_FIELD, 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Session document schema {version} is newer than supported {SCHEMA_VERSION}")
+    for path in BLOB_FIELDS:
+        _map_field(decoded, path, decode_value)
+    return decoded
+
+
+def document_version(document):
+    return (document or {}).get(SCHEMA_FIELD, 0)
@@ -0,0 +1,98 @@
+"""
+Session Counter Module - Background-Refreshed Active Session Count
+
+build_prompt logged the number of active sessions on every chat turn, and
+call_gemini_flash did the same on every 429, each time asking the session
+manager to scan the sessions collection. The count is only used for
+monitoring, so this module keeps it in memory instead:
+
+- a background thread re-counts every refresh_interval seconds
+- readers get the cached value immediately (None until the first count)
+  and never touch Firestore
+
+For Firestore the count is a server-side aggregation over documents whose
+ttl has not passed yet (count_active_sessions), billed as one read per
+1000 matching documents instead of one per document.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+
+def count_active_sessions(collection, ttl_field="ttl"):
+    """Count documents in a sessions collection whose TTL is still in the future."""
+    query = collection.where(ttl_field, ">", datetime.now(timezone.utc))
+    results = query.count(alias="active").get()
+    return int(results[0][0].value)
+
+
+class ActiveSessionCounter:
+    """
+    Cached active session count refreshed by a background thread.
+
+    Args:
+        count_fn: Callable returning the current active session count
+        refresh_interval (float): Seconds between background recounts
+    """
+
+    def __init__(self, count_fn, refresh_interval=30.0):
+        self._count_fn = count_fn
+        self.refresh_interval = refresh_interval
+        self._value = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._worker = LazyWorker(self._refresh_loop, "session-counter")
+
+        self._refreshes = 0
+        self._errors = 0
+        self._last_duration_ms = None
+
+    # -------------------------------------------------------------------------
+    # Lifecycle (refresh thread starts on first use, see background.py)
+    # -------------------------------------------------------------------------
+    def _refresh_loop(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Recount now. Keeps the previous value on errors."""
+        started = time.perf_counter()
+        try:
+            value = self._count_fn()
+        except Exception as e:
+            self._errors += 1
+            logger.warning(f"Could not refresh active session count: {e}")
+            return
+        with self._lock:
+            self._value = value
+            self._refreshed_at = time.time()
+            self._refreshes += 1
+            self._last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def value(self):
+        """Last counted number of active sessions, or None before the first count."""
+        self._worker.ensure_started()
+        return self._value
+
+    def stats(self):
+        """Cached count and refresh health (for /system_status)."""
+        self._worker.ensure_started()
+        with self._lock:
+            return {
+                "active_sessions": self._value,
+                "age_seconds": round(time.time() - self._refreshed_at, 1) if self._refreshed_at else None,
+                "refresh_interval_seconds": self.refresh_interval,
+                "refreshes": self._refreshes,
+                "errors": self._errors,
+                "last_refresh_ms": self._last_duration_ms,
+            }
@@ -0,0 +1,333 @@
+"""
+Session Store Module - Pluggable Persistence Behind the Session Cache
+
+The write-behind session cache (session_cache.py) needs five operations from
+whatever holds the session documents:
+
+- read(session_id)                                -> (document, version)
+- create(session_id, document, expires_at)        -> version
+- update(session_id, document, changes, expires_at, version) -> version
+- delete(session_id)
+- count_active()                                  -> sessions not yet expired
+
+`version` is an opaque token for optimistic concurrency: create() fails if
+the session exists and update() fails if the stored version moved on, both
+with SessionConflict. `changes` are the field-path deltas computed by the
+cache; backends that store whole documents may ignore them.
+
+SessionStore defines that interface; three backends implement it:
+
+- FirestoreSessionStore: sessions collection, update_time preconditions (multi-instance)
+- MemorySessionStore:    dict behind a lock (one process, benchmarks, tests on a laptop)
+- SqliteSessionStore:    one SQLite file in WAL mode (all workers on one box)
+
+The local backends expire sessions themselves: expired sessions read as
+missing and are pruned periodically, like Firestore's TTL policy on "ttl".
+"""
+
+import base64
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from google.api_core import exceptions as gcp_exceptions
+
+from session_counter import count_active_sessions
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("firestore", "memory", "sqlite")
+
+# Written with every document, not part of the session itself
+METADATA_FIELDS = ("ttl", "last_activity")
+
+# Local backends prune expired sessions at most this often
+PRUNE_INTERVAL_SECONDS = 60
+
+
+class SessionConflict(Exception):
+    """The stored session was created, changed or deleted since it was read."""
+
+
+def _epoch(expires_at):
+    return expires_at.timestamp() if isinstance(expires_at, datetime) else float(expires_at)
+
+
+class SessionStore:
+    """Interface for session document persistence."""
+
+    backend = None
+
+    def read(self, session_id):
+        """(document, version) of a live session, or (None, None)."""
+        raise NotImplementedError
+
+    def create(self, session_id, document, expires_at):
+        """Store a new session. Returns its version; SessionConflict if it already exists."""
+        raise NotImplementedError
+
+    def update(self, session_id, document, changes, expires_at, version):
+        """Replace a session read at `version`. Returns the new version; SessionConflict if it moved on."""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def count_active(self):
+        """Number of sessions that have not expired."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.backend}
+
+
+# =============================================================================
+# Firestore (sessions collection)
+# =============================================================================
+class FirestoreSessionStore(SessionStore):
+    """
+    Sessions collection with update_time write preconditions.
+
+    Updates send only `changes` (field paths), plus ttl and last_activity.
+
+    Args:
+        db: Firestore client for the sessions project
+        collection_name (str): Sessions collection
+    """
+
+    backend = "firestore"
+
+    def __init__(self, db, collection_name="sessions"):
+        self.db = db
+        self.collection = db.collection(collection_name)
+
+    def read(self, session_id):
+        snapshot = self.collection.document(session_id).get()
+        if not snapshot.exists:
+            return None, None
+        document = {key: value for key, value in snapshot.to_dict().items() if key not in METADATA_FIELDS}
+        return document, snapshot.update_time
+
+    def create(self, session_id, document, expires_at):
+        try:
+            result = self.collection.document(session_id).create(
+                {**document, "ttl": expires_at, "last_activity": datetime.now()}
+            )
+        except gcp_exceptions.AlreadyExists as e:
+            raise SessionConflict(str(e)) from e
+        return result.update_time
+
+    def update(self, session_id, document, changes, expires_at, version):
+        try:
+            result = self.collection.document(session_id).update(
+                {**changes, "ttl": expires_at, "last_activity": datetime.now()},
+                option=self.db.write_option(last_update_time=version)
+            )
+        except (gcp_exceptions.FailedPrecondition, gcp_exceptions.NotFound) as e:
+            raise SessionConflict(str(e)) from e
+        return result.update_time
+
+    def delete(self, session_id):
+        self.collection.document(session_id).delete()
+
+    def count_active(self):
+        return count_active_sessions(self.collection)
+
+
+# =============================================================================
+# In-memory (single process)
+# =============================================================================
+class MemorySessionStore(SessionStore):
+    """
+    Process-local backend. Sessions are lost on restart and not shared between
+    workers, so only use it with a single worker.
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self._sessions = {}  # session_id -> (document, version, expires_at epoch)
+        self._versions = 0
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        # Called with the lock held
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        now = time.time()
+        for session_id in [session_id for session_id, stored in self._sessions.items() if stored[2] <= now]:
+            del self._sessions[session_id]
+
+    def _live(self, session_id):
+        # Called with the lock held
+        stored = self._sessions.get(session_id)
+        if stored and stored[2] <= time.time():
+            del self._sessions[session_id]
+            return None
+        return stored
+
+    def read(self, session_id):
+        with self._lock:
+            stored = self._live(session_id)
+            if stored is None:
+                return None, None
+            return copy.deepcopy(stored[0]), stored[1]
+
+    def _store(self, session_id, document, expires_at):
+        # Called with the lock held
+        self._versions += 1
+        self._sessions[session_id] = (copy.deepcopy(document), self._versions, _epoch(expires_at))
+        self._prune()
+        return self._versions
+
+    def create(self, session_id, document, expires_at):
+        with self._lock:
+            if self._live(session_id) is not None:
+                raise SessionConflict(f"Session {session_id} already exists")
+            return self._store(session_id, document, expires_at)
+
+    def update(self, session_id, document, changes, expires_at, version):
+        with self._lock:
+            stored = self._live(session_id)
+            if stored is None or stored[1] != version:
+                raise SessionConflict(f"Session {session_id} changed since version {version}")
+            return self._store(session_id, document, expires_at)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def count_active(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for stored in self._sessions.values() if stored[2] > now)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "stored": len(self._sessions)}
+
+
+# =============================================================================
+# SQLite WAL (all processes on one host)
+# =============================================================================
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    return str(value)
+
+
+def _decode(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    SQLite backend shared by every worker process on one host.
+
+    Documents are stored as JSON (bytes fields such as compact session blobs
+    are base64-wrapped). Versions are write timestamps in nanoseconds checked
+    in the UPDATE's WHERE clause, so concurrent workers get the same conflict
+    semantics as the Firestore preconditions (and a deleted and re-created
+    session never reuses a version).
+
+    Args:
+        path (str): Database file (created if missing)
+        busy_timeout_ms (int): How long a writer waits for the lock before failing
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._pruned_at = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                document TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _conn(self):
+        # One connection per thread (sqlite3 connections are not thread-safe)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _prune(self, conn):
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def read(self, session_id):
+        row = self._conn().execute(
+            "SELECT document, version FROM sessions WHERE session_id = ? AND expires_at > ?",
+            (session_id, time.time())
+        ).fetchone()
+        if not row:
+            return None, None
+        return json.loads(row[0], object_hook=_decode), row[1]
+
+    def create(self, session_id, document, expires_at):
+        conn = self._conn()
+        new_version = time.time_ns()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM sessions WHERE session_id = ? AND expires_at <= ?", (session_id, time.time()))
+            conn.execute(
+                "INSERT INTO sessions (session_id, document, version, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(document, default=_encode), new_version, _epoch(expires_at))
+            )
+            conn.execute("COMMIT")
+        except sqlite3.IntegrityError as e:
+            conn.execute("ROLLBACK")
+            raise SessionConflict(f"Session {session_id} already exists") from e
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._prune(conn)
+        return new_version
+
+    def update(self, session_id, document, changes, expires_at, version):
+        new_version = max(time.time_ns(), version + 1)
+        cursor = self._conn().execute(
+            "UPDATE sessions SET document = ?, version = ?, expires_at = ? "
+            "WHERE session_id = ? AND version = ? AND expires_at > ?",
+            (json.dumps(document, default=_encode), new_version, _epoch(expires_at), session_id, version, time.time())
+        )
+        if cursor.rowcount == 0:
+            raise SessionConflict(f"Session {session_id} changed since version {version}")
+        return new_version
+
+    def delete(self, session_id):
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def count_active(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+    def stats(self):
+        stored = self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": self.backend, "path": self.path, "stored": stored}
@@ -0,0 +1,77 @@
+"""
+Session Token Module - Long-Lived Signed Tokens for the Protection Layer
+
+/sign-fingerprint issues one token per session instead of a signature that
+expires after two minutes. The token carries everything the protection layer
+would otherwise recompute on every request:
+
+    <payload>.<signature>
+    payload   = base64url("v1|<session_id>|<fingerprint>|<device_fingerprint>|<expires>")
+    signature = base64url(HMAC-SHA256(secret, payload))
+
+fingerprint is the 64-char session fingerprint from
+get_or_create_session_fingerprint(). Validation is a single HMAC plus a
+constant-time compare; no header hashing is needed.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+
+TOKEN_VERSION = "v1"
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(secret, payload):
+    return _b64encode(hmac.new(secret.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_session_token(secret, session_id, fingerprint, device_fingerprint, ttl_seconds):
+    """
+    Returns (token, expires_at) for a session.
+
+    Raises:
+        ValueError: If a field is not a string or contains the "|" separator
+    """
+    fields = [session_id, fingerprint, device_fingerprint or ""]
+    if not all(isinstance(field, str) for field in fields):
+        raise ValueError("Session token fields must be strings")
+    if any("|" in field for field in fields):
+        raise ValueError("Session token fields must not contain '|'")
+    expires_at = int(time.time()) + ttl_seconds
+    payload = _b64encode("|".join([TOKEN_VERSION, *fields, str(expires_at)]).encode("utf-8"))
+    return f"{payload}.{_sign(secret, payload)}", expires_at
+
+
+def verify_session_token(secret, token):
+    """
+    Returns {"session_id", "fingerprint", "device_fingerprint", "expires_at"} for a
+    valid, unexpired token, or None. Never raises: any malformed token (wrong type,
+    non-ASCII, bad base64, wrong field count) is simply invalid.
+    """
+    if not secret or not isinstance(token, str) or not token.isascii() or token.count(".") != 1:
+        return None
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(secret, payload)):
+            return None
+        version, session_id, fingerprint, device_fingerprint, expires_at = _b64decode(payload).decode("utf-8").split("|")
+        expires_at = int(expires_at)
+    except (ValueError, TypeError):
+        return None
+    if version != TOKEN_VERSION or expires_at < time.time():
+        return None
+    return {
+        "session_id": session_id,
+        "fingerprint": fingerprint,
+        "device_fingerprint": device_fingerprint or None,
+        "expires_at": expires_at,
+    }
@@ -0,0 +1,343 @@
+"""
+Shard Counter Module - Query-Free Reads of Sharded Per-Minute Counters
+
+Rate limit counters are split across NUM_SHARDS documents per minute window
+with deterministic IDs ("{key}_{minute_window}_{0..N-1}"), e.g.
+"chat_1760668800_3", "GLOBAL_1760668800_7", "ip_{hash16}_1760668800_2". Each
+shard holds a count, its minute_window, tag fields (endpoint / ip_hash) and a
+ttl. Because the window is part of the ID, every minute starts from fresh
+documents: Increment never adds to last minute's count, and old shards are
+only garbage for the TTL policy to delete (which can take up to a day).
+
+Because the IDs are known, a counter's total never needs a where() query:
+
+- "get_all":   fetch the N known refs in one RPC and sum the shards whose
+               minute_window is current (N billed reads, no index needed)
+- "aggregate": a server-side sum("count") aggregation over the tag and
+               minute_window fields (1 billed read per 1000 index entries)
+
+read_many() combines several counters (even across collections) into a
+single get_all() call for the batched protection pipeline.
+
+Adaptive shard counts: with adaptive=True each key's active shard count lives
+in a small metadata document ("{collection}_meta/{key}": num_shards,
+previous_shards, changed_at). After each read, at most once per resize
+interval, the counter compares the key's cluster-wide write rate (its count
+for this window) and any contention errors against the per-shard write
+budget, and grows or shrinks the count. The write rate is the growth of the
+key's total since the previous resize check in the same window (or the total
+over the elapsed part of the window for the first check of a window). Readers
+keep summing the previous, larger shard range for SHRINK_GRACE_SECONDS so
+writers still using a cached count are never missed. Instances cache the metadata for meta_ttl seconds,
+so a growth can under-count for at most that long.
+
+Nothing adaptive runs on the request path after a key's first read: a
+background thread (background.LazyWorker) re-reads the cached metadata every
+meta_ttl and runs the resize transactions that observe() queues. Only the
+first lookup of a key in a process reads its metadata document inline.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud import firestore
+
+from background import LazyWorker
+
+logger = logging.getLogger(__name__)
+
+READ_MODES = ("get_all", "aggregate")
+
+# Errors that mean a shard document is taking more writes than it can sustain
+CONTENTION_ERRORS = (gcp_exceptions.Aborted, gcp_exceptions.DeadlineExceeded, gcp_exceptions.ResourceExhausted)
+
+# After a shrink, readers keep summing the old shard range this long (> 2 minute windows)
+SHRINK_GRACE_SECONDS = 150
+
+# Target shards = write rate * headroom / per-shard budget; shrink only below half of current
+RESIZE_HEADROOM = 2.0
+
+
+def current_minute_window():
+    """Returns (current_minute datetime, minute_window int) for the running minute."""
+    current_minute = datetime.now().replace(second=0, microsecond=0)
+    return current_minute, int(current_minute.timestamp())
+
+
+class ShardedCounter:
+    """
+    Sharded per-minute counters in one Firestore collection.
+
+    Args:
+        db: Firestore client
+        collection_name (str): Collection holding the shard documents
+        num_shards (int): Shards per key
+        ttl_minutes (int): Lifetime written to each shard's ttl field
+        read_mode (str): "get_all" or "aggregate"
+        adaptive (bool): Pick the shard count per key from observed load (num_shards is the starting count)
+        min_shards, max_shards (int): Bounds for adaptive shard counts
+        writes_per_shard (float): Sustained writes/second budget per shard document
+        resize_interval (float): Minimum seconds between resize decisions per key
+        meta_ttl (float): Seconds between background refreshes of a key's metadata document
+    """
+
+    def __init__(self, db, collection_name, num_shards=10, ttl_minutes=2, read_mode="get_all",
+                 adaptive=False, min_shards=1, max_shards=50, writes_per_shard=1.0,
+                 resize_interval=30.0, meta_ttl=10.0):
+        if read_mode not in READ_MODES:
+            raise ValueError(f"Unknown shard read mode '{read_mode}' (expected one of {READ_MODES})")
+        self.db = db
+        self.collection = db.collection(collection_name)
+        self.num_shards = num_shards
+        self.ttl_minutes = ttl_minutes
+        self.read_mode = read_mode
+
+        self.adaptive = adaptive
+        self.min_shards = min_shards
+        self.max_shards = max_shards
+        self.writes_per_shard = writes_per_shard
+        self.resize_interval = resize_interval
+        self.meta_ttl = meta_ttl
+        self.meta_collection = db.collection(f"{collection_name}_meta") if adaptive else None
+        self._meta = {}  # key -> (fetched_at, metadata dict)
+        self._last_resize_check = {}
+        self._last_observed = {}  # key -> (minute_window, total, time) at the last resize check
+        self._contention = {}
+        self._pending_resizes = {}  # key -> (current, desired, reason), run by the worker
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = LazyWorker(self._meta_loop, f"shard-meta-{collection_name}")
+        self._resizes = 0
+        self._contention_errors = 0
+
+    # -------------------------------------------------------------------------
+    # Shard counts
+    # -------------------------------------------------------------------------
+    def _fetch_meta(self, key):
+        try:
+            snapshot = self.meta_collection.document(key).get()
+            meta = snapshot.to_dict() if snapshot.exists else {}
+        except Exception as e:
+            logger.error(f"Failed to read shard metadata for '{key}': {e}")
+            with self._lock:
+                cached = self._meta.get(key)
+            meta = cached[1] if cached else {}
+        with self._lock:
+            self._meta[key] = (time.monotonic(), meta)
+        return meta
+
+    def _get_meta(self, key):
+        self._worker.ensure_started()
+        with self._lock:
+            cached = self._meta.get(key)
+        if cached:
+            return cached[1]  # Kept fresh by the worker
+        return self._fetch_meta(key)  # First use of this key in this process
+
+    def _meta_loop(self):
+        while True:
+            self._wake.wait(self.meta_ttl)
+            self._wake.clear()
+            with self._lock:
+                resizes, self._pending_resizes = self._pending_resizes, {}
+                stale = [key for key, (fetched_at, _) in self._meta.items() if time.monotonic() - fetched_at >= self.meta_ttl]
+            for key, (current, desired, reason) in resizes.items():
+                self._resize(key, current, desired, reason)
+            for key in stale:
+                if key not in resizes:
+                    self._fetch_meta(key)
+
+    def shard_count(self, key, for_read=False):
+        """
+        Active shard count for a key. Readers (for_read=True) also cover the
+        previous range for SHRINK_GRACE_SECONDS after a shrink.
+        """
+        if not self.adaptive:
+            return self.num_shards
+        meta = self._get_meta(key)
+        count = meta.get("num_shards", self.num_shards)
+        if for_read and time.time() - meta.get("changed_at", 0) < SHRINK_GRACE_SECONDS:
+            count = max(count, meta.get("previous_shards", 0))
+        return count
+
+    @staticmethod
+    def shard_id(key, minute_window, n):
+        return f"{key}_{minute_window}_{n}"
+
+    def shard_refs(self, key, minute_window):
+        """All shard refs a reader must sum for a key in a window: "{key}_{window}_0" .. "_{N-1}"."""
+        return [
+            self.collection.document(self.shard_id(key, minute_window, n))
+            for n in range(self.shard_count(key, for_read=True))
+        ]
+
+    def observe(self, key, total, minute_window):
+        """
+        Feed a freshly read total back into the adaptive shard count (no-op if not adaptive).
+        `total` is the key's cluster-wide count for `minute_window`; the write rate is its
+        growth since the previous check in the same window.
+        """
+        if not self.adaptive:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._last_resize_check.get(key, 0) < self.resize_interval:
+                return
+            self._last_resize_check[key] = now
+            contention = self._contention.pop(key, 0)
+            previous = self._last_observed.get(key)
+            self._last_observed[key] = (minute_window, total, now)
+
+        current = self.shard_count(key)
+        if previous and previous[0] == minute_window and now > previous[2]:
+            elapsed = now - previous[2]
+            writes_per_second = max(total - previous[1], 0) / max(elapsed, 1.0)
+        else:
+            elapsed = now - minute_window
+            writes_per_second = total / max(elapsed, 1.0)
+        desired = math.ceil(writes_per_second * RESIZE_HEADROOM / self.writes_per_shard)
+        if contention:
+            desired = max(desired, current * 2)
+        desired = max(self.min_shards, min(self.max_shards, desired))
+
+        if desired > current:
+            self._queue_resize(key, current, desired, f"{writes_per_second:.1f} writes/s, {contention} contention errors")
+        elif desired <= current // 2 and not contention and elapsed >= 15:
+            # Shrink only with a settled rate estimate and plenty of headroom (hysteresis)
+            self._queue_resize(key, current, desired, f"{writes_per_second:.1f} writes/s")
+
+    def _queue_resize(self, key, current, desired, reason):
+        """Hand a resize to the worker thread (its transaction stays off the request path)."""
+        self._worker.ensure_started()
+        with self._lock:
+            self._pending_resizes[key] = (current, desired, reason)
+        self._wake.set()
+
+    def _resize(self, key, current, desired, reason):
+        meta_ref = self.meta_collection.document(key)
+        default_shards = self.num_shards
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            snapshot = meta_ref.get(transaction=transaction)
+            meta = snapshot.to_dict() if snapshot.exists else {}
+            active = meta.get("num_shards", default_shards)
+            previous = active
+            if time.time() - meta.get("changed_at", 0) < SHRINK_GRACE_SECONDS:
+                previous = max(previous, meta.get("previous_shards", 0))
+            new_meta = {"num_shards": desired, "previous_shards": previous, "changed_at": time.time()}
+            transaction.set(meta_ref, new_meta)
+            return new_meta
+
+        try:
+            new_meta = update_in_transaction(self.db.transaction())
+            with self._lock:
+                self._meta[key] = (time.monotonic(), new_meta)
+                self._resizes += 1
+            logger.info(f"Resized shards for '{key}': {current} -> {desired} ({reason})")
+        except Exception as e:
+            logger.error(f"Failed to resize shards for '{key}': {e}")
+
+    @staticmethod
+    def total_from_snapshots(snapshots, tags, minute_window):
+        """Sum shard counts for the current window, skipping stale or foreign shards."""
+        total = 0
+        for snapshot in snapshots:
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            # IDs carry the window, so this only skips shards written with a mismatched window field
+            if data.get("minute_window") != minute_window:
+                continue
+            if any(data.get(field) != value for field, value in tags.items()):
+                continue
+            total += data.get("count", 0)
+        return total
+
+    def read(self, key, tags, minute_window):
+        """Total count for a key in the given minute window."""
+        if self.read_mode == "aggregate":
+            query = self.collection
+            for field, value in tags.items():
+                query = query.where(field, "==", value)
+            query = query.where("minute_window", "==", minute_window)
+            results = query.sum("count", alias="total").get()
+            total = int(results[0][0].value or 0) if results else 0
+        else:
+            total = self.total_from_snapshots(self.db.get_all(self.shard_refs(key, minute_window)), tags, minute_window)
+
+        self.observe(key, total, minute_window)
+        return total
+
+    def increment(self, key, tags, minute_window, amount=1, batch=None):
+        """
+        Add `amount` to a random shard of `key`.
+        If `batch` is given the write is queued on it instead of committed directly.
+        """
+        shard_ref = self.collection.document(self.shard_id(key, minute_window, random.randint(0, self.shard_count(key) - 1)))
+        data = {
+            "count": firestore.Increment(amount),
+            "minute_window": minute_window,
+            **tags,
+            "ttl": datetime.fromtimestamp(minute_window) + timedelta(minutes=self.ttl_minutes)
+        }
+        if batch is not None:
+            batch.set(shard_ref, data, merge=True)
+            return
+        try:
+            shard_ref.set(data, merge=True)
+        except CONTENTION_ERRORS:
+            self.record_contention(key)
+            raise
+
+    def record_contention(self, key):
+        """Note a contention error on one of key's shards (grows the count at the next resize check)."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            self._contention[key] = self._contention.get(key, 0) + 1
+            self._contention_errors += 1
+
+    def stats(self):
+        """Shard counts per key and resize activity (for /system_status)."""
+        with self._lock:
+            return {
+                "adaptive": self.adaptive,
+                "default_shards": self.num_shards,
+                "shards_by_key": {key: meta.get("num_shards", self.num_shards) for key, (_, meta) in self._meta.items()},
+                "pending_resizes": len(self._pending_resizes),
+                "resizes": self._resizes,
+                "contention_errors": self._contention_errors,
+            }
+
+
+def read_many(db, reads, minute_window):
+    """
+    Read several counters with ONE get_all() call (always get_all mode).
+
+    Args:
+        db: Firestore client
+        reads: list of (ShardedCounter, key, tags)
+        minute_window (int): Current minute window
+
+    Returns:
+        list: Totals in the same order as `reads`
+    """
+    refs_per_read = [counter.shard_refs(key, minute_window) for counter, key, _ in reads]
+
+    by_path = {}
+    for snapshot in db.get_all([ref for refs in refs_per_read for ref in refs]):
+        by_path[snapshot.reference.path] = snapshot
+
+    totals = []
+    for (counter, key, tags), refs in zip(reads, refs_per_read):
+        snapshots = [by_path[ref.path] for ref in refs if ref.path in by_path]
+        total = ShardedCounter.total_from_snapshots(snapshots, tags, minute_window)
+        counter.observe(key, total, minute_window)
+        totals.append(total)
+    return totals
@@ -0,0 +1,100 @@
+"""
+Signature Cache Module - Verified Fingerprint Signatures for Layer 6
+
+A browser tab reuses one (device_fingerprint, timestamp, signature) triple
+from /sign-fingerprint for up to the 120 s validity window, so the same HMAC
+is recomputed on every request. This cache remembers triples that already
+verified, together with the IP that first presented them (memory only, never
+persisted, dropped with the window):
+
+- a repeat request with an identical triple skips the HMAC
+- the same triple arriving from a different IP is an exact replay, which the
+  caller can choose to reject
+
+Entries are grouped into buckets by the signed timestamp. A signature whose
+timestamp is outside the validity window is rejected before the cache is
+consulted, so whole buckets are dropped once they fall out of the window.
+Memory is therefore bounded by the triples signed within one window, with
+max_entries as a hard cap.
+"""
+
+import threading
+import time
+
+
+class SignatureCache:
+    """
+    Time-bucketed set of verified signature triples.
+
+    Args:
+        window_seconds (int): Signature validity window (entries older than this are dropped)
+        bucket_seconds (int): Width of each timestamp bucket
+        max_entries (int): Hard cap; new triples are not cached once reached
+    """
+
+    def __init__(self, window_seconds=120, bucket_seconds=10, max_entries=50000):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.max_entries = max_entries
+        self._buckets = {}  # bucket -> {(fingerprint, timestamp, signature): first client IP}
+        self._entries = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._replays = 0
+
+    def _evict(self, now):
+        # Called with the lock held: drop buckets whose timestamps can no longer verify
+        oldest = int(now - self.window_seconds) // self.bucket_seconds
+        for bucket in [bucket for bucket in self._buckets if bucket < oldest]:
+            self._entries -= len(self._buckets.pop(bucket))
+
+    def lookup(self, device_fingerprint, timestamp, signature, client_ip=None):
+        """
+        Returns None if the triple has not been verified yet, True if it was verified
+        from the same IP, or False if it was verified from a different IP (replay).
+        """
+        key = (device_fingerprint, timestamp, signature)
+        with self._lock:
+            first_ip = self._buckets.get(timestamp // self.bucket_seconds, {}).get(key, 0)
+            if first_ip == 0:
+                self._misses += 1
+                return None
+            self._hits += 1
+            if first_ip and client_ip and first_ip != client_ip:
+                self._replays += 1
+                return False
+            return True
+
+    def add(self, device_fingerprint, timestamp, signature, client_ip=None):
+        """Remember a triple that passed HMAC verification."""
+        with self._lock:
+            self._evict(time.time())
+            if self._entries >= self.max_entries:
+                return
+            bucket = self._buckets.setdefault(timestamp // self.bucket_seconds, {})
+            key = (device_fingerprint, timestamp, signature)
+            if key not in bucket:
+                bucket[key] = client_ip
+                self._entries += 1
+
+    def clear(self):
+        """Forget every verified triple (after /admin/restore_system)."""
+        with self._lock:
+            self._buckets.clear()
+            self._entries = 0
+
+    def stats(self):
+        """Hit rate, replays seen and current size (for /system_status)."""
+        with self._lock:
+            self._evict(time.time())
+            lookups = self._hits + self._misses
+            return {
+                "entries": self._entries,
+                "buckets": len(self._buckets),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "cross_ip_replays": self._replays,
+            }
@@ -0,0 +1,71 @@
+"""Tests for BookingState serialization and change tracking (stdlib only)."""
+
+import copy
+import unittest
+
+from booking_state import FIELDS, BookingState
+
+STORED = {
+    "workshop_id": "cedar-weaving",
+    "organization_type": "school",
+    "participants": 12,
+    "requested_date": "2026-11-02",
+    "requested_time": "10:00",
+    "info_mode_workshops": ["cedar-weaving", "drum-making"],
+    "current_info_mode_workshop": "drum-making",
+    "triggered_hardcodes": ["drum-making", "cedar-weaving"],
+    "last_updated": "2026-10-17T12:00:00",
+    "conversation_history": [{"speaker": "user", "message": "hi"}, {"speaker": "ai", "message": "hello"}],
+    "legacy_flag": True,
+}
+
+
+class BookingStateTest(unittest.TestCase):
+    def test_stored_document_round_trip(self):
+        state = BookingState.from_dict(STORED)
+        self.assertEqual(state.triggered_hardcodes, {"cedar-weaving", "drum-making"})
+        self.assertEqual(state["legacy_flag"], True)
+        expected = dict(STORED, triggered_hardcodes=["cedar-weaving", "drum-making"])
+        self.assertEqual(state.to_dict(), expected)
+        self.assertEqual(BookingState.from_dict(state.to_dict()).to_dict(), expected)
+
+    def test_default_round_trip(self):
+        data = BookingState().to_dict()
+        self.assertEqual(list(data), list(FIELDS))
+        self.assertEqual(BookingState.from_dict(data).to_dict(), data)
+        self.assertEqual(BookingState.from_dict(None).to_dict(), data)
+
+    def test_to_dict_does_not_share_containers(self):
+        state = BookingState.from_dict(STORED)
+        data = state.to_dict()
+        data["info_mode_workshops"].append("x")
+        data["conversation_history"].append({"speaker": "user", "message": "x"})
+        self.assertEqual(state.info_mode_workshops, STORED["info_mode_workshops"])
+        self.assertEqual(len(state.conversation_history), 2)
+
+    def test_copy(self):
+        state = BookingState.from_dict(STORED)
+        shallow = copy.copy(state)
+        deep = copy.deepcopy(state)
+        self.assertEqual(shallow.to_dict(), state.to_dict())
+        self.assertEqual(deep.to_dict(), state.to_dict())
+        deep.triggered_hardcodes.add("beading")
+        deep.conversation_history.append({"speaker": "user", "message": "more"})
+        self.assertNotIn("beading", state.triggered_hardcodes)
+        self.assertEqual(len(state.conversation_history), 2)
+        self.assertEqual(deep.changed_fields(), {"triggered_hardcodes", "conversation_history"})
+
+    def test_change_tracking(self):
+        state = BookingState.from_dict(STORED)
+        self.assertEqual(state.changed_fields(), set())
+        state["participants"] = 20
+        state.triggered_hardcodes.add("beading")
+        state["new_key"] = 1
+        self.assertEqual(state.changed_fields(), {"participants", "triggered_hardcodes", "new_key"})
+        state.mark_clean()
+        self.assertEqual(state.changed_fields(), set())
+        self.assertEqual(BookingState().changed_fields(), set(FIELDS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Tests for restore propagation through the circuit breaker cache (stdlib only)."""
+
+import unittest
+
+from circuit_breaker_cache import CircuitBreakerCache
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDoc:
+    def __init__(self, data):
+        self.data = data
+
+    def get(self):
+        return FakeSnapshot(self.data)
+
+
+class RestoreCallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.doc = FakeDoc({"strike_count": 2, "locked_down": False, "last_restore_timestamp": 100})
+        self.restores = []
+        self.cache = CircuitBreakerCache(self.doc, on_restore=lambda: self.restores.append(True))
+
+    def test_first_copy_is_only_the_baseline(self):
+        self.cache.refresh()
+        self.assertEqual(self.restores, [])
+
+    def test_new_restore_timestamp_runs_callback_once(self):
+        self.cache.refresh()
+        self.cache.apply_local({"strike_count": 0, "locked_down": False})
+        self.doc.data = {"strike_count": 0, "locked_down": False, "last_restore_timestamp": 200}
+        self.cache.refresh()
+        self.cache.refresh()
+        self.assertEqual(self.restores, [True])
+        self.assertEqual(self.cache.stats()["restores_seen"], 1)
+
+    def test_strikes_alone_do_not_count_as_restore(self):
+        self.cache.refresh()
+        self.doc.data = {"strike_count": 3, "locked_down": True, "last_restore_timestamp": 100}
+        self.cache.refresh()
+        self.assertEqual(self.restores, [])
+
+    def test_callback_errors_are_contained(self):
+        def failing():
+            raise RuntimeError("boom")
+
+        self.cache.on_restore = failing
+        self.cache.refresh()
+        self.doc.data = {"last_restore_timestamp": 300}
+        self.cache.refresh()
+        self.assertFalse(self.cache.is_locked_down())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests for the chat prompt context cache with the production prompt prefix (Vertex AI SDK faked)."""
+
+import ast
+import os
+import time
+import unittest
+from unittest import mock
+
+import context_cache
+from context_cache import MODE_CACHED_CONTENT, MODE_SYSTEM_INSTRUCTION, PromptContextCache, min_cache_tokens_for
+from knowledge_base import render_knowledge_base
+from prompt_template import ChatPromptTemplate
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def production_prompt():
+    """CHAT_PROMPT as main.build_chat_prompt() compiles it for the built-in registry (constants via ast)."""
+    with open(MAIN_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    c = {}
+    for node in tree.body:
+        name = getattr(node.targets[0], "id", None) if isinstance(node, ast.Assign) else None
+        if name == "WORKSHOP_REGISTRY":
+            c[name] = ast.literal_eval(node.value.orelse)
+        elif name == "MODEL_NAME":
+            c[name] = ast.literal_eval(node.value.args[1])  # os.getenv("VERTEX_AI_MODEL_NAME", <default>)
+        elif name in ("CHARACTER_PRINCIPLES", "KNOWLEDGE_BASE_SECTION_TEMPLATE", "CHAT_PROMPT_TAIL",
+                      "MOON_TIDE_KNOWLEDGE_BASE_INTRO", "WORKSHOP_PROSE", "MOON_TIDE_KNOWLEDGE_BASE_FOOTER"):
+            c[name] = ast.literal_eval(node.value)
+    knowledge_base = render_knowledge_base(
+        c["WORKSHOP_REGISTRY"], c["MOON_TIDE_KNOWLEDGE_BASE_INTRO"], c["WORKSHOP_PROSE"], c["MOON_TIDE_KNOWLEDGE_BASE_FOOTER"]
+    )
+    principles = c["CHARACTER_PRINCIPLES"]
+    prompt = ChatPromptTemplate(
+        [principles["core_persona"], principles["system_boundaries"], principles["on_user_input"],
+         principles["intelligent_concierge"], c["KNOWLEDGE_BASE_SECTION_TEMPLATE"].format(knowledge_base=knowledge_base)],
+        c["CHAT_PROMPT_TAIL"],
+    )
+    return prompt, c["MODEL_NAME"]
+
+
+class FakeCachedContent:
+    created = []
+
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def create(cls, model_name, system_instruction, ttl, display_name):
+        cls.created.append((model_name, system_instruction))
+        return cls(f"projects/p/locations/l/cachedContents/{len(cls.created)}")
+
+    def delete(self):
+        pass
+
+
+class FakeModel:
+    def __init__(self, model_name, system_instruction=None, cached_content=None):
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    @classmethod
+    def from_cached_content(cls, cached_content):
+        return cls(None, cached_content=cached_content)
+
+
+class ContextCacheTest(unittest.TestCase):
+    def setUp(self):
+        FakeCachedContent.created = []
+        patches = [
+            mock.patch.object(context_cache, "CONTEXT_CACHING_AVAILABLE", True),
+            mock.patch.object(context_cache, "caching", mock.Mock(CachedContent=FakeCachedContent)),
+            mock.patch.object(context_cache, "GenerativeModel", FakeModel),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.prompt, self.model_name = production_prompt()
+
+    def wait_for_creation(self, cache):
+        deadline = time.monotonic() + 5
+        while cache.stats()["creating"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_production_prefix_uses_cached_content(self):
+        cache = PromptContextCache(self.model_name)
+        self.assertEqual(cache.min_cache_tokens, 2048)
+
+        first = cache.model_for(self.prompt.static_prefix, self.prompt.version)
+        self.assertEqual(first.system_instruction, [self.prompt.static_prefix])  # While the cache is created
+        self.wait_for_creation(cache)
+        model = cache.model_for(self.prompt.static_prefix, self.prompt.version)
+
+        self.assertEqual(FakeCachedContent.created, [(self.model_name, self.prompt.static_prefix)])
+        self.assertIsNotNone(model.cached_content)
+        stats = cache.stats()
+        self.assertEqual(stats["mode"], MODE_CACHED_CONTENT)
+        self.assertIsNone(stats["skipped_reason"])
+        self.assertGreaterEqual(stats["prefix_tokens_estimate"], stats["min_cache_tokens"])
+
+    def test_prefix_below_model_minimum_is_reported(self):
+        cache = PromptContextCache("gemini-1.5-flash-002")
+        with self.assertLogs("context_cache", "WARNING"):
+            cache.model_for(self.prompt.static_prefix, self.prompt.version)
+        self.wait_for_creation(cache)
+        stats = cache.stats()
+        self.assertEqual(FakeCachedContent.created, [])
+        self.assertEqual(stats["mode"], MODE_SYSTEM_INSTRUCTION)
+        self.assertEqual(stats["skipped_reason"], "below_minimum")
+        self.assertEqual(stats["below_minimum"], 1)
+
+    def test_minimum_by_model(self):
+        self.assertEqual(min_cache_tokens_for("gemini-1.5-pro-002"), 32768)
+        self.assertEqual(min_cache_tokens_for("gemini-2.0-flash"), 2048)
+        self.assertEqual(min_cache_tokens_for("publishers/google/models/gemini-2.5-flash"), 2048)
+        self.assertEqual(PromptContextCache("gemini-2.0-flash", min_cache_tokens=4096).min_cache_tokens, 4096)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests for the pure GCRA decision step (stdlib only)."""
+
+import unittest
+
+from gcra_limiter import gcra_decide
+
+LIMIT = 60
+PERIOD = 60.0
+T = PERIOD / LIMIT
+
+
+class GcraDecideTest(unittest.TestCase):
+    def run_requests(self, times, tat=0.0, cost=1):
+        results = []
+        for now in times:
+            allowed, tat = gcra_decide(tat, now, T, PERIOD, cost)
+            results.append(allowed)
+        return results, tat
+
+    def test_burst_up_to_limit(self):
+        results, tat = self.run_requests([1000.0] * (LIMIT + 5))
+        self.assertEqual(results.count(True), LIMIT)
+        self.assertEqual(results[LIMIT:], [False] * 5)
+        self.assertEqual(tat, 1000.0 + PERIOD)
+
+    def test_denied_request_keeps_tat(self):
+        _, tat = self.run_requests([1000.0] * LIMIT)
+        allowed, new_tat = gcra_decide(tat, 1000.0, T, PERIOD)
+        self.assertFalse(allowed)
+        self.assertEqual(new_tat, tat)
+
+    def test_steady_rate_is_always_allowed(self):
+        results, _ = self.run_requests([1000.0 + i * T for i in range(10 * LIMIT)])
+        self.assertTrue(all(results))
+
+    def test_no_double_burst_at_window_edge(self):
+        # A full burst at the end of one minute leaves nothing for the start of the next
+        results, tat = self.run_requests([1059.0] * LIMIT)
+        self.assertTrue(all(results))
+        later, _ = self.run_requests([1060.5] * LIMIT, tat)
+        self.assertEqual(later.count(True), 1)
+
+    def test_tat_catches_up_after_idle(self):
+        _, tat = self.run_requests([1000.0] * LIMIT)
+        # Half a period later, half the budget has drained
+        results, _ = self.run_requests([1030.0] * LIMIT, tat)
+        self.assertEqual(results.count(True), LIMIT // 2)
+        # After a long idle gap the stale TAT is ignored and the full burst is back
+        results, tat = self.run_requests([5000.0] * LIMIT, tat)
+        self.assertTrue(all(results))
+        self.assertEqual(tat, 5000.0 + PERIOD)
+
+    def test_cost_is_all_or_nothing(self):
+        allowed, tat = gcra_decide(0.0, 1000.0, T, PERIOD, cost=LIMIT - 1)
+        self.assertTrue(allowed)
+        allowed, new_tat = gcra_decide(tat, 1000.0, T, PERIOD, cost=2)
+        self.assertFalse(allowed)
+        self.assertEqual(new_tat, tat)
+        allowed, _ = gcra_decide(tat, 1000.0, T, PERIOD)
+        self.assertTrue(allowed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests for the count-min sketch and the per-IP sketch limiter (stdlib only)."""
+
+import hashlib
+import random
+import unittest
+
+from ip_sketch import CountMinSketch, IpSketchLimiter
+
+
+def ip_hash(i):
+    return hashlib.sha256(f"10.0.{i // 256}.{i % 256}".encode()).hexdigest()
+
+
+class CountMinSketchTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.counts = {ip_hash(i): rng.randint(1, 20) for i in range(3000)}
+
+    def _fill(self, sketch, counts):
+        for key, count in counts.items():
+            for _ in range(count):
+                sketch.add(key)
+        return sketch
+
+    def test_never_undercounts(self):
+        sketch = self._fill(CountMinSketch(width=256, depth=4), self.counts)
+        for key, count in self.counts.items():
+            self.assertGreaterEqual(sketch.estimate(key), count)
+
+    def test_error_bound(self):
+        sketch = self._fill(CountMinSketch(width=2048, depth=4), self.counts)
+        self.assertEqual(sketch.total, sum(self.counts.values()))
+        bound = sketch.error_bound()
+        over = sum(1 for key, count in self.counts.items() if sketch.estimate(key) - count > bound)
+        self.assertLessEqual(over / len(self.counts), sketch.delta)
+
+    def test_byte_round_trip(self):
+        sketch = self._fill(CountMinSketch(width=512, depth=3), self.counts)
+        restored = CountMinSketch.from_bytes(sketch.to_bytes(), 512, 3, sketch.total)
+        self.assertEqual(restored.total, sketch.total)
+        for key in self.counts:
+            self.assertEqual(restored.estimate(key), sketch.estimate(key))
+
+    def test_merge_covers_combined_stream(self):
+        keys = list(self.counts)
+        first = self._fill(CountMinSketch(width=512, depth=4), {key: self.counts[key] for key in keys[::2]})
+        second = self._fill(CountMinSketch(width=512, depth=4), {key: self.counts[key] for key in keys[1::2]})
+        merged = CountMinSketch.from_bytes(first.to_bytes(), 512, 4, first.total)
+        merged.merge(second)
+        self.assertEqual(merged.total, sum(self.counts.values()))
+        for key, count in self.counts.items():
+            self.assertGreaterEqual(merged.estimate(key), count)
+
+    def test_merge_rejects_other_dimensions(self):
+        with self.assertRaises(ValueError):
+            CountMinSketch(width=512, depth=4).merge(CountMinSketch(width=256, depth=4))
+
+
+class IpSketchLimiterTest(unittest.TestCase):
+    def test_promotes_at_threshold(self):
+        limiter = IpSketchLimiter(promote_threshold=5, width=1024)
+        ip = ip_hash(1)
+        for _ in range(5):
+            self.assertFalse(limiter.should_promote(ip, 100))
+            limiter.add(ip, 100)
+        self.assertTrue(limiter.should_promote(ip, 100))
+        self.assertFalse(limiter.should_promote(ip_hash(2), 100))
+
+    def test_seed_is_handed_over_once(self):
+        limiter = IpSketchLimiter(promote_threshold=5, width=1024)
+        ip = ip_hash(1)
+        for _ in range(5):
+            limiter.add(ip, 100)
+        self.assertEqual(limiter.pending_seed(ip, 100), 5)
+        limiter.mark_seeded(ip, 100)
+        limiter.add(ip, 100)
+        self.assertEqual(limiter.pending_seed(ip, 100), 0)
+        self.assertEqual(limiter.stats()["seeds"], 1)
+
+    def test_new_window_resets_counts_and_seeds(self):
+        limiter = IpSketchLimiter(promote_threshold=5, width=1024)
+        ip = ip_hash(1)
+        for _ in range(5):
+            limiter.add(ip, 100)
+        limiter.mark_seeded(ip, 100)
+        self.assertFalse(limiter.should_promote(ip, 160))
+        limiter.add(ip, 160)
+        self.assertEqual(limiter.pending_seed(ip, 160), 1)
+
+    def test_reset_clears_the_current_window(self):
+        limiter = IpSketchLimiter(promote_threshold=5, width=1024)
+        ip = ip_hash(1)
+        for _ in range(5):
+            limiter.add(ip, 100)
+        limiter.mark_seeded(ip, 100)
+        limiter.reset()
+        self.assertFalse(limiter.should_promote(ip, 100))
+        self.assertEqual(limiter.pending_seed(ip, 100), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
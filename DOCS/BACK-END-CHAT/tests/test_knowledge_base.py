@@ -0,0 +1,120 @@
+"""Equivalence tests: pre-rendered info mode snippets vs the former hardcoded info mode text (stdlib only)."""
+
+import ast
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+from knowledge_base import catalog_version, price_text, render_info_snippets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXTRA_WORKSHOPS = {
+    "flat-rate": {"description": "Drum Making Kit", "default": 12550, "per_person": False},
+    "no-description": {"per_person": True, "corporate": 9500, "community": 0},
+    "no-prices": {"description": "Beading Circle ✨", "per_person": True},
+    "empty": {"per_person": False},
+}
+
+
+def main_constants():
+    """Built-in WORKSHOP_REGISTRY (the non-Portal branch) and INFO_MODE_HEADER from main.py, via ast."""
+    with open(os.path.join(BACKEND_DIR, "main.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        name = getattr(node.targets[0], "id", None)
+        if name == "WORKSHOP_REGISTRY":
+            found[name] = ast.literal_eval(node.value.orelse)
+        elif name == "INFO_MODE_HEADER":
+            found[name] = ast.literal_eval(node.value)
+    return found["WORKSHOP_REGISTRY"], found["INFO_MODE_HEADER"]
+
+
+def old_info_section(registry, info_mode_workshops, triggered_hardcodes):
+    # The per-turn info mode text as build_prompt hardcoded it before the snippets
+    section = "\n---\n**📚 WORKSHOP INFORMATION (User is Exploring):**\n"
+    section += "The user has inquired about the following workshops. Integrate these details naturally when relevant:\n\n"
+    for workshop_id in info_mode_workshops:
+        if workshop_id in registry:
+            details = registry[workshop_id]
+            if workshop_id not in triggered_hardcodes:
+                section += f"**{details.get('description', workshop_id)}:**\n"
+                if details.get('per_person'):
+                    corporate_price = details.get('corporate', 0) / 100
+                    community_price = details.get('community', 0) / 100
+                    section += f"- Pricing: <price>${corporate_price:.2f}/person (Corporate)</price>, <price>${community_price:.2f}/person (Community)</price>\n"
+                else:
+                    default_price = details.get('default', 0) / 100
+                    section += f"- Pricing: <price>${default_price:.2f} flat rate</price>\n"
+                section += "\n"
+                triggered_hardcodes.add(workshop_id)
+            else:
+                section += f"**{details.get('description', workshop_id)}:** (Details provided earlier in conversation)\n"
+    return section
+
+
+def snippet_info_section(snippets, header, info_mode_workshops, triggered_hardcodes):
+    # build_prompt's assembly from the pre-rendered snippets (when the token budget keeps the section)
+    parts = [header]
+    newly_triggered = set()
+    for workshop_id in info_mode_workshops:
+        snippet = snippets.get(workshop_id)
+        if snippet is None:
+            continue
+        if workshop_id not in triggered_hardcodes and workshop_id not in newly_triggered:
+            parts.append(snippet[0])
+            newly_triggered.add(workshop_id)
+        else:
+            parts.append(snippet[1])
+    triggered_hardcodes.update(newly_triggered)
+    return "".join(parts)
+
+
+class InfoSnippetsTest(unittest.TestCase):
+    def setUp(self):
+        main_registry, self.header = main_constants()
+        self.registry = {**main_registry, **EXTRA_WORKSHOPS}
+        self.snippets = render_info_snippets(self.registry)
+
+    def test_snippets_match_old_info_mode(self):
+        rng = random.Random(7)
+        candidates = list(self.registry) + ["unknown-workshop"]
+        for i in range(500):
+            workshops = [rng.choice(candidates) for _ in range(rng.randint(0, 8))]  # Repeats included
+            triggered = set(rng.sample(workshops, rng.randint(0, len(workshops))))
+            old_triggered, new_triggered = set(triggered), set(triggered)
+            with self.subTest(workshops=workshops, triggered=triggered):
+                self.assertEqual(
+                    snippet_info_section(self.snippets, self.header, workshops, new_triggered),
+                    old_info_section(self.registry, workshops, old_triggered),
+                )
+                self.assertEqual(new_triggered, old_triggered)
+
+    def test_missing_per_person_flag_means_per_person(self):
+        # The old info mode text treated a missing flag as flat rate; pricing and checkout never did
+        workshop = {"description": "Cedar Hat", "default": 4500}
+        first_mention, _ = render_info_snippets({"cedar-hat": workshop})["cedar-hat"]
+        self.assertIn("<price>$45.00/person (Corporate)</price>, <price>$45.00/person (Community)</price>", first_mention)
+        self.assertTrue(price_text(workshop).endswith("per person"))
+
+    def test_one_snippet_pair_per_workshop(self):
+        self.assertEqual(set(self.snippets), set(self.registry))
+
+    def test_catalog_version_tracks_prices(self):
+        changed = {**self.registry, "flat-rate": {**EXTRA_WORKSHOPS["flat-rate"], "default": 12600}}
+        self.assertEqual(catalog_version(self.registry), catalog_version(dict(self.registry)))
+        self.assertNotEqual(catalog_version(self.registry), catalog_version(changed))
+
+    def test_imports_nothing_from_gcp(self):
+        code = "import sys; sys.modules['google'] = None; import knowledge_base"
+        result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for the in-process rate limit tier (stdlib only)."""
+
+import threading
+import unittest
+
+from local_rate_limiter import LocalRateLimiter
+
+WINDOW = 1760668800
+
+
+class SharedCounter:
+    """Stands in for the rate_limit_shards total shared by every instance."""
+
+    def __init__(self):
+        self.totals = {}
+        self.syncs = 0
+        self.lock = threading.Lock()
+
+    def sync(self, key, window, delta):
+        with self.lock:
+            self.syncs += 1
+            self.totals[(key, window)] = self.totals.get((key, window), 0) + delta
+            return self.totals[(key, window)]
+
+
+class LocalRateLimiterTest(unittest.TestCase):
+    def test_sustained_over_limit_traffic_is_decided_in_memory(self):
+        shared = SharedCounter()
+        limiter = LocalRateLimiter(20, shared.sync, tolerance=0.1, sync_interval=60.0)
+
+        results = [limiter.allow("chat", WINDOW) for _ in range(1000)]
+
+        self.assertEqual(results.count(True), 20)
+        self.assertEqual(shared.totals[("chat", WINDOW)], 20)
+        # First request, then one batch of 5 far from the limit, then one sync per admit near it
+        self.assertLessEqual(shared.syncs, 10)
+        stats = limiter.stats()
+        self.assertGreaterEqual(stats["local_rejections"], 975)
+
+    def test_several_instances_overshoot_by_at_most_one_batch_each(self):
+        shared = SharedCounter()
+        limiters = [LocalRateLimiter(20, shared.sync, tolerance=0.1, sync_interval=60.0) for _ in range(4)]
+
+        admitted = sum(limiters[i % 4].allow("chat", WINDOW) for i in range(2000))
+
+        self.assertLessEqual(admitted, 20 + 4 * limiters[0].sync_batch)
+        self.assertLessEqual(shared.syncs, 4 * 10)
+
+    def test_new_window_starts_fresh(self):
+        shared = SharedCounter()
+        limiter = LocalRateLimiter(20, shared.sync, sync_interval=60.0)
+        for _ in range(100):
+            limiter.allow("chat", WINDOW)
+
+        self.assertTrue(limiter.allow("chat", WINDOW + 60))
+
+    def test_reset_forgets_a_full_window(self):
+        shared = SharedCounter()
+        limiter = LocalRateLimiter(20, shared.sync, sync_interval=60.0)
+        for _ in range(100):
+            limiter.allow("chat", WINDOW)
+        shared.totals.clear()  # /admin/restore_system purged the shards
+
+        limiter.reset()
+        self.assertTrue(limiter.allow("chat", WINDOW))
+
+    def test_sync_errors_fail_open(self):
+        def failing_sync(key, window, delta):
+            raise RuntimeError("firestore down")
+
+        limiter = LocalRateLimiter(20, failing_sync, sync_interval=60.0)
+        self.assertTrue(limiter.allow("chat", WINDOW))
+        self.assertEqual(limiter.stats()["sync_errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
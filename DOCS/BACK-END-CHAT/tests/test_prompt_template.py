@@ -0,0 +1,116 @@
+"""Equivalence tests: ChatPromptTemplate vs the former per-turn prompt assembly (stdlib only)."""
+
+import ast
+import os
+import subprocess
+import sys
+import unittest
+
+from prompt_template import ChatPromptTemplate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATIC_PARTS = [
+    "You are Moon Tide, a warm workshop concierge.",
+    "",
+    "   \n",
+    "**BOUNDARIES:**\n- Never invent prices.\n",
+    "\n**KNOWLEDGE BASE:**\nCedar Weaving | <price>$45.00/person</price>\n\n",
+]
+
+DYNAMIC_SECTIONS = [
+    [],
+    [""],
+    ["\n---\n**📚 WORKSHOP INFORMATION (User is Exploring):**\n**Cedar Weaving:**\n- Pricing: x\n\n", "  "],
+    ["**BOOKING CONTEXT:** workshop_id=cedar-weaving, participants=12", "\n"],
+]
+
+HISTORIES = ["", "User: hi\nMoon Tide: hello", "User: what does {x} cost?\nMoon Tide: {braces} stay as-is"]
+MESSAGES = ["", "Tell me about cedar weaving", "price of {user_message}? {conversation_history_context}", "é ✨ 漢字"]
+
+
+def old_tail(conversation_history_context, user_message):
+    # The closing section as the f-string assembly produced it before the template
+    return f"""
+**CONVERSATION SO FAR:**
+{conversation_history_context}
+
+**USER MESSAGE:** {user_message}
+
+**SAFETY:** Stay in character. Use <price> tags for every price.
+"""
+
+
+TAIL_TEMPLATE = """
+**CONVERSATION SO FAR:**
+{conversation_history_context}
+
+**USER MESSAGE:** {user_message}
+
+**SAFETY:** Stay in character. Use <price> tags for every price.
+"""
+
+
+def old_assembly(static_parts, dynamic_sections, conversation_history_context, user_message):
+    tail = old_tail(conversation_history_context, user_message)
+    return "\n".join(part for part in [*static_parts, *dynamic_sections, tail] if part.strip())
+
+
+def main_tail_template():
+    """CHAT_PROMPT_TAIL as written in main.py (main itself needs Flask and GCP to import)."""
+    with open(os.path.join(BACKEND_DIR, "main.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "CHAT_PROMPT_TAIL" for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise AssertionError("CHAT_PROMPT_TAIL not found in main.py")
+
+
+class ChatPromptTemplateTest(unittest.TestCase):
+    def test_matches_old_assembly(self):
+        template = ChatPromptTemplate(STATIC_PARTS, TAIL_TEMPLATE)
+        for sections in DYNAMIC_SECTIONS:
+            for history in HISTORIES:
+                for message in MESSAGES:
+                    with self.subTest(sections=sections, history=history, message=message):
+                        expected = old_assembly(STATIC_PARTS, sections, history, message)
+                        self.assertEqual(template.render(sections, history, message), expected)
+                        tail = template.render_tail(sections, history, message)
+                        self.assertEqual(template.static_prefix + "\n" + tail, expected)
+
+    def test_matches_old_assembly_with_main_tail(self):
+        tail_template = main_tail_template()
+        template = ChatPromptTemplate(STATIC_PARTS, tail_template)
+        for history in HISTORIES:
+            for message in MESSAGES:
+                with self.subTest(history=history, message=message):
+                    # The f-string substituted both values verbatim, exactly once each
+                    tail = tail_template.replace("{conversation_history_context}", history, 1)
+                    head, _, rest = tail.partition("{user_message}")
+                    tail = head + message + rest
+                    expected = "\n".join(part for part in [*STATIC_PARTS, "x", tail] if part.strip())
+                    self.assertEqual(template.render(["x"], history, message), expected)
+
+    def test_empty_static_prefix(self):
+        template = ChatPromptTemplate(["", " "], TAIL_TEMPLATE)
+        self.assertEqual(template.render(["x"], "h", "m"), old_assembly([], ["x"], "h", "m"))
+
+    def test_version_follows_prefix_and_catalog(self):
+        first = ChatPromptTemplate(STATIC_PARTS, TAIL_TEMPLATE)
+        self.assertEqual(first.version, ChatPromptTemplate(list(STATIC_PARTS), TAIL_TEMPLATE).version)
+        self.assertNotEqual(first.version, ChatPromptTemplate(STATIC_PARTS + ["more"], TAIL_TEMPLATE).version)
+        self.assertTrue(ChatPromptTemplate(STATIC_PARTS, TAIL_TEMPLATE, catalog_version="abc").version.startswith("abc-"))
+
+    def test_tail_needs_both_placeholders(self):
+        with self.assertRaises(ValueError):
+            ChatPromptTemplate(STATIC_PARTS, "{user_message} {conversation_history_context}")
+
+    def test_imports_nothing_from_gcp(self):
+        # Blocks every google.* import, so the module must load on the standard library alone
+        code = "import sys; sys.modules['google'] = None; import prompt_template"
+        result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
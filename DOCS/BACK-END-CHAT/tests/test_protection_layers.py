@@ -0,0 +1,155 @@
+"""
+Rejection precedence of the concurrent protection layers (stdlib only).
+
+main.py needs Flask and the session/security modules, so the two layer runners
+are compiled from its source and run against recording fakes: for every
+combination of layer outcomes both must return the same response and make the
+same side-effecting calls.
+"""
+
+import ast
+import contextlib
+import functools
+import itertools
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+RUNNERS = ("_run_protection_layers", "_run_protection_layers_concurrent")
+
+# Layer outcomes, in the sequential order; True means the layer rejects
+OUTCOMES = ("ip", "bot", "circuit_breaker", "global", "signature", "pattern", "endpoint")
+# Calls that write or record something (read-only checks may run early or be cancelled)
+SIDE_EFFECTS = ("check_and_update_ip_rate_limit", "log_security_event", "increment_global_counter",
+                "record_strike", "_resolve_session_fingerprint", "_signature_rejection",
+                "_check_request_patterns", "_endpoint_rejection")
+
+
+@functools.lru_cache(maxsize=None)
+def load_runners():
+    with open(MAIN_PATH) as f:
+        tree = ast.parse(f.read())
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in RUNNERS]
+    return compile(ast.Module(body=functions, type_ignores=[]), MAIN_PATH, "exec")
+
+
+class FakeLatency:
+    @contextlib.contextmanager
+    def timed(self, name):
+        yield
+
+    def call(self, name, fn, *args):
+        return fn(*args)
+
+
+class Scenario:
+    """Recording fakes for one combination of layer outcomes."""
+
+    def __init__(self, rejects):
+        self.rejects = rejects
+        self.calls = []
+        self.lock = threading.Lock()
+        self.body_read = False
+
+    def record(self, name, *args):
+        with self.lock:
+            self.calls.append((name, args))
+
+    def namespace(self, pool):
+        rejects = self.rejects
+        scenario = self
+
+        class SecurityMonitor:
+            def log_security_event(self, event, **kwargs):
+                scenario.record("log_security_event", event)
+
+        class Request:
+            path = "/chat"
+            headers = {}
+
+        def check_ip(client_ip):
+            self.record("check_and_update_ip_rate_limit", client_ip)
+            return not rejects["ip"]
+
+        def read_inputs():
+            self.body_read = True
+            return {"prompt": "hi"}, "session-1", "device-1", None
+
+        def check_global(pending_increments=0):
+            return not rejects["global"]
+
+        def resolve(json_data, session_id, device_fingerprint, user_id):
+            self.record("_resolve_session_fingerprint")
+            return "fp-1", None
+
+        def signature(*args):
+            self.record("_signature_rejection")
+            return ("invalid signature", 401) if rejects["signature"] else None
+
+        def patterns(fingerprint, json_data):
+            self.record("_check_request_patterns")
+            return "dos" if rejects["pattern"] else None
+
+        def endpoint(protection_batch, endpoint_name, user_id, fingerprint):
+            self.record("_endpoint_rejection", endpoint_name)
+            return ("endpoint limit", 429) if rejects["endpoint"] else None
+
+        return {
+            "Optional": Optional,
+            "request": Request(),
+            "jsonify": lambda body: body["error"],
+            "logger": type("Logger", (), {"critical": lambda *a: None, "warning": lambda *a: None})(),
+            "layer_latency": FakeLatency(),
+            "security_monitor": SecurityMonitor(),
+            "get_protection_pool": lambda: pool,
+            "check_and_update_ip_rate_limit": check_ip,
+            "is_bot_request": lambda request_obj: rejects["bot"],
+            "increment_global_counter": lambda: self.record("increment_global_counter"),
+            "_read_protection_inputs": read_inputs,
+            "check_circuit_breaker": lambda: rejects["circuit_breaker"],
+            "check_global_rate_limit": check_global,
+            "record_strike": lambda: self.record("record_strike") or 1,
+            "_resolve_session_fingerprint": resolve,
+            "_signature_rejection": signature,
+            "_check_request_patterns": patterns,
+            "_pattern_rejection": lambda pattern: ("Request pattern blocked.", 429) if pattern else None,
+            "_endpoint_rejection": endpoint,
+        }
+
+
+def run(runner, rejects):
+    scenario = Scenario(rejects)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        namespace = scenario.namespace(pool)
+        exec(load_runners(), namespace)
+        if runner == "_run_protection_layers":
+            response = namespace[runner](None, "203.0.113.7", "chat")
+        else:
+            response = namespace[runner]("203.0.113.7", "chat")
+    # The pool is drained here, so fire-and-forget calls have been recorded
+    side_effects = sorted(call for call in scenario.calls if call[0] in SIDE_EFFECTS)
+    return response, side_effects, scenario.body_read
+
+
+class ProtectionPrecedenceTest(unittest.TestCase):
+    def test_same_response_and_side_effects_for_every_outcome(self):
+        for combination in itertools.product((False, True), repeat=len(OUTCOMES)):
+            rejects = dict(zip(OUTCOMES, combination))
+            with self.subTest(rejects=[name for name in OUTCOMES if rejects[name]]):
+                self.assertEqual(run("_run_protection_layers_concurrent", rejects), run("_run_protection_layers", rejects))
+
+    def test_body_is_not_parsed_for_rejected_floods(self):
+        for layer in ("ip", "bot"):
+            rejects = dict.fromkeys(OUTCOMES, False)
+            rejects[layer] = True
+            for runner in RUNNERS:
+                with self.subTest(layer=layer, runner=runner):
+                    _, _, body_read = run(runner, rejects)
+                    self.assertFalse(body_read)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Tests for the write-behind session cache against the in-memory store (stdlib + firestore client lib)."""
+
+import unittest
+
+from booking_state import BookingState
+from session_cache import WriteBehindSessionCache, WriteThroughSessionManager, apply_fields, diff_fields
+from session_store import MemorySessionStore
+
+
+def make_cache(store):
+    return WriteBehindSessionCache(store, ttl_seconds=60, flush_interval=3600, compact=False)
+
+
+class FieldDiffTest(unittest.TestCase):
+    def test_apply_inverts_diff(self):
+        old = {"state": {"workshop_id": "a", "participants": 2}, "history": "x", "request_count": 1}
+        new = {"state": {"workshop_id": "b", "participants": 2, "date": "2026-10-17"}, "request_count": 2}
+        self.assertEqual(apply_fields(old, diff_fields(old, new)), new)
+
+
+class ConflictTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MemorySessionStore()
+        seed = make_cache(self.store)
+        seed.update_session("s1", {"state": {"workshop_id": "a", "participants": 1}, "request_count": 1})
+        seed.flush()
+        self.first, self.second = make_cache(self.store), make_cache(self.store)
+        self.first.get_session("s1")
+        self.second.get_session("s1")
+
+    def stored(self):
+        return self.store.read("s1")[0]
+
+    def test_conflicting_update_is_reapplied_not_dropped(self):
+        self.first.update_session("s1", {"state": {"workshop_id": "b", "participants": 1}})
+        self.first.flush()
+        self.second.update_session("s1", {"state": {"workshop_id": "a", "participants": 3}, "request_count": 2})
+        self.second.flush()  # Conflict: reloads and reapplies
+        self.second.flush()
+        self.assertEqual(self.stored()["state"], {"workshop_id": "b", "participants": 3})
+        self.assertEqual(self.stored()["request_count"], 2)
+        self.assertEqual(self.second.stats()["conflicts"], 1)
+
+    def test_update_queued_after_failed_flush_survives(self):
+        self.first.update_session("s1", {"request_count": 5})
+        self.first.flush()
+        self.second.update_session("s1", {"state": {"workshop_id": "c", "participants": 1}})
+        entry = self.second._entries["s1"]
+        pending = (dict(entry.data), entry.version, entry.persisted)
+        entry.dirty = False
+        self.second.update_session("s1", {"state": {"workshop_id": "c", "participants": 4}})
+        self.second._write("s1", entry, *pending)  # The snapshot's write conflicts
+        self.second.flush()
+        self.assertEqual(self.stored()["state"], {"workshop_id": "c", "participants": 4})
+        self.assertEqual(self.stored()["request_count"], 5)
+
+    def test_deletion_elsewhere_wins(self):
+        self.first.delete_session("s1")
+        self.second.update_session("s1", {"request_count": 9})
+        self.second.flush()
+        self.assertIsNone(self.stored())
+        self.assertNotIn("s1", self.second._entries)
+
+
+class EncodingTest(unittest.TestCase):
+    def test_unencodable_session_stays_dirty(self):
+        store = MemorySessionStore()
+        cache = WriteBehindSessionCache(store, ttl_seconds=60, flush_interval=3600, compact=True)
+        cache.update_session("s1", {"story_state": {"seen": {"a", "b"}, "narrative": "x" * 300}})
+        cache.flush()
+        self.assertIsNone(store.read("s1")[0])
+        self.assertTrue(cache._entries["s1"].dirty)
+        self.assertEqual(cache.stats()["errors"], 1)
+
+
+class Manager:
+    """Stand-in for main.BookingContextManager (main.py needs Flask to import)."""
+
+    def __init__(self, state):
+        self.state = state
+
+
+class WriteThroughTest(unittest.TestCase):
+    def test_reads_sessions_written_by_the_cache(self):
+        store = MemorySessionStore()
+        cache = WriteBehindSessionCache(store, ttl_seconds=60, flush_interval=3600, compact=True)
+        story = {"narrative": "Waves. " * 100, "choices": ["a", "b"]}
+        cache.update_session("s1", {"story_state": story, "request_count": 1})
+        cache.flush()
+        session = WriteThroughSessionManager(store).get_session("s1")
+        self.assertEqual(session["story_state"], story)
+
+    def test_booking_state_round_trip(self):
+        store = MemorySessionStore()
+        manager = WriteThroughSessionManager(store)
+        state = BookingState()
+        state["workshop_id"] = "w1"
+        state["triggered_hardcodes"].add("greeting")
+        manager.update_session("s1", Manager(state), request_count=2)
+        session = manager.get_session("s1")
+        self.assertEqual(BookingState.from_dict(session["state"]).to_dict(), state.to_dict())
+        self.assertEqual(session["request_count"], 2)
+
+    def test_update_keeps_fields_written_elsewhere(self):
+        store = MemorySessionStore()
+        first, second = WriteThroughSessionManager(store), WriteThroughSessionManager(store)
+        first.update_session("s1", {"story_state": {"chapter": 1}, "request_count": 1})
+        second.update_session("s1", {"request_count": 2})
+        self.assertEqual(first.get_session("s1"), {"story_state": {"chapter": 1}, "request_count": 2})
+        self.assertEqual(second.stats()["writes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests for the compact session encoding (stdlib only)."""
+
+import unittest
+from datetime import datetime
+
+from session_codec import SCHEMA_FIELD, decode_document, encode_document, encode_value, is_blob
+
+
+def story_session():
+    return {
+        "state": {"workshop_id": "w1", "conversation_history": [{"role": "user", "text": "hello " * 60}]},
+        "story_state": {"saga_title": "The Tide", "narrative": "Waves. " * 100, "choices": ["a", "b"]},
+        "request_count": 3,
+    }
+
+
+class SessionCodecTest(unittest.TestCase):
+    def test_round_trip_compacts_bulky_fields(self):
+        session = story_session()
+        encoded = encode_document(session)
+        self.assertTrue(is_blob(encoded["story_state"]))
+        self.assertTrue(is_blob(encoded["state"]["conversation_history"]))
+        self.assertEqual(decode_document(encoded), session)
+
+    def test_plain_documents_decode_unchanged(self):
+        session = story_session()
+        self.assertEqual(decode_document(session), session)
+        self.assertEqual(decode_document({**session, SCHEMA_FIELD: 1}), session)
+
+    def test_non_json_types_are_rejected(self):
+        for value in ({"seen": {"a", "b"}}, {"at": datetime(2026, 10, 17)}, {"raw": b"x"}):
+            with self.subTest(value=value):
+                with self.assertRaises(TypeError):
+                    encode_value({**value, "padding": "x" * 300})
+
+    def test_newer_schema_is_refused(self):
+        with self.assertRaises(ValueError):
+            decode_document({SCHEMA_FIELD: 99})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests for session token issue/verify (stdlib only)."""
+
+import unittest
+
+from session_token import issue_session_token, verify_session_token
+
+SECRET = "test-secret"
+
+
+class SessionTokenTest(unittest.TestCase):
+    def test_round_trip(self):
+        token, expires_at = issue_session_token(SECRET, "session_abc", "f" * 64, "mobile_375x812_2.0", 60)
+        self.assertEqual(verify_session_token(SECRET, token), {
+            "session_id": "session_abc",
+            "fingerprint": "f" * 64,
+            "device_fingerprint": "mobile_375x812_2.0",
+            "expires_at": expires_at,
+        })
+
+    def test_wrong_secret_and_expired(self):
+        token, _ = issue_session_token(SECRET, "session_abc", "f" * 64, None, 60)
+        self.assertIsNone(verify_session_token("other-secret", token))
+        expired, _ = issue_session_token(SECRET, "session_abc", "f" * 64, None, -1)
+        self.assertIsNone(verify_session_token(SECRET, expired))
+
+    def test_malformed_tokens_are_invalid(self):
+        token, _ = issue_session_token(SECRET, "session_abc", "f" * 64, None, 60)
+        payload, signature = token.split(".")
+        for bad in [None, "", 123, ["a.b"], "é.abc", "abc.é", "abc", "a.b.c", f"{payload}x.{signature}",
+                    f"{payload}.{signature[:-2]}", "!!!.???"]:
+            with self.subTest(token=bad):
+                self.assertIsNone(verify_session_token(SECRET, bad))
+
+    def test_separator_in_fields_is_rejected(self):
+        with self.assertRaises(ValueError):
+            issue_session_token(SECRET, "session|abc", "f" * 64, None, 60)
+        with self.assertRaises(ValueError):
+            issue_session_token(SECRET, 42, "f" * 64, None, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests for adaptive shard metadata handling (fake Firestore client, stdlib only)."""
+
+import threading
+import time
+import unittest
+
+from shard_counter import ShardedCounter
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self.collection.gets.append(threading.current_thread().name)
+        return FakeSnapshot(self.collection.docs.get(self.id))
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.gets = []
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+
+class FakeDb:
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class AdaptiveMetadataTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDb()
+        self.meta = self.db.collection("shards_meta")
+        self.meta.docs["GLOBAL"] = {"num_shards": 20, "previous_shards": 10, "changed_at": 0}
+        self.counter = ShardedCounter(self.db, "shards", adaptive=True, meta_ttl=0.05, resize_interval=0.0)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_only_first_lookup_reads_inline(self):
+        self.assertEqual(self.counter.shard_count("GLOBAL"), 20)
+        for _ in range(100):
+            self.counter.shard_count("GLOBAL")
+        request_thread = threading.current_thread().name
+        self.assertEqual(self.meta.gets.count(request_thread), 1)
+
+        # The worker picks up changes made by other instances
+        self.meta.docs["GLOBAL"] = {"num_shards": 40, "previous_shards": 20, "changed_at": 0}
+        self.wait_for(lambda: self.counter.shard_count("GLOBAL") == 40)
+        self.assertEqual(self.meta.gets.count(request_thread), 1)
+
+    def test_resizes_run_on_the_worker(self):
+        resized = []
+        self.counter._resize = lambda key, current, desired, reason: resized.append((key, desired, threading.current_thread().name))
+        self.counter.shard_count("GLOBAL")
+
+        # 600 writes in the first 10 s of a window: far more than 20 shards can take
+        window = int(time.time()) - 10
+        self.counter.observe("GLOBAL", 600, window)
+
+        self.wait_for(lambda: resized)
+        key, desired, thread_name = resized[0]
+        self.assertEqual(key, "GLOBAL")
+        self.assertGreater(desired, 20)
+        self.assertNotEqual(thread_name, threading.current_thread().name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests for TokenBudget.fit trimming (stdlib only)."""
+
+import unittest
+
+from token_budget import TokenBudget
+
+
+class FitTest(unittest.TestCase):
+    def setUp(self):
+        self.turns = ["USER: " + "alpha " * 40, "AI: " + "beta " * 40, "USER: " + "gamma " * 40]
+        self.history = "\n".join(self.turns)
+        self.fallbacks = [
+            "\n".join(["(Earlier conversation omitted)", *self.turns[dropped:]])
+            for dropped in range(1, len(self.turns))
+        ] + ["(Earlier conversation omitted)"]
+
+    def fit(self, budget, info="info " * 50):
+        budget_tokens = TokenBudget(budget)
+        return budget_tokens.fit(100, [("info_mode", info, ""), ("history", self.history, self.fallbacks)])
+
+    def test_no_trim_within_budget(self):
+        fitted, trimmed, _ = self.fit(0)
+        self.assertEqual(trimmed, [])
+        self.assertEqual(fitted["history"], self.history)
+
+    def test_info_mode_goes_first(self):
+        counter = TokenBudget()
+        full = 100 + counter.count("info " * 50) + counter.count(self.history)
+        fitted, trimmed, total = self.fit(full - 10)
+        self.assertEqual(trimmed, ["info_mode"])
+        self.assertEqual(fitted["info_mode"], "")
+        self.assertEqual(fitted["history"], self.history)
+        self.assertLessEqual(total, full - 10)
+
+    def test_history_drops_oldest_turns_first(self):
+        counter = TokenBudget()
+        budget = 100 + counter.count(self.fallbacks[1]) + 5
+        fitted, trimmed, total = self.fit(budget)
+        self.assertEqual(trimmed, ["info_mode", "history"])
+        self.assertEqual(fitted["history"], self.fallbacks[1])
+        self.assertTrue(fitted["history"].endswith(self.turns[-1]))
+        self.assertLessEqual(total, budget)
+
+    def test_last_fallback_when_nothing_fits(self):
+        fitted, _, _ = self.fit(50)
+        self.assertEqual(fitted["history"], "(Earlier conversation omitted)")
+
+    def test_string_fallback_still_supported(self):
+        fitted, trimmed, _ = TokenBudget(10).fit(5, [("history", "word " * 100, "(omitted)")])
+        self.assertEqual(fitted["history"], "(omitted)")
+        self.assertEqual(trimmed, ["history"])
+
+
+if __name__ == "__main__":
+    unittest.main()
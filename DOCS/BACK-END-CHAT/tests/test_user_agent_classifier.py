@@ -0,0 +1,69 @@
+"""Tests for the compiled User-Agent bot matcher (stdlib only)."""
+
+import logging
+import random
+import string
+import unittest
+
+from user_agent_classifier import UserAgentClassifier, compile_signatures
+
+SIGNATURES = ('curl', 'wget', 'python', 'java', 'go-http-client', 'node', 'postman', 'insomnia', 'paw',
+              'restclient', 'bot', 'crawler', 'spider', 'scraper', 'monitoring', 'apache-httpclient',
+              'okhttp', 'urllib', 'httpx')
+BROWSER = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
+
+
+def scan(user_agent, signatures, allowed):
+    """The substring scan the classifier replaced."""
+    user_agent_lower = user_agent.lower()
+    if any(sig in user_agent_lower for sig in allowed):
+        return None
+    return next((sig for sig in signatures if sig in user_agent_lower), None)
+
+
+class UserAgentClassifierTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.classifier = UserAgentClassifier(SIGNATURES, ("stripe",), cache_size=8, max_cached_length=200)
+
+    def test_same_verdicts_as_substring_scan(self):
+        rng = random.Random(3)
+        alphabet = string.ascii_letters + string.digits + " /.;()-_"
+        samples = [BROWSER, "curl/8.5.0", "Stripe/1.0 bot", "Python-urllib/3.11", "PAW/3.4", "robots"]
+        for _ in range(2000):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+            if rng.random() < 0.5:
+                cut = rng.randint(0, len(text))
+                text = text[:cut] + rng.choice(SIGNATURES + ("stripe",)).upper() + text[cut:]
+            samples.append(text)
+        for user_agent in samples:
+            with self.subTest(user_agent=user_agent):
+                expected = scan(user_agent, SIGNATURES, ("stripe",))
+                self.assertEqual(bool(self.classifier.classify(user_agent)), bool(expected))
+
+    def test_reports_longest_signature_at_match(self):
+        pattern = compile_signatures(("http", "httpx", "bot"))
+        self.assertEqual(pattern.search("python-httpx/0.27").group(0), "httpx")
+
+    def test_long_user_agents_are_scanned_in_full_but_not_cached(self):
+        padded = BROWSER + " " * 500 + "curl/8.5.0"
+        self.assertEqual(self.classifier.classify(padded), "curl")
+        stats = self.classifier.stats()
+        self.assertEqual(stats["size"], 0)
+        self.assertEqual(stats["uncached_long_user_agents"], 1)
+
+    def test_random_user_agents_cannot_grow_the_cache(self):
+        for n in range(100):
+            self.classifier.classify(f"{BROWSER} build/{n}")
+        self.assertEqual(self.classifier.stats()["size"], 8)
+
+    def test_repeat_lookups_hit_the_cache(self):
+        for _ in range(5):
+            self.classifier.classify(BROWSER)
+        stats = self.classifier.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (4, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Token Budget Module - Cached Prompt Token Counts and Budget Enforcement
+
+Prompt size used to be guessed as len(prompt) // 4 and never enforced, so an
+oversized turn went to Vertex AI and came back as a 429. TokenBudget gives
+the chat path a cheap, calibrated token count and trims optional prompt
+parts before the call:
+
+- count(text): local approximation (word pieces of up to 4 characters plus
+  one token per punctuation mark), scaled by a calibration ratio. The scan
+  costs roughly 50 us per 1k characters, so fixed texts (static prefix,
+  tail template, snippets) are memoised in an LRU and only scanned once;
+  per-turn texts are counted with memoize=False
+- calibrate(estimated, actual): moves the ratio towards the real
+  usage_metadata.prompt_token_count of each response (exponential moving
+  average, so one odd response cannot swing it)
+- fit(required_tokens, optional_parts): replaces optional parts (info mode
+  details, conversation history) with their short fallbacks, in order, until
+  the prompt fits the budget
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+_PIECE_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+# Weight of each new observation in the calibration ratio
+CALIBRATION_ALPHA = 0.1
+CALIBRATION_BOUNDS = (0.5, 2.0)
+
+
+def approximate_tokens(text):
+    """Uncalibrated token estimate: words split into 4-character pieces, punctuation 1 each."""
+    return len(_PIECE_PATTERN.findall(text))
+
+
+class TokenBudget:
+    """
+    Token accounting for prompts sent to Vertex AI.
+
+    Args:
+        budget_tokens (int): Maximum input tokens per request (0 = count only, never trim)
+        cache_size (int): Distinct texts whose raw counts are memoised
+    """
+
+    def __init__(self, budget_tokens=0, cache_size=1024):
+        self.budget_tokens = budget_tokens
+        self.cache_size = cache_size
+        self.ratio = 1.0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._calibrations = 0
+        self._last_error = None
+        self._fits = 0
+        self._trims = {}
+        self._over_budget = 0
+
+    def _raw_count(self, text):
+        with self._lock:
+            tokens = self._counts.get(text)
+            if tokens is not None:
+                self._counts.move_to_end(text)
+                self._hits += 1
+                return tokens
+            self._misses += 1
+        tokens = approximate_tokens(text)
+        with self._lock:
+            self._counts[text] = tokens
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def count(self, text, memoize=True):
+        """Calibrated token estimate for `text` (memoize=False for one-off texts)."""
+        if not text:
+            return 0
+        raw = self._raw_count(text) if memoize else approximate_tokens(text)
+        return round(raw * self.ratio)
+
+    def calibrate(self, estimated_tokens, actual_tokens):
+        """Fold one (estimate, usage_metadata.prompt_token_count) pair into the ratio."""
+        if not estimated_tokens or not actual_tokens:
+            return
+        raw_estimate = estimated_tokens / self.ratio
+        observed = min(max(actual_tokens / raw_estimate, CALIBRATION_BOUNDS[0]), CALIBRATION_BOUNDS[1])
+        with self._lock:
+            self.ratio += CALIBRATION_ALPHA * (observed - self.ratio)
+            self._calibrations += 1
+            self._last_error = round((estimated_tokens - actual_tokens) / actual_tokens, 4)
+
+    def fit(self, required_tokens, optional_parts):
+        """
+        Trim optional prompt parts until the prompt fits the budget.
+
+        Args:
+            required_tokens (int): Tokens of everything that cannot be trimmed
+            optional_parts (list): (name, text, fallback) tuples, trimmed in list order
+                (texts are per-turn and not memoised; fallbacks are). `fallback` may also
+                be a list of progressively shorter texts (per-turn, not memoised): the
+                first one that brings the prompt within budget is used, else the last
+
+        Returns:
+            tuple: ({name: text to use}, [names that were trimmed], estimated total tokens)
+        """
+        parts = {name: text for name, text, _ in optional_parts}
+        counts = [self.count(text, memoize=False) for _, text, _ in optional_parts]
+        total = required_tokens + sum(counts)
+        trimmed = []
+        with self._lock:
+            self._fits += 1
+        if self.budget_tokens:
+            for (name, text, fallback), tokens in zip(optional_parts, counts):
+                if total <= self.budget_tokens:
+                    break
+                if isinstance(fallback, str):
+                    candidates = [(fallback, self.count(fallback))]
+                else:
+                    candidates = [(option, self.count(option, memoize=False)) for option in fallback]
+                for option, option_tokens in candidates:
+                    if total - tokens + option_tokens <= self.budget_tokens:
+                        break
+                saved = tokens - option_tokens
+                if saved <= 0:
+                    continue
+                parts[name] = option
+                total -= saved
+                trimmed.append(name)
+            with self._lock:
+                for name in trimmed:
+                    self._trims[name] = self._trims.get(name, 0) + 1
+                if total > self.budget_tokens:
+                    self._over_budget += 1
+        return parts, trimmed, total
+
+    def stats(self):
+        """Calibration and trimming counters (for /system_status)."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "budget_tokens": self.budget_tokens,
+                "calibration_ratio": round(self.ratio, 4),
+                "calibrations": self._calibrations,
+                "last_relative_error": self._last_error,
+                "count_cache_entries": len(self._counts),
+                "count_cache_hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "prompts_checked": self._fits,
+                "trimmed": dict(self._trims),
+                "still_over_budget": self._over_budget,
+            }
@@ -0,0 +1,100 @@
+"""
+User-Agent Classifier Module - Compiled Bot Signature Matching
+
+Bot detection checks every User-Agent against a list of signatures ("curl",
+"python", "bot", ...) and an allow list ("stripe"). Each list is compiled into
+one alternation regex, so a User-Agent is scanned once instead of once per
+signature (benchmarks/user_agent_match.py compares the two).
+
+Verdicts are cached in a bounded LRU keyed by the User-Agent: real traffic has
+few distinct User-Agents, and a client sending random ones only churns the
+cache (each miss costs one regex scan). User-Agents longer than
+max_cached_length are classified without being cached, so the cache holds at
+most cache_size * max_cached_length characters. Matching always scans the full
+User-Agent, so padding cannot push a signature out of view.
+"""
+
+import logging
+import re
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _trie_pattern(node):
+    """Regex for a character trie, with shared prefixes factored out (e.g. "p(?:aw|ostman|ython)")."""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # A signature ending here makes the longer continuations optional (greedy, so the longest wins)
+    return f"(?:{pattern})?" if "" in node else pattern
+
+
+def compile_signatures(signatures):
+    """One regex matching any of the (lower-case) signatures, or None for an empty list."""
+    if not signatures:
+        return None
+    trie = {}
+    for signature in signatures:
+        node = trie
+        for char in signature:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    # Factoring shared prefixes keeps the engine from retrying every alternative at each position
+    return re.compile(_trie_pattern(trie))
+
+
+class UserAgentClassifier:
+    """
+    Compiled bot signature matcher with a bounded verdict cache.
+
+    Args:
+        signatures (iterable): Substrings marking a bot User-Agent (lower case)
+        allowed (iterable): Substrings that override a bot match (e.g. "stripe")
+        cache_size (int): Distinct User-Agents whose verdict is cached (LRU)
+        max_cached_length (int): Longer User-Agents are classified but not cached
+    """
+
+    def __init__(self, signatures, allowed=(), cache_size=4096, max_cached_length=512):
+        self.signatures = tuple(signatures)
+        self.allowed = tuple(allowed)
+        self.max_cached_length = max_cached_length
+        self._pattern = compile_signatures(self.signatures)
+        self._allowed_pattern = compile_signatures(self.allowed)
+        self._cached_classify = lru_cache(maxsize=cache_size)(self._classify)
+        self._uncached = 0
+        self._lock = threading.Lock()
+
+    def _classify(self, user_agent):
+        user_agent_lower = user_agent.lower()
+        if self._allowed_pattern and self._allowed_pattern.search(user_agent_lower):
+            return None  # Allowed client (e.g. Stripe webhooks)
+
+        match = self._pattern.search(user_agent_lower) if self._pattern else None
+        if not match:
+            return None
+        # Logged once per distinct User-Agent (cache miss), not once per request
+        logger.warning(f"BOT DETECTED: Signature '{match.group(0)}' in User-Agent '{user_agent_lower[:self.max_cached_length]}'.")
+        return match.group(0)
+
+    def classify(self, user_agent):
+        """Returns the bot signature found in a User-Agent, or None if it looks like a browser."""
+        if len(user_agent) > self.max_cached_length:
+            with self._lock:
+                self._uncached += 1
+            return self._classify(user_agent)
+        return self._cached_classify(user_agent)
+
+    def stats(self):
+        """Verdict cache hit counts (for /system_status)."""
+        info = self._cached_classify.cache_info()
+        return {
+            "signatures": len(self.signatures),
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "uncached_long_user_agents": self._uncached,
+        }
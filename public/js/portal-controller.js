@@ -45,25 +45,42 @@ let deviceDetectorInstance = null; // Will hold the DeviceDetector instance
 let fingerprintSignatureCache = {
     signature: null,
     timestamp: null,
-    expiresAt: null
+    expiresAt: null,
+    sessionToken: null, // Long-lived token for this session (replaces the 2-minute signature)
+    tokenSessionId: null,
+    tokenExpiresAt: null
 };
 
+const SESSION_TOKEN_REFRESH_MARGIN_MS = 60 * 1000; // Re-sign a minute before the token expires
+
 /**
- * Get or create a fingerprint signature with caching.
- * Signatures are cached for 2 minutes to avoid per-request overhead.
- * This reduces latency from 100-200ms to <1ms for cached signatures.
+ * Get or create Layer 6 credentials with caching.
+ * /sign-fingerprint is called with the session ID and returns a session token that is
+ * valid for the whole session, so it is only called once per session. If the backend
+ * issues no token, the 2-minute signature is cached and refreshed as before.
+ * Returns { signature, timestamp, sessionToken } (unused fields are null).
  */
 async function getFingerprintSignatureWithCache() {
     const now = Date.now();
+    const currentSessionId = getSessionId();
+
+    // Return the cached session token while it is valid for this session
+    if (fingerprintSignatureCache.sessionToken &&
+        fingerprintSignatureCache.tokenSessionId === currentSessionId &&
+        now < fingerprintSignatureCache.tokenExpiresAt - SESSION_TOKEN_REFRESH_MARGIN_MS) {
+        return { signature: null, timestamp: null, sessionToken: fingerprintSignatureCache.sessionToken };
+    }
 
     // Return cached signature if still valid (within 2-minute window)
-    if (fingerprintSignatureCache.signature &&
+    if (!fingerprintSignatureCache.sessionToken &&
+        fingerprintSignatureCache.signature &&
         fingerprintSignatureCache.expiresAt &&
         now < fingerprintSignatureCache.expiresAt) {
         console.log('✓ Using cached fingerprint signature (expires in', Math.round((fingerprintSignatureCache.expiresAt - now) / 1000), 's)');
         return {
             signature: fingerprintSignatureCache.signature,
-            timestamp: fingerprintSignatureCache.timestamp
+            timestamp: fingerprintSignatureCache.timestamp,
+            sessionToken: null
         };
     }
 
@@ -73,18 +90,29 @@ async function getFingerprintSignatureWithCache() {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                device_fingerprint: deviceFingerprint
+                device_fingerprint: deviceFingerprint,
+                session_id: currentSessionId
             })
         });
 
         if (!response.ok) {
             console.warn('⚠ Signature request failed (HTTP', response.status + '), continuing without signature');
-            return { signature: null, timestamp: null };
+            return { signature: null, timestamp: null, sessionToken: null };
         }
 
         const data = await response.json();
 
-        // Cache the signature for 2 minutes (120 seconds)
+        if (data.session_token && data.token_expires) {
+            // One token for the rest of the session (token_expires is in epoch seconds)
+            fingerprintSignatureCache.sessionToken = data.session_token;
+            fingerprintSignatureCache.tokenSessionId = currentSessionId;
+            fingerprintSignatureCache.tokenExpiresAt = data.token_expires * 1000;
+            console.log('✓ Session token cached (expires in', Math.round((data.token_expires * 1000 - now) / 60000), 'min)');
+            return { signature: null, timestamp: null, sessionToken: data.session_token };
+        }
+
+        // No session token from the backend - cache the signature for 2 minutes (120 seconds)
+        fingerprintSignatureCache.sessionToken = null;
         fingerprintSignatureCache.signature = data.signature;
         fingerprintSignatureCache.timestamp = data.timestamp;
         fingerprintSignatureCache.expiresAt = now + (2 * 60 * 1000); // 2 minutes
@@ -92,16 +120,27 @@ async function getFingerprintSignatureWithCache() {
         console.log('✓ New fingerprint signature cached (expires in 2 minutes)');
         return {
             signature: data.signature,
-            timestamp: data.timestamp
+            timestamp: data.timestamp,
+            sessionToken: null
         };
 
     } catch (error) {
         console.error('❌ Failed to get fingerprint signature:', error);
         // Fail-open: continue without signature (Layer 6 validation is optional)
-        return { signature: null, timestamp: null };
+        return { signature: null, timestamp: null, sessionToken: null };
     }
 }
 
+/**
+ * Drop the cached session token after the backend rejects it (HTTP 401),
+ * so the next request signs again instead of resending a bad token.
+ */
+function invalidateSessionToken() {
+    fingerprintSignatureCache.sessionToken = null;
+    fingerprintSignatureCache.tokenSessionId = null;
+    fingerprintSignatureCache.tokenExpiresAt = null;
+}
+
 /**
  * Get or create a session ID for this browser tab.
  * ALWAYS creates a fresh session on page load.
@@ -366,10 +405,12 @@ class PortalController {
                     session_id: getSessionId(),
                     device_fingerprint: deviceFingerprint, // Include device fingerprint for rate limiting
                     fingerprint_signature: signatureData.signature, // Layer 6: Signature for replay protection
-                    fingerprint_timestamp: signatureData.timestamp // Layer 6: Timestamp for signature validation
+                    fingerprint_timestamp: signatureData.timestamp, // Layer 6: Timestamp for signature validation
+                    session_token: signatureData.sessionToken // Layer 6: Session token (replaces the signature)
                 })
             });
 
+            if (response.status === 401) invalidateSessionToken();
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
             const data = await response.json();
@@ -625,7 +666,8 @@ async function handleSendMessage() {
             session_id: getSessionId(),
             device_fingerprint: deviceFingerprint,
             fingerprint_signature: signatureData.signature,
-            fingerprint_timestamp: signatureData.timestamp
+            fingerprint_timestamp: signatureData.timestamp,
+            session_token: signatureData.sessionToken
             // BOOKING STATE REMOVED - Now using cart-based checkout
         };
 
@@ -637,6 +679,7 @@ async function handleSendMessage() {
             body: JSON.stringify(requestPayload)
         });
 
+        if (response.status === 401) invalidateSessionToken();
         if (!response.ok) {
             // ✅ CRITICAL: Log the actual error response before throwing
             const errorText = await response.text();